@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import pyarrow as pa
+
+from ingest_cache import CACHE_VERSION
+
+# 共享数据文件目录与容量上限（可通过环境变量覆盖）
+ARROW_STORE_DIR = os.environ.get(
+    "SALES_DASHBOARD_ARROW_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".arrow_store")
+)
+ARROW_BUDGET_BYTES = int(os.environ.get("SALES_DASHBOARD_ARROW_BUDGET_MB", "4096")) * 1024 * 1024
+
+# 数据文件格式变化时递增，使旧文件自动失效
+ARROW_FORMAT_VERSION = 1
+
+# 替换后的旧数据文件保留多久再删除（秒）：期间可能有进程刚读到旧指针、还没有打开文件
+ARROW_SWAP_GRACE_SECONDS = 60
+# 超过该时间仍未完成的临时文件视为写入进程已退出（秒）
+ARROW_TMP_MAX_AGE_SECONDS = 3600
+
+POINTER_FILE = 'current.json'
+DATA_SUFFIX = '.arrow'
+
+# 随数据一起保存、读取时恢复的attrs（只保存可以写入JSON的取值，分区布局供下一版本复用未变化的分区）
+SAVED_ATTRS = ['dataset_key', 'dataset_rows', 'memory_before', 'memory_after', 'dataset_root', 'dataset_layout']
+
+
+def dataset_slot(store_root):
+    """按月数据集在共享存储中的名称（不同的数据集目录互不影响）"""
+    return "dataset-" + hashlib.sha256(os.path.abspath(store_root).encode()).hexdigest()[:16]
+
+
+class ArrowStore:
+    """进程间共享的数据集文件：每个数据集一份不压缩的Arrow IPC（Feather v2）文件，各进程以内存映射方式读取
+
+    同一台机器上的多个服务进程读取同一文件时共享操作系统的页缓存，新启动的进程无需解析Excel，
+    数值列直接引用映射的内存。每个数据集名称一个目录，其中的指针文件记录当前数据文件及其版本：
+    发布新版本时先完整写入新的数据文件，再原子替换指针文件，读取方要么读到旧版本、要么读到新版本；
+    指针中的版本、文件格式或预处理版本与预期不符，或数据文件大小不一致时视为过期。
+    旧数据文件在替换一段时间后删除，已经映射它的进程仍可继续读取（POSIX下删除后内容保留到映射关闭）。
+    """
+
+    def __init__(self, root=ARROW_STORE_DIR):
+        self.root = root
+
+    def _slot(self, name):
+        return os.path.join(self.root, name)
+
+    def _read_pointer(self, name):
+        try:
+            with open(os.path.join(self._slot(name), POINTER_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _compatible(pointer):
+        return pointer.get('format') == ARROW_FORMAT_VERSION and pointer.get('preprocess') == CACHE_VERSION
+
+    def _check(self, name, pointer, version):
+        if not self._compatible(pointer) or pointer.get('version') != version:
+            return False
+        try:
+            return os.path.getsize(os.path.join(self._slot(name), pointer['file'])) == pointer['bytes']
+        except (OSError, KeyError):
+            return False
+
+    def load(self, name, version):
+        """以内存映射方式读取指定版本的数据，文件不存在或已过期时返回None
+
+        数值和日期列直接引用映射的内存（只读），分类列只复制编码；返回的数据不能原地修改。
+        """
+        # 读到指针后、打开文件前恰好被替换并删除时，重新读取一次指针
+        for _ in range(2):
+            pointer = self._read_pointer(name)
+            if pointer is None or not self._check(name, pointer, version):
+                return None
+            try:
+                source = pa.memory_map(os.path.join(self._slot(name), pointer['file']), 'r')
+                table = pa.ipc.open_file(source).read_all()
+            except FileNotFoundError:
+                continue
+            except (OSError, pa.ArrowInvalid):
+                return None
+            df = table.to_pandas(split_blocks=True)
+            df.attrs.update(pointer.get('attrs', {}))
+            self._touch(name)
+            return df
+        return None
+
+    def publish(self, name, version, df):
+        """写入新版本的数据文件并原子替换指针，返回数据文件路径"""
+        slot = self._slot(name)
+        os.makedirs(slot, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+
+        # 数据文件名唯一，不会覆盖其他进程正在读取的文件
+        file_name = f"{uuid.uuid4().hex}{DATA_SUFFIX}"
+        path = os.path.join(slot, file_name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        except Exception:
+            _remove(tmp_path)
+            raise
+
+        pointer = {
+            'version': version,
+            'file': file_name,
+            'bytes': os.path.getsize(path),
+            'rows': table.num_rows,
+            'format': ARROW_FORMAT_VERSION,
+            'preprocess': CACHE_VERSION,
+            'written_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'attrs': {key: _json_scalar(df.attrs[key]) for key in SAVED_ATTRS if key in df.attrs},
+        }
+        pointer_path = os.path.join(slot, POINTER_FILE)
+        tmp_pointer = f"{pointer_path}.{os.getpid()}.tmp"
+        with open(tmp_pointer, 'w', encoding='utf-8') as f:
+            json.dump(pointer, f, ensure_ascii=False, indent=2)
+        # 先写完数据文件再替换指针，读取方不会看到写了一半的数据
+        os.replace(tmp_pointer, pointer_path)
+
+        self._cleanup(name, keep=file_name)
+        self.evict()
+        return path
+
+    def _cleanup(self, name, keep):
+        """删除已被替换的旧数据文件和遗留的临时文件"""
+        slot = self._slot(name)
+        now = time.time()
+        for entry in os.scandir(slot):
+            if entry.name in (keep, POINTER_FILE):
+                continue
+            try:
+                age = now - entry.stat().st_mtime
+            except OSError:
+                continue
+            if entry.name.endswith('.tmp'):
+                if age > ARROW_TMP_MAX_AGE_SECONDS:
+                    _remove(entry.path)
+            elif entry.name.endswith(DATA_SUFFIX) and age > ARROW_SWAP_GRACE_SECONDS:
+                _remove(entry.path)
+
+    def _touch(self, name):
+        # 更新指针文件的访问时间，用于按最近使用淘汰
+        now = time.time()
+        try:
+            os.utime(os.path.join(self._slot(name), POINTER_FILE), (now, now))
+        except OSError:
+            pass
+
+    def evict(self, budget_bytes=None):
+        """按最近使用时间删除整个数据集目录，直到总大小不超过预算（已映射的进程不受影响）"""
+        budget_bytes = ARROW_BUDGET_BYTES if budget_bytes is None else budget_bytes
+        if not os.path.isdir(self.root):
+            return
+        slots = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            try:
+                used = os.stat(os.path.join(entry.path, POINTER_FILE)).st_mtime
+                size = sum(item.stat().st_size for item in os.scandir(entry.path))
+            except OSError:
+                continue
+            slots.append((used, size, entry.path))
+
+        total = sum(size for _, size, _ in slots)
+        # 最近使用的数据集始终保留
+        for _, size, path in sorted(slots)[:-1]:
+            if total <= budget_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def _json_scalar(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
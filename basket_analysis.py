@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def build_incidence(df, basket_col='客户简称', item_col='产品代码', value_col='销售额'):
+    """构建 客户×产品 稀疏购买矩阵（销售额合计大于0记为1）
+
+    返回 (CSR矩阵, 客户索引, 产品索引)，索引按名称排序，与groupby().unstack()的行列顺序一致。
+    basket_col 为列表时（如 客户×月份）按多列组合成购物篮，只包含有购买记录的组合。
+    """
+    basket_cols = basket_col if isinstance(basket_col, list) else [basket_col]
+    totals = df.groupby(basket_cols + [item_col], observed=True)[value_col].sum()
+    totals = totals[totals > 0]
+
+    if len(basket_cols) == 1:
+        baskets = pd.Index(sorted(df[basket_col].dropna().unique()))
+        basket_keys = totals.index.get_level_values(0)
+    else:
+        basket_keys = totals.index.droplevel(-1)
+        baskets = basket_keys.unique().sort_values()
+    items = pd.Index(sorted(df[item_col].dropna().unique()))
+
+    rows = baskets.get_indexer(basket_keys)
+    cols = items.get_indexer(totals.index.get_level_values(-1))
+    data = np.ones(len(totals), dtype=np.int32)
+
+    incidence = sparse.csr_matrix((data, (rows, cols)), shape=(len(baskets), len(items)), dtype=np.int32)
+    return incidence, baskets, items
+
+
+def co_occurrence_matrix(incidence):
+    """计算产品共现次数矩阵 Bᵀ·B，对角线（产品与自身）置0"""
+    co = (incidence.T @ incidence).tocsr()
+    co = (co - sparse.diags(co.diagonal(), dtype=co.dtype)).tocsr()
+    co.eliminate_zeros()
+    return co
+
+
+class CoOccurrence:
+    """稀疏共现矩阵及其按需取值的辅助方法"""
+
+    def __init__(self, df, basket_col='客户简称', item_col='产品代码', value_col='销售额'):
+        self.incidence, self.baskets, self.items = build_incidence(df, basket_col, item_col, value_col)
+        self.matrix = co_occurrence_matrix(self.incidence)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    @property
+    def n_items(self):
+        return len(self.items)
+
+    def row(self, item):
+        """某个产品与所有产品的共现次数"""
+        pos = self.items.get_loc(item)
+        values = self.matrix.getrow(pos).toarray().ravel()
+        return pd.Series(values, index=self.items, name=item)
+
+    def top(self, item, k=5):
+        """与某个产品共现次数最多的前k个产品"""
+        return self.row(item).sort_values(ascending=False).head(k)
+
+    def dense(self, items=None):
+        """转为稠密DataFrame；只在需要展示时对选定产品调用"""
+        if items is None:
+            return pd.DataFrame(self.matrix.toarray(), index=self.items, columns=self.items)
+        pos = self.items.get_indexer(items)
+        block = self.matrix[pos][:, pos].toarray()
+        return pd.DataFrame(block, index=pd.Index(items), columns=pd.Index(items))
+
+    def pairs(self):
+        """非零共现对的长表（每对产品只列一次）"""
+        upper = sparse.triu(self.matrix, k=1).tocoo()
+        return pd.DataFrame({
+            '产品A': self.items[upper.row],
+            '产品B': self.items[upper.col],
+            '共现次数': upper.data
+        }).sort_values('共现次数', ascending=False, ignore_index=True)
+
+    def items_per_basket(self):
+        """每个客户购买的不同产品数"""
+        return pd.Series(np.asarray(self.incidence.sum(axis=1)).ravel(), index=self.baskets)
+
+    def baskets_with_any(self, items):
+        """购买了给定产品中任意一个的客户数"""
+        pos = self.items.get_indexer([item for item in items if item in self.items])
+        if len(pos) == 0:
+            return 0
+        return int((np.asarray(self.incidence[:, pos].sum(axis=1)).ravel() > 0).sum())
+
+
+def _frequent_pairs(binary, min_count):
+    """频繁二项集（局部列号 i<j）及其同时出现的购物篮数"""
+    co = (binary.T @ binary).tocoo()
+    keep = (co.row < co.col) & (co.data >= min_count)
+    return co.row[keep], co.col[keep], co.data[keep]
+
+
+def association_rules(incidence, items, min_support=0.01, min_confidence=0.2, max_len=3, focus_items=None):
+    """在 购物篮×产品 购买矩阵上挖掘关联规则（后项为单个产品），返回支持度、置信度和提升度
+
+    先按最小支持度筛掉低频产品；二项集由稀疏矩阵乘积 Bᵀ·B 一次算出。三项集按纵向方式计数：
+    对每个锚定产品只取包含它的购物篮，再在这些购物篮上做一次 Bᵀ·B，得到与它同时出现的所有产品对。
+    指定 focus_items 时只挖掘包含其中产品的项集（用于只关心新品相关规则的场景），候选数量大幅减少。
+    """
+    binary = (incidence > 0).astype(np.int32).tocsc()
+    n_baskets = binary.shape[0]
+    columns = ['前项', '后项', '同时购买数', '支持度', '置信度', '提升度']
+    if n_baskets == 0:
+        return pd.DataFrame(columns=columns)
+
+    min_count = max(int(np.ceil(min_support * n_baskets)), 1)
+    item_counts = np.asarray(binary.sum(axis=0)).ravel()
+    frequent = np.flatnonzero(item_counts >= min_count)
+    binary = binary[:, frequent].tocsc()
+    labels = np.asarray(items)[frequent]
+    counts = item_counts[frequent]
+    n_frequent = len(frequent)
+
+    first, second, pair_counts = _frequent_pairs(binary, min_count)
+    pair_lookup = pd.Series(pair_counts, index=first.astype(np.int64) * n_frequent + second)
+    # 与每个产品构成频繁二项集的产品（三项集的其余两个产品必须都在其中）
+    neighbor_pairs = pd.DataFrame({'item': np.concatenate([first, second]),
+                                   'neighbor': np.concatenate([second, first])})
+    neighbors = neighbor_pairs.groupby('item')['neighbor'].apply(np.sort)
+    if focus_items is None:
+        anchors = np.unique(first)
+    else:
+        anchors = np.flatnonzero(np.isin(labels, list(focus_items)))
+        focus_pair = np.isin(first, anchors) | np.isin(second, anchors)
+        first, second, pair_counts = first[focus_pair], second[focus_pair], pair_counts[focus_pair]
+    antecedents = [first[:, None], second[:, None]]
+    consequents = [second, first]
+    together = [pair_counts, pair_counts]
+    antecedent_counts = [counts[first], counts[second]]
+
+    if max_len >= 3 and len(pair_lookup):
+        by_basket = binary.tocsr()
+        triples = []
+        for anchor in anchors:
+            candidates = neighbors.get(anchor)
+            if candidates is None or len(candidates) < 2:
+                continue
+            # 全量挖掘时锚定产品为三项集中编号最小的产品，避免重复计数
+            if focus_items is None:
+                candidates = candidates[candidates > anchor]
+            rows = binary.indices[binary.indptr[anchor]:binary.indptr[anchor + 1]]
+            b, c, triple_counts = _frequent_pairs(by_basket[rows][:, candidates], min_count)
+            if len(b):
+                triples.append(np.column_stack([np.full(len(b), anchor), candidates[b], candidates[c], triple_counts]))
+        if triples:
+            triples = np.vstack(triples).astype(np.int64)
+            triples[:, :3].sort(axis=1)
+            # 含多个锚定产品的三项集会被重复计数，按组合编码去重
+            triple_keys = (triples[:, 0] * n_frequent + triples[:, 1]) * n_frequent + triples[:, 2]
+            triples = triples[np.unique(triple_keys, return_index=True)[1]]
+            for x, y, z in [(0, 1, 2), (0, 2, 1), (1, 2, 0)]:
+                antecedents.append(triples[:, [x, y]])
+                consequents.append(triples[:, z])
+                together.append(triples[:, 3])
+                antecedent_counts.append(
+                    pair_lookup.reindex(triples[:, x] * n_frequent + triples[:, y]).to_numpy())
+
+    rule_parts = []
+    for antecedent, consequent, both, base in zip(antecedents, consequents, together, antecedent_counts):
+        confidence = both / base
+        keep = confidence >= min_confidence
+        if not keep.any():
+            continue
+        rule_parts.append(pd.DataFrame({
+            '前项': list(zip(*labels[antecedent[keep]].T)),
+            '后项': labels[consequent[keep]],
+            '同时购买数': both[keep],
+            '支持度': both[keep] / n_baskets,
+            '置信度': confidence[keep],
+            '提升度': confidence[keep] / (counts[consequent[keep]] / n_baskets),
+        }))
+    if not rule_parts:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(rule_parts, ignore_index=True).sort_values('提升度', ascending=False, ignore_index=True)
@@ -0,0 +1,197 @@
+"""批量生成报告：按区域、按申请人分别生成Excel分析报告，无需启动Streamlit
+
+用法:
+  python batch_reports.py 销售数据.xlsx [更多文件...] -o reports/
+  python batch_reports.py --dataset -o reports/          # 使用按月数据集
+  可选参数: --by 所属区域 申请人  --workers 4  --streaming
+
+数据只加载和预处理一次，写成快照文件后由各工作进程各读取一次；
+任务只传递筛选维度和取值，不会为每份报告重新序列化整个数据表。
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import ingest_cache
+from data_prep import preprocess, add_product_attributes, concat_frames, NEW_PRODUCTS
+from dataset_store import DatasetStore, DATASET_DIR
+from excel_stream import read_excel_streaming
+from filter_engine import FilterEngine
+from report_export import write_excel_report
+
+# 默认生成报告的维度
+REPORT_DIMENSIONS = ['所属区域', '申请人']
+
+# 工作进程内的数据快照和筛选索引（由_init_worker加载）
+_source = None
+_engine = None
+
+
+def load_workbooks(paths, streaming=False):
+    """读取并预处理Excel文件（与仪表盘共用摄取缓存），多个文件合并为一个数据表"""
+    frames = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            raw_bytes = f.read()
+        cache_key = ingest_cache.content_hash(raw_bytes)
+        df = ingest_cache.load_cached(cache_key)
+        if df is None:
+            if streaming and not path.lower().endswith('.xls'):
+                df = read_excel_streaming(path)
+            else:
+                df = pd.read_excel(path)
+            df = preprocess(df, on_warning=lambda message: print(message, file=sys.stderr))
+            ingest_cache.store(cache_key, df)
+        frames.append(df)
+    return frames[0] if len(frames) == 1 else concat_frames(frames)
+
+
+def prepare_report_frame(df):
+    """与仪表盘导出的数据列保持一致（包装类型等产品属性在预处理时已添加，这里只补旧缓存缺少的列）"""
+    return add_product_attributes(df.copy(deep=False))
+
+
+def safe_file_name(value):
+    name = re.sub(r'[\\/:*?"<>|\s]+', '_', str(value)).strip('._')
+    return name or '未命名'
+
+
+def _init_worker(snapshot_path, dimensions):
+    global _source, _engine
+    _source = pd.read_parquet(snapshot_path)
+    _engine = FilterEngine(_source, list(dimensions) + ['产品代码'])
+
+
+def _generate_report(dimension, value, path):
+    start = time.perf_counter()
+    positions = _engine.indexes[dimension].positions([value])
+    frame = FilterEngine.take(_source, positions)
+    new_products_frame = FilterEngine.take(_source, _engine.restrict(positions, '产品代码', NEW_PRODUCTS))
+    entry = {
+        'dimension': dimension,
+        'value': str(value),
+        'file': None,
+        'rows': len(frame),
+        'new_product_rows': len(new_products_frame),
+    }
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.xlsx"
+        write_excel_report(frame, new_products_frame, tmp_path)
+        os.replace(tmp_path, path)
+        entry.update(status='ok', file=path, bytes=os.path.getsize(path))
+    except Exception as e:
+        entry.update(status='failed', error=str(e))
+    entry['seconds'] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def plan_reports(df, dimensions, output_dir):
+    """每个维度的每个取值生成一份报告；按行数从大到小排列，使进程池负载更均衡"""
+    tasks = []
+    used_paths = set()
+    for dimension in dimensions:
+        counts = df[dimension].value_counts(sort=True)
+        for value, rows in counts.items():
+            if rows == 0:
+                continue
+            # 不同取值清理后文件名相同时加序号区分
+            base = os.path.join(output_dir, safe_file_name(dimension), safe_file_name(value))
+            path, suffix = f"{base}.xlsx", 1
+            while path in used_paths:
+                suffix += 1
+                path = f"{base}_{suffix}.xlsx"
+            used_paths.add(path)
+            tasks.append((rows, dimension, value, path))
+    tasks.sort(key=lambda task: -task[0])
+    return [(dimension, value, path) for _, dimension, value, path in tasks]
+
+
+def write_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, 'manifest.json')
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_batch(df, output_dir, dimensions=REPORT_DIMENSIONS, workers=None, source=None):
+    """生成全部报告并写入清单，返回清单内容"""
+    os.makedirs(output_dir, exist_ok=True)
+    df = prepare_report_frame(df)
+    tasks = plan_reports(df, dimensions, output_dir)
+    started_at = time.strftime('%Y-%m-%d %H:%M:%S')
+    start = time.perf_counter()
+
+    reports = []
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp:
+        # 数据快照只写一次，工作进程启动时各读取一次
+        snapshot_path = os.path.join(tmp, 'source.parquet')
+        df.to_parquet(snapshot_path, index=False)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(snapshot_path, tuple(dimensions))) as pool:
+            futures = [pool.submit(_generate_report, *task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                entry = future.result()
+                reports.append(entry)
+                status = '完成' if entry['status'] == 'ok' else f"失败: {entry['error']}"
+                print(f"[{done}/{len(tasks)}] {entry['dimension']}={entry['value']} "
+                      f"{entry['rows']}行 {entry['seconds']:.1f}s {status}")
+
+    reports.sort(key=lambda entry: (dimensions.index(entry['dimension']), entry['value']))
+    for entry in reports:
+        if entry['file'] is not None:
+            entry['file'] = os.path.relpath(entry['file'], output_dir)
+    manifest = {
+        'generated_at': started_at,
+        'seconds': round(time.perf_counter() - start, 3),
+        'source': source,
+        'rows': len(df),
+        'dimensions': list(dimensions),
+        'reports': reports,
+    }
+    write_manifest(output_dir, manifest)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按区域、申请人批量生成销售数据分析报告")
+    parser.add_argument('files', nargs='*', help="Excel销售数据文件")
+    parser.add_argument('--dataset', nargs='?', const=DATASET_DIR, default=None,
+                        help="使用按月数据集（默认目录与仪表盘相同）")
+    parser.add_argument('-o', '--output-dir', default='reports', help="报告输出目录")
+    parser.add_argument('--by', nargs='+', default=REPORT_DIMENSIONS, choices=REPORT_DIMENSIONS,
+                        help="生成报告的维度")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数（默认CPU核数）")
+    parser.add_argument('--streaming', action='store_true', help="流式读取Excel文件")
+    args = parser.parse_args(argv)
+
+    if args.dataset is not None:
+        store = DatasetStore(args.dataset)
+        if not store.months():
+            parser.error(f"数据集为空: {args.dataset}")
+        df = store.load_frame()
+        source = {'dataset': os.path.abspath(args.dataset), 'version': store.version, 'months': store.months()}
+    elif args.files:
+        df = load_workbooks(args.files, streaming=args.streaming)
+        source = {'files': [os.path.abspath(path) for path in args.files]}
+    else:
+        parser.error("请指定Excel文件或 --dataset")
+
+    manifest = run_batch(df, args.output_dir, dimensions=args.by, workers=args.workers, source=source)
+    failed = [entry for entry in manifest['reports'] if entry['status'] != 'ok']
+    print(f"共生成 {len(manifest['reports']) - len(failed)} 份报告，失败 {len(failed)} 份，"
+          f"耗时 {manifest['seconds']:.1f}s，清单: {os.path.join(args.output_dir, 'manifest.json')}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""共享数据文件：新启动的工作进程从摄取缓存（Parquet）或共享的Arrow文件（内存映射）取得数据集的耗时与内存
+
+每种方式依次启动多个工作进程，分别记录读取耗时和读取后新增的私有内存（RssAnon）与文件映射内存
+（RssFile，多个进程映射同一文件时共享操作系统的页缓存）。内存统计读取 /proc/self/status，仅Linux可用。
+
+用法: python benchmarks/bench_arrow_store.py [行数 ...] [--workers N]
+  行数        默认 100000 1000000
+  --workers   每种方式启动的工作进程数（默认3），模拟同一台机器上的多个服务副本
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from arrow_store import ArrowStore
+from data_prep import preprocess
+from synthetic_data import generate_sales_data
+
+
+def rss_mb():
+    """当前进程的私有内存和文件映射内存（MB），非Linux返回NaN"""
+    usage = {'RssAnon': float('nan'), 'RssFile': float('nan')}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key = line.split(':')[0]
+                if key in usage:
+                    usage[key] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return usage['RssAnon'], usage['RssFile']
+
+
+def worker(kind, path):
+    """工作进程：读取数据集并访问所有数值列，输出耗时和新增内存"""
+    anon_before, file_before = rss_mb()
+    start = time.perf_counter()
+    if kind == 'parquet':
+        df = pd.read_parquet(path)
+    else:
+        df = ArrowStore(path).load('bench', 'bench')
+    df.select_dtypes('number').sum()
+    seconds = time.perf_counter() - start
+    anon_after, file_after = rss_mb()
+    print(json.dumps({'seconds': seconds, 'anon_mb': anon_after - anon_before, 'file_mb': file_after - file_before}))
+
+
+def run_size(n_rows, args, tmp):
+    print(f"行数 {n_rows:,}")
+    df = preprocess(generate_sales_data(n_rows, categorical=n_rows > 1_000_000))
+
+    parquet_path = os.path.join(tmp, f"{n_rows}.parquet")
+    start = time.perf_counter()
+    df.to_parquet(parquet_path, index=False)
+    print(f"  {'写入Parquet':<20}{time.perf_counter() - start:>10.3f}s")
+    arrow_root = os.path.join(tmp, str(n_rows))
+    start = time.perf_counter()
+    ArrowStore(arrow_root).publish('bench', 'bench', df)
+    print(f"  {'发布Arrow文件':<20}{time.perf_counter() - start:>10.3f}s")
+
+    # 内存映射读取的结果应与原数据一致
+    pd.testing.assert_frame_equal(ArrowStore(arrow_root).load('bench', 'bench'), df)
+
+    print(f"  {'方式':<10}{'进程':>6}{'读取耗时':>12}{'私有内存':>12}{'映射内存':>12}")
+    for kind, path in [('parquet', parquet_path), ('arrow', arrow_root)]:
+        for i in range(args.workers):
+            output = subprocess.run([sys.executable, __file__, '--worker', kind, path],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"  {kind:<10}{i + 1:>6}{result['seconds']:>11.3f}s{result['anon_mb']:>10.1f}MB"
+                  f"{result['file_mb']:>10.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sizes', nargs='*', type=int, default=[100_000, 1_000_000])
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--worker', nargs=2, metavar=('KIND', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(*args.worker)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in args.sizes:
+            run_size(n_rows, args, tmp)
+
+
+if __name__ == '__main__':
+    main()
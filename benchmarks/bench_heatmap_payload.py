@@ -0,0 +1,67 @@
+"""热力图渲染方式对比：逐个单元格add_annotation vs trace级别的texttemplate，比较生成耗时和图表JSON大小
+
+用法: python benchmarks/bench_heatmap_payload.py [边长 ...]   默认 15 50 100
+  add_annotation方式在单元格很多时耗时以分钟计，超过 ANNOTATION_MAX_CELLS 个单元格时跳过
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chart_render import set_heatmap_text
+
+ANNOTATION_MAX_CELLS = 1000
+
+
+def make_matrix(size, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.poisson(3, (size, size))
+    values = np.triu(values, 1) + np.triu(values, 1).T
+    names = [f"产品{i}" for i in range(size)]
+    return pd.DataFrame(values, index=names, columns=names)
+
+
+def with_annotations(data):
+    fig = px.imshow(data, color_continuous_scale="Viridis")
+    for i in range(len(data)):
+        for j in range(len(data)):
+            if data.iloc[i, j] > 0:
+                fig.add_annotation(x=j, y=i, text=str(data.iloc[i, j]), showarrow=False,
+                                   font=dict(color="white" if data.iloc[i, j] > data.max().max() / 2 else "black",
+                                             size=12))
+    return fig
+
+
+def with_texttemplate(data):
+    fig = px.imshow(data, color_continuous_scale="Viridis")
+    values = data.to_numpy()
+    set_heatmap_text(fig, np.where(values > 0, values.astype(str), ''))
+    return fig
+
+
+def measure(build, data):
+    start = time.perf_counter()
+    payload = build(data).to_json()
+    return time.perf_counter() - start, len(payload.encode())
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [15, 50, 100]
+    for size in sizes:
+        data = make_matrix(size)
+        print(f"{size}×{size}:")
+        for label, build in [('add_annotation', with_annotations), ('texttemplate', with_texttemplate)]:
+            if build is with_annotations and size * size > ANNOTATION_MAX_CELLS:
+                print(f"  {label:<16}跳过")
+                continue
+            seconds, payload_bytes = measure(build, data)
+            print(f"  {label:<16}{seconds:>8.3f}s  {payload_bytes / 1024:>10.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
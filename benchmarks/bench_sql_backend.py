@@ -0,0 +1,97 @@
+"""查询后端对比：同一份合成数据分别用内存事实表（pandas）和嵌入式数据库（SQLite / DuckDB）查询，比较耗时并校验结果一致
+
+用法: python benchmarks/bench_sql_backend.py [行数 ...] [--engine sqlite|duckdb] [--repeat N]
+  行数       默认 100000 1000000
+  --engine   SQL后端使用的数据库引擎（默认sqlite，duckdb需要单独安装）
+  --repeat   每个查询重复N次取最短耗时（默认3）
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_prep import preprocess, NEW_PRODUCTS
+from olap_cube import SalesCube
+from sql_backend import SqlStore, SQL_ENGINES
+from synthetic_data import generate_sales_data
+
+# 各页面使用的汇总查询（区域销售额、申请人排名、新品占比、月度渗透率等）
+QUERIES = {
+    'kpi': lambda view: (view.total('销售额'), view.nunique('客户简称'), view.nunique('产品代码'), view.mean_price()),
+    'region_sales': lambda view: view.sum_by('所属区域'),
+    'applicant_ranking': lambda view: view.sum_by('申请人'),
+    'new_product_share': lambda view: view.restrict('产品代码', NEW_PRODUCTS).sum_by(['所属区域', '产品代码', '简化产品名称']),
+    'region_customers': lambda view: view.nunique_by('所属区域', '客户简称'),
+    'monthly_penetration': lambda view: view.monthly_nunique('客户简称'),
+    'cumulative_penetration': lambda view: view.cumulative_monthly_nunique('客户简称'),
+}
+
+
+def best_of(func, repeat):
+    best, value = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, value
+
+
+def same_result(a, b):
+    """两个后端的结果是否一致（浮点数允许求和顺序带来的舍入误差）"""
+    if isinstance(a, pd.DataFrame):
+        try:
+            pd.testing.assert_frame_equal(a.reset_index(drop=True), b.reset_index(drop=True),
+                                          check_dtype=False, rtol=1e-9)
+            return True
+        except AssertionError:
+            return False
+    return all(np.isclose(x, y, rtol=1e-9, equal_nan=True) for x, y in zip(a, b))
+
+
+def run_size(n_rows, args, tmp):
+    print(f"行数 {n_rows:,}")
+    df = preprocess(generate_sales_data(n_rows, categorical=n_rows > 1_000_000))
+
+    seconds, cube = best_of(lambda: SalesCube.from_frame(df), 1)
+    print(f"  {'build_cube':<24}{seconds:>10.3f}s")
+    store = SqlStore(os.path.join(tmp, str(n_rows)), args.engine)
+    seconds, _ = best_of(lambda: store.ingest(df, 'bench', 'synthetic'), 1)
+    print(f"  {'sql_ingest':<24}{seconds:>10.3f}s")
+
+    # 典型筛选：两个区域中的前一半申请人
+    regions = df['所属区域'].value_counts().index[:2].tolist()
+    applicants = df[df['所属区域'].isin(regions)]['申请人'].value_counts().index.tolist()
+    selections = [('所属区域', regions), ('申请人', applicants[:max(len(applicants) // 2, 1)])]
+
+    print(f"  {'查询':<24}{'pandas':>10}{args.engine:>10}  一致")
+    for label, (pandas_view, sql_view) in [
+        ('全部', (cube.view(), store.cube().view())),
+        ('筛选', (cube.filter(selections), store.cube().filter(selections))),
+    ]:
+        for name, query in QUERIES.items():
+            pandas_seconds, pandas_result = best_of(lambda: query(pandas_view), args.repeat)
+            sql_seconds, sql_result = best_of(lambda: query(sql_view), args.repeat)
+            print(f"  {label}:{name:<21}{pandas_seconds:>9.3f}s{sql_seconds:>9.3f}s  "
+                  f"{'是' if same_result(pandas_result, sql_result) else '否'}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sizes', nargs='*', type=int, default=[100_000, 1_000_000])
+    parser.add_argument('--engine', default='sqlite', choices=SQL_ENGINES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in args.sizes:
+            run_size(n_rows, args, tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""各处理阶段的耗时基准：用合成数据在不同规模下分别测量加载、预处理、筛选、各页面汇总、客户分群、共现矩阵、关联规则和报告导出
+
+用法: python benchmarks/bench_stages.py [行数 ...] [--output 结果.json] [--compare 基准结果.json]
+  行数                默认 10000 100000 1000000 10000000
+  --repeat N          每个阶段重复N次取最短耗时（默认1）
+  --excel-max-rows N  超过该行数时跳过Excel读取和Excel报告导出（默认100000）
+  --output PATH       结果写入JSON文件，便于不同版本之间对比
+  --compare PATH      与之前保存的结果对比，输出各阶段的耗时比值
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import customer_segments
+import report_export
+from basket_analysis import CoOccurrence, association_rules
+from data_prep import preprocess, decategorize, NEW_PRODUCTS
+from excel_stream import read_excel_streaming
+from filter_engine import FilterEngine
+from olap_cube import SalesCube
+from synthetic_data import generate_sales_data
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+FILTER_COLUMNS = ['所属区域', '客户简称', '产品代码', '申请人']
+
+
+def timed(results, n_rows, stage, func, repeat=1):
+    """执行func并记录最短耗时，返回最后一次的结果"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    rows_out = len(value) if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)) else None
+    results.append({'rows': n_rows, 'stage': stage, 'seconds': round(best, 6), 'rows_out': rows_out})
+    print(f"  {stage:<24}{best:>10.3f}s")
+    return value
+
+
+def write_workbook(path, raw):
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        report_export.write_sheet(workbook, 'Sheet1', raw)
+    finally:
+        workbook.close()
+
+
+def run_size(n_rows, args, results, tmp):
+    print(f"行数 {n_rows:,}")
+    raw = timed(results, n_rows, 'generate', lambda: generate_sales_data(n_rows, categorical=n_rows > 1_000_000))
+
+    # 加载：Excel只在较小规模下测量（超过Excel行数上限且耗时过长）
+    if n_rows <= args.excel_max_rows:
+        path = os.path.join(tmp, f"{n_rows}.xlsx")
+        write_workbook(path, raw)
+        timed(results, n_rows, 'load_excel', lambda: pd.read_excel(path), args.repeat)
+        timed(results, n_rows, 'load_excel_streaming', lambda: read_excel_streaming(path), args.repeat)
+
+    df = timed(results, n_rows, 'preprocess', lambda: preprocess(raw.copy()), args.repeat)
+    cache_path = os.path.join(tmp, f"{n_rows}.parquet")
+    df.to_parquet(cache_path, index=False)
+    timed(results, n_rows, 'load_cached', lambda: pd.read_parquet(cache_path), args.repeat)
+
+    engine = timed(results, n_rows, 'build_filter_index', lambda: FilterEngine(df, FILTER_COLUMNS), args.repeat)
+    cube = timed(results, n_rows, 'build_cube', lambda: SalesCube.from_frame(df), args.repeat)
+
+    # 典型筛选：两个区域中的前一半申请人
+    regions = df['所属区域'].value_counts().index[:2].tolist()
+    applicants = df[df['所属区域'].isin(regions)]['申请人'].value_counts().index.tolist()
+    selections = [('所属区域', regions), ('客户简称', []), ('产品代码', []),
+                  ('申请人', applicants[:max(len(applicants) // 2, 1)])]
+
+    def apply_filter():
+        positions = engine.select(selections)
+        return FilterEngine.take(df, positions), FilterEngine.take(
+            df, engine.restrict(positions, '产品代码', NEW_PRODUCTS))
+
+    filtered_df, filtered_new_df = timed(results, n_rows, 'filter', apply_filter, args.repeat)
+    view = timed(results, n_rows, 'cube_filter', lambda: cube.filter(selections), args.repeat)
+    new_view = view.restrict('产品代码', NEW_PRODUCTS)
+
+    def overview():
+        view.total('销售额'), view.nunique('客户简称'), view.nunique('产品代码'), view.mean_price()
+        view.sum_by('所属区域'), view.sum_by('包装类型'), view.sum_by('申请人')
+        return decategorize(filtered_df[['单价（箱）', '数量（箱）', '销售额', '所属区域', '简化产品名称']])
+
+    def new_products():
+        new_view.total('销售额'), new_view.nunique('客户简称')
+        new_view.sum_by(['产品代码', '简化产品名称']), new_view.sum_by(['所属区域', '简化产品名称'])
+        return new_view.sum_by(['所属区域', '产品代码', '简化产品名称'])
+
+    def product_mix():
+        co_occurrence = CoOccurrence(filtered_df)
+        top_products = view.sum_by('产品代码').sort_values('销售额', ascending=False).head(10)['产品代码'].tolist()
+        top_products += [code for code in NEW_PRODUCTS if code in co_occurrence and code not in top_products]
+        for code in NEW_PRODUCTS:
+            if code in co_occurrence:
+                co_occurrence.top(code, 5)
+        co_occurrence.dense(top_products)
+        return co_occurrence.items_per_basket()
+
+    def penetration():
+        view.nunique_by('所属区域', '客户简称'), new_view.nunique_by('所属区域', '客户简称')
+        new_view.sum_by('所属区域')
+        return view.monthly_nunique('客户简称'), new_view.monthly_nunique('客户简称')
+
+    timed(results, n_rows, 'tab_overview', overview, args.repeat)
+    timed(results, n_rows, 'tab_new_products', new_products, args.repeat)
+    timed(results, n_rows, 'tab_customer_segments',
+          lambda: customer_segments.customer_features(filtered_df, filtered_new_df), args.repeat)
+    segmentation = timed(results, n_rows, 'segmentation_fit',
+                         lambda: customer_segments.CustomerSegmentation.fit(df, NEW_PRODUCTS), args.repeat)
+    timed(results, n_rows, 'segmentation_assign',
+          lambda: segmentation.segment(filtered_df, filtered_new_df, NEW_PRODUCTS), args.repeat)
+    timed(results, n_rows, 'tab_product_mix', product_mix, args.repeat)
+    baskets = CoOccurrence(filtered_df)
+    timed(results, n_rows, 'association_rules', lambda: association_rules(
+        baskets.incidence, baskets.items, 0.01, 0.2, focus_items=NEW_PRODUCTS), args.repeat)
+    timed(results, n_rows, 'tab_penetration', penetration, args.repeat)
+
+    # 导出的数据与仪表盘一致（包装类型等产品属性列在预处理时已添加）
+    export_df = filtered_df
+    if len(export_df) <= args.excel_max_rows:
+        timed(results, n_rows, 'export_excel',
+              lambda: report_export.excel_report_bytes(export_df, filtered_new_df), args.repeat)
+    timed(results, n_rows, 'export_csv', lambda: report_export.csv_bytes(export_df), args.repeat)
+    timed(results, n_rows, 'export_parquet', lambda: report_export.parquet_bytes(export_df), args.repeat)
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(item['rows'], item['stage']): item['seconds'] for item in json.load(f)['results']}
+    print(f"\n与 {baseline_path} 对比（当前/基准，小于1表示变快）")
+    for item in results:
+        before = baseline.get((item['rows'], item['stage']))
+        if before:
+            print(f"  {item['rows']:>10,} {item['stage']:<24}{before:>10.3f}s -> {item['seconds']:.3f}s"
+                  f"  {item['seconds'] / before:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各处理阶段的耗时基准")
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--excel-max-rows', type=int, default=100_000)
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in args.sizes:
+            run_size(n_rows, args, results, tmp)
+
+    report = {'environment': environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""流式读取Excel的内存与耗时验证：生成合成工作簿，分别在子进程中读取并记录峰值内存
+
+用法: python benchmarks/bench_streaming_ingest.py [行数] [--compare]
+  --compare  同时测量 pd.read_excel 的峰值内存（大文件时很慢）
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from excel_stream import read_excel_streaming
+
+COLUMNS = ['客户简称', '所属区域', '发运月份', '申请人', '产品代码', '产品名称', '订单类型', '单价（箱）', '数量（箱）']
+
+
+def write_workbook(path, n_rows, seed=0):
+    """以constant_memory模式逐行写入，生成工作簿本身不占用大量内存；返回数量列的合计用于校验"""
+    rng = np.random.default_rng(seed)
+    regions = ['东', '南', '西', '北', '中']
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    sheet = workbook.add_worksheet()
+    sheet.write_row(0, 0, COLUMNS)
+
+    total_quantity = 0
+    block = 100_000
+    for start in range(0, n_rows, block):
+        size = min(block, n_rows - start)
+        customers = rng.integers(0, 2000, size)
+        products = rng.integers(0, 300, size)
+        months = rng.integers(1, 13, size)
+        prices = np.round(rng.uniform(80, 250, size), 2)
+        quantities = rng.integers(1, 200, size)
+        total_quantity += int(quantities.sum())
+        for i in range(size):
+            sheet.write_row(start + i + 1, 0, [
+                f"客户{customers[i]}",
+                regions[customers[i] % 5],
+                f"2024-{months[i]:02d}",
+                f"申请人{customers[i] % 40}",
+                f"F{products[i]:04d}",
+                f"口力产品{products[i]}68G袋装-中国",
+                '订单-正常产品',
+                float(prices[i]),
+                int(quantities[i]),
+            ])
+    workbook.close()
+    return total_quantity
+
+
+def _measure(reader, path, queue):
+    start = time.perf_counter()
+    df = reader(path)
+    seconds = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((len(df), int(df['数量（箱）'].sum()), seconds, peak_mb))
+
+
+def run_in_child(reader, path):
+    # spawn启动的子进程不继承父进程内存，峰值内存只反映读取本身
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(reader, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    n_rows = int(args[0]) if args else 1_000_000
+    compare = '--compare' in sys.argv
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'synthetic.xlsx')
+        start = time.perf_counter()
+        expected_quantity = write_workbook(path, n_rows)
+        print(f"生成 {n_rows:,} 行工作簿: {time.perf_counter() - start:.1f}s, "
+              f"文件大小 {os.path.getsize(path) / 1024 ** 2:.1f} MB")
+
+        rows, quantity, seconds, peak_mb = run_in_child(read_excel_streaming, path)
+        assert rows == n_rows, f"行数不一致: {rows} != {n_rows}"
+        assert quantity == expected_quantity, "数量合计不一致"
+        print(f"流式读取:      {seconds:.1f}s, 峰值内存 {peak_mb:.0f} MB")
+
+        if compare:
+            rows, quantity, seconds, peak_mb = run_in_child(pd.read_excel, path)
+            assert rows == n_rows and quantity == expected_quantity
+            print(f"pd.read_excel: {seconds:.1f}s, 峰值内存 {peak_mb:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
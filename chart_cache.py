@@ -0,0 +1,83 @@
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+# 图表缓存的内存预算（可通过环境变量覆盖，单位MB）
+CACHE_BUDGET_BYTES = int(float(os.environ.get("SALES_DASHBOARD_CHART_CACHE_MB", "256")) * 1024 ** 2)
+
+
+class ChartCache:
+    """按 (数据集, 筛选条件, 图表) 缓存聚合结果和序列化后的图表
+
+    进程内所有会话共享同一个实例；超出内存预算时按最近最少使用的顺序淘汰。
+    """
+
+    def __init__(self, budget_bytes=CACHE_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, key, value, size):
+        # 单个结果超过预算时不缓存
+        if size > self.budget_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.budget_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def figure(self, key, build):
+        """返回缓存的图表；未命中时调用build()生成，并以JSON形式保存（不同会话之间不共享可变对象）"""
+        payload = self._get(key)
+        if payload is None:
+            payload = build().to_json()
+            self._put(key, payload, len(payload))
+        return pio.from_json(payload)
+
+    def frame(self, key, build):
+        """返回缓存的聚合结果副本；未命中时调用build()计算"""
+        frame = self._get(key)
+        if frame is None:
+            frame = build()
+            self._put(key, frame, int(frame.memory_usage(deep=True).sum()))
+        return frame.copy()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'budget_bytes': self.budget_bytes,
+                'evictions': self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
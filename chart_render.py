@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# 热力图单元格数超过该值时不显示单元格文字，只在悬停时显示数值（可通过环境变量覆盖）
+HEATMAP_MAX_TEXT_CELLS = int(os.environ.get("SALES_DASHBOARD_HEATMAP_TEXT_CELLS", "400"))
+
+# 明细散点图的渲染方式：行数达到对应阈值时自动切换为WebGL或服务端分箱汇总（可通过环境变量覆盖）
+SCATTER_WEBGL_MIN_ROWS = int(os.environ.get("SALES_DASHBOARD_SCATTER_WEBGL_ROWS", "5000"))
+SCATTER_DENSITY_MIN_ROWS = int(os.environ.get("SALES_DASHBOARD_SCATTER_DENSITY_ROWS", "100000"))
+SCATTER_DENSITY_BINS = 40
+
+# 界面上的选项 -> 渲染方式（None表示按行数自动选择）
+SCATTER_MODES = {
+    '自动': None,
+    'SVG散点': 'svg',
+    'WebGL散点': 'webgl',
+    '分箱汇总': 'density',
+}
+
+
+def set_heatmap_text(fig, text, font_size=12, max_text_cells=HEATMAP_MAX_TEXT_CELLS):
+    """在热力图trace上直接设置单元格文字（代替逐个单元格add_annotation）
+
+    文字颜色由plotly按单元格颜色自动取对比色；单元格过多时只保留悬停提示。
+    返回是否显示了单元格文字。
+    """
+    text = np.asarray(text, dtype=object)
+    if text.size > max_text_cells:
+        return False
+    fig.update_traces(text=text, texttemplate='%{text}', textfont=dict(size=font_size))
+    return True
+
+
+def scatter_mode(n_rows, requested=None):
+    """确定散点图的渲染方式：指定了就用指定的，否则按行数选择svg / webgl / density"""
+    if requested:
+        return requested
+    if n_rows >= SCATTER_DENSITY_MIN_ROWS:
+        return 'density'
+    if n_rows >= SCATTER_WEBGL_MIN_ROWS:
+        return 'webgl'
+    return 'svg'
+
+
+def binned_density(frame, x, y, weight, by, bins=SCATTER_DENSITY_BINS):
+    """在服务端把明细点按 x × y 的二维网格分箱（各分组共用同一网格）
+
+    返回每个非空格子一行：格子中心坐标、分组、行数和weight合计，图表只需传输这些格子。
+    """
+    xs = frame[x].to_numpy(dtype=float)
+    ys = frame[y].to_numpy(dtype=float)
+    valid = np.isfinite(xs) & np.isfinite(ys)
+    x_edges = np.histogram_bin_edges(xs[valid], bins)
+    y_edges = np.histogram_bin_edges(ys[valid], bins)
+    # 最右侧的边界值归入最后一个格子（与np.histogram一致）
+    x_bin = np.clip(np.searchsorted(x_edges, xs[valid], side='right') - 1, 0, bins - 1)
+    y_bin = np.clip(np.searchsorted(y_edges, ys[valid], side='right') - 1, 0, bins - 1)
+
+    cells = pd.DataFrame({
+        by: frame[by].to_numpy()[valid],
+        'x_bin': x_bin,
+        'y_bin': y_bin,
+        weight: frame[weight].to_numpy(dtype=float)[valid],
+    })
+    binned = cells.groupby([by, 'x_bin', 'y_bin'], observed=True, sort=False).agg(
+        行数=(weight, 'size'), **{weight: (weight, 'sum')}
+    ).reset_index()
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    binned[x] = x_centers[binned['x_bin'].to_numpy()]
+    binned[y] = y_centers[binned['y_bin'].to_numpy()]
+    return binned[[x, y, by, '行数', weight]]
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+
+from data_prep import decategorize
+
+# RFM聚类使用的客户特征（销售额、购买月数、产品种类数取对数后再标准化）
+RFM_COLUMNS = ['最近购买间隔', '购买月数', '销售额', '产品种类数', '新品占比']
+LOG_COLUMNS = ['购买月数', '销售额', '产品种类数']
+DEFAULT_CLUSTERS = 4
+
+# 名称相同的聚类用差异最大的特征区分：特征 -> (名称, 较大时的描述, 较小时的描述)
+CLUSTER_DESCRIPTORS = {
+    '最近购买间隔': ('最近购买', '较久', '较近'),
+    '购买月数': ('购买月数', '较多', '较少'),
+    '销售额': ('销售额', '较高', '较低'),
+    '产品种类数': ('产品种类', '较多', '较少'),
+    '新品占比': ('新品占比', '较高', '较低'),
+}
+
+
+def customer_features(filtered_df, filtered_new_products_df):
+    """按客户汇总销售额、产品种类数、数量、单价和新品占比，并按新品占比简单分类"""
+    features = filtered_df.groupby('客户简称', observed=True).agg({
+        '销售额': 'sum',  # 总销售额
+        '产品代码': 'nunique',  # 购买的不同产品数量
+        '数量（箱）': 'sum',  # 总购买数量
+        '单价（箱）': 'mean'  # 平均单价
+    }).reset_index().pipe(decategorize)
+
+    if not filtered_new_products_df.empty:
+        # 添加新品购买指标
+        new_products_by_customer = filtered_new_products_df.groupby('客户简称', observed=True)[
+            '销售额'].sum().reset_index().pipe(decategorize)
+        features = features.merge(new_products_by_customer, on='客户简称', how='left',
+                                                    suffixes=('', '_新品'))
+        features['销售额_新品'] = features['销售额_新品'].fillna(0)
+        features['新品占比'] = features['销售额_新品'] / features['销售额'] * 100
+    else:
+        features['销售额_新品'] = 0
+        features['新品占比'] = 0
+
+    # 简单客户分类
+    features['客户类型'] = pd.cut(
+        features['新品占比'],
+        bins=[0, 10, 30, 100],
+        labels=['保守型客户', '平衡型客户', '创新型客户']
+    )
+    return features
+
+
+def rfm_features(df, new_products, reference_month=None):
+    """按客户计算RFM特征：最近购买间隔（月）、购买月数、销售额、产品种类数和新品占比，索引为客户简称
+
+    reference_month 为计算最近购买间隔的基准月份（年*12+月），默认取数据中最晚的发运月份，记录在结果的attrs中。
+    """
+    months = pd.to_datetime(df['发运月份'], errors='coerce')
+    source = pd.DataFrame({
+        '客户简称': df['客户简称'],
+        '月份序号': (months.dt.year * 12 + months.dt.month).to_numpy(),
+        '产品代码': df['产品代码'],
+        '销售额': df['销售额'],
+        '新品销售额': df['销售额'].where(df['产品代码'].isin(new_products), 0),
+    })
+    features = source.groupby('客户简称', observed=True).agg(
+        最近购买月份=('月份序号', 'max'),
+        购买月数=('月份序号', 'nunique'),
+        销售额=('销售额', 'sum'),
+        产品种类数=('产品代码', 'nunique'),
+        新品销售额=('新品销售额', 'sum'),
+    )
+    if reference_month is None:
+        reference_month = features['最近购买月份'].max()
+    features['最近购买间隔'] = reference_month - features['最近购买月份']
+    features['新品占比'] = (features['新品销售额'] / features['销售额'].where(features['销售额'] != 0) * 100).fillna(0)
+    features.index = features.index.astype(object)
+    features = features[RFM_COLUMNS]
+    features.attrs['reference_month'] = reference_month
+    return features
+
+
+def assign_clusters(points, centers):
+    """每个点最近的聚类中心编号（平方欧氏距离）"""
+    distances = (points ** 2).sum(axis=1)[:, None] - 2 * points @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    return distances.argmin(axis=1)
+
+
+def _kmeans_plus_plus(points, n_clusters, rng):
+    """k-means++ 初始化：按到已选中心距离的平方加权抽样"""
+    centers = [points[rng.integers(len(points))]]
+    closest = ((points - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, n_clusters):
+        total = closest.sum()
+        index = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centers.append(points[index])
+        closest = np.minimum(closest, ((points - points[index]) ** 2).sum(axis=1))
+    return np.array(centers, dtype=np.float64)
+
+
+def mini_batch_kmeans(points, n_clusters, batch_size=2048, max_iter=200, tol=1e-4, seed=0):
+    """NumPy实现的mini-batch k-means：每轮随机取一批点，按各中心累计分到的点数做增量平均，返回聚类中心"""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(points))
+    init_sample = points[rng.choice(len(points), min(len(points), 10 * batch_size), replace=False)]
+    centers = _kmeans_plus_plus(init_sample, n_clusters, rng)
+    counts = np.zeros(n_clusters)
+    for _ in range(max_iter):
+        batch = points[rng.integers(0, len(points), min(batch_size, len(points)))]
+        labels = assign_clusters(batch, centers)
+        batch_counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, batch)
+        counts += batch_counts
+        updated = batch_counts > 0
+        previous = centers.copy()
+        centers[updated] += (sums[updated] - batch_counts[updated, None] * centers[updated]) / counts[updated, None]
+        if np.abs(centers - previous).max() < tol:
+            break
+    return centers
+
+
+def _rank_words(high, low, n):
+    """按特征从大到小排列的n个聚类的描述词"""
+    if n == 2:
+        return [high, low]
+    if n == 3:
+        return [high, '居中', low]
+    if n == 4:
+        return ['最' + high[1:], high, low, '最' + low[1:]]
+    return [f"第{rank}" for rank in range(1, n + 1)]
+
+
+class CustomerSegmentation:
+    """在整个数据集上拟合的RFM客户分群
+
+    标准化参数和聚类中心只在拟合时计算一次；筛选条件变化时对筛选后的客户重新计算特征并归入最近的中心，不重新训练。
+    """
+
+    def __init__(self, mean, scale, centers, names, reference_month):
+        self.mean = mean
+        self.scale = scale
+        self.centers = centers
+        self.names = names
+        self.reference_month = reference_month
+
+    @classmethod
+    def fit(cls, df, new_products, n_clusters=DEFAULT_CLUSTERS, seed=0):
+        features = rfm_features(df, new_products)
+        points = cls._log(features)
+        mean = points.mean(axis=0)
+        scale = points.std(axis=0)
+        scale[scale == 0] = 1
+        centers = mini_batch_kmeans((points - mean) / scale, n_clusters, seed=seed)
+        return cls(mean, scale, centers, cls._cluster_names(centers), features.attrs['reference_month'])
+
+    @staticmethod
+    def _log(features):
+        values = features[RFM_COLUMNS].to_numpy(dtype=np.float64, na_value=0)
+        for i, col in enumerate(RFM_COLUMNS):
+            if col in LOG_COLUMNS:
+                values[:, i] = np.log1p(np.clip(values[:, i], 0, None))
+        return values
+
+    @staticmethod
+    def _cluster_names(centers):
+        """按中心在标准化空间中的位置命名：销售额高低、是否近期购买、是否偏好新品
+
+        多个中心得到相同的名称时，按它们之间差异最大的特征排序，分别注明该特征较大或较小。
+        """
+        recency, monetary, new_share = (RFM_COLUMNS.index(col) for col in ['最近购买间隔', '销售额', '新品占比'])
+        bases, notes = [], []
+        for center in centers:
+            bases.append(('高价值' if center[monetary] > 0 else '低价值') + ('活跃' if center[recency] <= 0 else '沉睡') + '客户')
+            notes.append(['新品偏好'] if center[new_share] > 0 else [])
+
+        keys = [(base, tuple(note)) for base, note in zip(bases, notes)]
+        for key in set(keys):
+            members = [i for i, other in enumerate(keys) if other == key]
+            if len(members) < 2:
+                continue
+            spread = centers[members].max(axis=0) - centers[members].min(axis=0)
+            col = RFM_COLUMNS[int(np.argmax(spread))]
+            label, high, low = CLUSTER_DESCRIPTORS[col]
+            order = sorted(members, key=lambda i: -centers[i][RFM_COLUMNS.index(col)])
+            for i, word in zip(order, _rank_words(high, low, len(order))):
+                notes[i].append(label + word)
+
+        return [base + (f"（{'，'.join(note)}）" if note else '') for base, note in zip(bases, notes)]
+
+    def assign(self, features):
+        """把客户特征归入最近的聚类中心，返回以客户简称为索引的分群名称"""
+        points = (self._log(features) - self.mean) / self.scale
+        labels = assign_clusters(points, self.centers) if len(points) else np.empty(0, dtype=int)
+        return pd.Series(np.asarray(self.names, dtype=object)[labels], index=features.index, name='客户类型')
+
+    def segment(self, filtered_df, filtered_new_products_df, new_products):
+        """筛选后数据的客户特征表（与 customer_features 相同的列），客户类型为RFM分群，并附加RFM特征"""
+        features = customer_features(filtered_df, filtered_new_products_df)
+        rfm = rfm_features(filtered_df, new_products, self.reference_month)
+        features['客户类型'] = features['客户简称'].map(self.assign(rfm))
+        features['最近购买间隔'] = features['客户简称'].map(rfm['最近购买间隔'])
+        features['购买月数'] = features['客户简称'].map(rfm['购买月数'])
+        return features
+
@@ -0,0 +1,227 @@
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+# 创建产品代码到简化产品名称的映射函数 (修复版)
+def get_simplified_product_name(product_code, product_name):
+    try:
+        # 从产品名称中提取关键部分
+        if '口力' in product_name:
+            # 提取"口力"之后的产品类型
+            name_parts = product_name.split('口力')[1].split('-')[0].strip()
+            # 进一步简化，只保留主要部分（去掉规格和包装形式）
+            for suffix in ['G分享装袋装', 'G盒装', 'G袋装', 'KG迷你包', 'KG随手包']:
+                name_parts = name_parts.split(suffix)[0]
+
+            # 去掉可能的数字和单位
+            simple_name = re.sub(r'\d+\w*\s*', '', name_parts).strip()
+
+            # 始终包含产品代码以确保唯一性
+            return f"{simple_name} ({product_code})"
+        else:
+            # 如果无法提取，则返回产品代码
+            return product_code
+    except Exception as e:
+        # 出错时返回产品代码
+        return product_code
+
+
+def simplify_product_names(product_codes, product_names):
+    """按不同的(产品代码, 产品名称)组合计算一次简化名称，再按编码映射回每一行"""
+    code_idx, code_uniques = pd.factorize(product_codes, use_na_sentinel=False)
+    name_idx, name_uniques = pd.factorize(product_names, use_na_sentinel=False)
+
+    # 两个编码组合成一个整数键，再次编码得到组合编号
+    pair_key = code_idx.astype(np.int64) * max(len(name_uniques), 1) + name_idx
+    pair_idx, pair_uniques = pd.factorize(pair_key)
+
+    # 每个组合只调用一次原始函数，保证结果完全一致
+    memo = np.empty(len(pair_uniques), dtype=object)
+    for i, key in enumerate(pair_uniques):
+        code_pos, name_pos = divmod(int(key), max(len(name_uniques), 1))
+        memo[i] = get_simplified_product_name(code_uniques[code_pos], name_uniques[name_pos])
+
+    return pd.Series(memo.take(pair_idx), index=product_codes.index, name='简化产品名称')
+
+
+# 包装类型规则：按顺序检查产品名称中的关键字，先匹配到的优先（如"分享装袋装"归为袋装）
+PACKAGING_RULES = [
+    ('袋装', '袋装'),
+    ('盒装', '盒装'),
+    ('随手包', '随手包'),
+    ('迷你包', '迷你包'),
+    ('分享装', '分享装'),
+]
+DEFAULT_PACKAGING = '其他'
+
+# 从产品名称中提取的属性：列名 -> 正则表达式（第一个分组为属性值），如"口力酸小虫250G分享装袋装-中国"
+ATTRIBUTE_PATTERNS = {
+    '规格': r'(\d+(?:\.\d+)?\s*(?:KG|G))',
+    '系列': r'口力(.+?)(?:\d+(?:\.\d+)?\s*(?:KG|G)|-|$)',
+}
+
+# 按单包重量（克）划分的规格档位
+WEIGHT_CLASS_BINS = [0, 100, 500, float('inf')]
+WEIGHT_CLASS_LABELS = ['小规格(<100G)', '中规格(100-500G)', '大规格(≥500G)']
+UNKNOWN_ATTRIBUTE = '未知'
+
+# 由产品名称决定的属性列（预处理时添加）
+PRODUCT_ATTRIBUTE_COLUMNS = ['包装类型', '规格', '规格档位', '系列']
+
+
+def extract_product_attributes(product_names):
+    """按规则从产品名称中提取包装类型、规格、单包克数、规格档位和系列，每个不同的名称一行（索引为产品名称）"""
+    names = pd.Series(pd.unique(np.asarray(product_names, dtype=object)), dtype=object)
+    names = names[names.map(lambda name: isinstance(name, str))].reset_index(drop=True)
+    upper = names.str.upper()
+
+    # 包装类型：按规则顺序取第一个匹配的关键字
+    packaging = np.select([names.str.contains(keyword, regex=False) for keyword, _ in PACKAGING_RULES],
+                          [value for _, value in PACKAGING_RULES], default=DEFAULT_PACKAGING)
+    attributes = pd.DataFrame({'包装类型': packaging}, index=pd.Index(names, name='产品名称'))
+    for col, pattern in ATTRIBUTE_PATTERNS.items():
+        values = upper.str.extract(pattern, expand=False).str.replace(' ', '', regex=False).str.strip()
+        attributes[col] = values.fillna(UNKNOWN_ATTRIBUTE).replace('', UNKNOWN_ATTRIBUTE).to_numpy()
+
+    # 单包克数及规格档位
+    weight = upper.str.extract(r'(\d+(?:\.\d+)?)\s*(KG|G)')
+    grams = pd.to_numeric(weight[0], errors='coerce') * np.where(weight[1] == 'KG', 1000, 1)
+    attributes['单包克数'] = grams.to_numpy()
+    attributes['规格档位'] = pd.cut(grams, bins=WEIGHT_CLASS_BINS, labels=WEIGHT_CLASS_LABELS,
+                                right=False).astype(object).fillna(UNKNOWN_ATTRIBUTE).to_numpy()
+    return attributes
+
+
+def spec_grams(specs):
+    """由提取出的规格（如'250G'、'1.5KG'）换算单包克数，无法识别的为NaN"""
+    weight = pd.Series(specs, dtype=object).str.extract(r'^(\d+(?:\.\d+)?)(KG|G)$')
+    return (pd.to_numeric(weight[0], errors='coerce') * np.where(weight[1] == 'KG', 1000, 1)).to_numpy()
+
+
+def add_product_attributes(df):
+    """添加由产品名称决定的属性列（分类类型），每个不同的产品名称只计算一次；已有这些列时不重复计算"""
+    if all(col in df.columns for col in PRODUCT_ATTRIBUTE_COLUMNS):
+        return df
+    name_idx, names = pd.factorize(df['产品名称'], use_na_sentinel=False)
+    attributes = extract_product_attributes(names).reindex(pd.Index(names, dtype=object))
+    for col in PRODUCT_ATTRIBUTE_COLUMNS:
+        default = DEFAULT_PACKAGING if col == '包装类型' else UNKNOWN_ATTRIBUTE
+        values = attributes[col].fillna(default).to_numpy()
+        categories = pd.Index(pd.unique(values)).sort_values()
+        df[col] = pd.Categorical.from_codes(categories.get_indexer(values)[name_idx], categories)
+    return df
+
+
+# 新品产品代码
+NEW_PRODUCTS = ['F0110C', 'F0183F', 'F01K8A', 'F0183K', 'F0101P']
+
+
+def product_dimension(df):
+    """产品维度表：每个产品代码一行（取该代码首次出现的行），索引为产品代码
+
+    包含产品名称、简化产品名称、从名称中提取的属性（包装类型、规格、规格档位、系列）和是否新品，
+    产品代码到名称等的映射都从这里读取。
+    """
+    # 属性列在预处理时已添加（旧缓存缺少时补上），直接取首次出现的行的取值
+    first_rows = add_product_attributes(df.drop_duplicates('产品代码').copy(deep=False))
+    codes = first_rows['产品代码'].astype(str).to_numpy()
+    attributes = {col: first_rows[col].astype(object).to_numpy() for col in PRODUCT_ATTRIBUTE_COLUMNS}
+    dimension = pd.DataFrame({
+        '产品名称': first_rows['产品名称'].astype(object).to_numpy(),
+        '简化产品名称': first_rows['简化产品名称'].astype(object).to_numpy(),
+        '包装类型': attributes['包装类型'],
+        '规格': attributes['规格'],
+        '单包克数': spec_grams(attributes['规格']),
+        '规格档位': attributes['规格档位'],
+        '系列': attributes['系列'],
+        '是否新品': np.isin(codes, NEW_PRODUCTS),
+    }, index=pd.Index(codes, name='产品代码'))
+    return dimension.sort_index()
+
+
+def append_product_dimension(dimension, df):
+    """在已有的产品维度表中追加df（排在已有数据之后的行）中新出现的产品代码，结果与在合并后的数据上重新构建相同"""
+    added = product_dimension(df)
+    return pd.concat([dimension, added[~added.index.isin(dimension.index)]]).sort_index()
+
+# 需要压缩为分类类型的维度列
+DIMENSION_COLUMNS = ['客户简称', '所属区域', '产品代码', '产品名称', '申请人', '订单类型', '简化产品名称']
+
+
+def compact_dtypes(df):
+    """压缩列类型：维度列转为分类类型，整数列向下转换，并记录压缩前后的内存占用"""
+    memory_before = int(df.memory_usage(deep=True).sum())
+
+    for col in DIMENSION_COLUMNS:
+        if col in df.columns and df[col].dtype == object:
+            try:
+                df[col] = df[col].astype('category')
+            except TypeError:
+                # 混合类型无法排序时保持原样
+                pass
+
+    # 整数列最低只降到int32，避免分组求和时溢出
+    for col in df.select_dtypes(include='integer').columns:
+        downcast = pd.to_numeric(df[col], downcast='integer')
+        if downcast.dtype.itemsize < 4:
+            downcast = downcast.astype(np.int32)
+        df[col] = downcast
+
+    df.attrs['memory_before'] = memory_before
+    df.attrs['memory_after'] = int(df.memory_usage(deep=True).sum())
+    return df
+
+
+def decategorize(frame):
+    """将分类列还原为普通列，用于传给绘图函数的聚合结果"""
+    categorical = {
+        col: frame[col].cat.categories.dtype
+        for col in frame.columns
+        if isinstance(frame[col].dtype, pd.CategoricalDtype)
+    }
+    if not categorical:
+        return frame
+    return frame.astype(categorical)
+
+
+def preprocess(df, on_warning=None):
+    """数据预处理：计算销售额、转换发运月份、添加简化产品名称和产品属性并压缩列类型"""
+    df['销售额'] = df['单价（箱）'] * df['数量（箱）']
+
+    # 确保发运月份是日期类型
+    try:
+        df['发运月份'] = pd.to_datetime(df['发运月份'])
+    except Exception as e:
+        if on_warning is not None:
+            on_warning(f"发运月份转换为日期类型时出错。原因：{str(e)}。将保持原格式。")
+
+    # 添加简化产品名称列
+    df['简化产品名称'] = simplify_product_names(df['产品代码'], df['产品名称'])
+
+    # 添加包装类型、规格、规格档位、系列（按不同产品名称计算一次）
+    add_product_attributes(df)
+
+    # 压缩列类型（维度列转为分类类型、整数列向下转换）
+    return compact_dtypes(df)
+
+
+def concat_frames(frames):
+    """纵向合并多个预处理后的数据块，分类列合并取值集合后仍保持分类类型"""
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return pd.DataFrame()
+
+    columns = {}
+    for col in frames[0].columns:
+        parts = [frame[col] for frame in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            try:
+                columns[col] = pd.Series(union_categoricals(parts, sort_categories=True))
+                continue
+            except TypeError:
+                pass
+        columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+# 没有会话使用的数据集保留多久后释放；会话超过该时间没有访问时也视为已结束（可通过环境变量覆盖，单位秒）
+DATASET_IDLE_SECONDS = float(os.environ.get("SALES_DASHBOARD_DATASET_IDLE_SECONDS", "1800"))
+
+
+def _enable_copy_on_write():
+    # 选项被其他代码关闭时重新开启，浅拷贝视图才能保证不写入共享的数据
+    if not pd.get_option('mode.copy_on_write'):
+        pd.set_option('mode.copy_on_write', True)
+
+
+class _Entry:
+    __slots__ = ('frame', 'sessions', 'last_used', 'nbytes', 'derived', 'building')
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.sessions = {}
+        self.last_used = time.monotonic()
+        self.nbytes = int(frame.memory_usage(deep=True).sum())
+        # 由数据集构建的结构（筛选索引、事实表、草图等）：名称 -> 对象，以及每个名称的构建锁
+        self.derived = {}
+        self.building = {}
+
+
+class DatasetRegistry:
+    """进程内共享的数据集：每个键（内容哈希或数据集版本）只保留一份只读数据，各会话拿到零拷贝视图
+
+    每个会话同一时间引用一个数据集，切换数据集时自动释放之前的引用；没有会话引用且空闲超过
+    idle_seconds 的数据集会被释放，由它构建的结构（见derived）随之一起释放。
+
+    会话得到的是浅拷贝视图，靠pandas的写时复制（mode.copy_on_write）保证会话的修改只复制被修改的部分、
+    不会写入共享的数据。这是进程级的选项：注册表创建时开启，每次交出视图前再确认一次。
+    """
+
+    def __init__(self, idle_seconds=DATASET_IDLE_SECONDS):
+        _enable_copy_on_write()
+        self.idle_seconds = idle_seconds
+        self._entries = {}
+        self._session_keys = {}
+        # 每个键一把加载锁，多个会话同时请求同一数据集时只加载一次
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def _get_or_load(self, key, load):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                try:
+                    entry = _Entry(load())
+                    with self._lock:
+                        self._entries[key] = entry
+                        self.loads += 1
+                finally:
+                    # 加载失败时同样移除加载锁，之后的请求会重新加载
+                    with self._lock:
+                        self._loading.pop(key, None)
+                return entry
+        # 等待期间其他会话已经加载完成
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def acquire(self, session_id, key, load):
+        """返回键对应数据集的视图，未加载时调用load()加载；同时登记该会话对数据集的引用"""
+        self.evict_idle()
+        entry = self._get_or_load(key, load)
+        with self._lock:
+            if self._session_keys.get(session_id) not in (None, key):
+                # 会话切换到其他数据集，释放对之前数据集的引用
+                self._release(session_id)
+            self._session_keys[session_id] = key
+            now = time.monotonic()
+            entry.sessions[session_id] = now
+            entry.last_used = now
+            # 浅拷贝共享底层数据，会话修改时才复制被修改的部分
+            _enable_copy_on_write()
+            return entry.frame.copy(deep=False)
+
+    def derived(self, key, name, build):
+        """数据集的派生结构：每个名称只调用一次build()构建，保存在数据集的条目中，随数据集一起释放
+
+        数据集不在注册表中时（如刚被释放）直接构建，不保存。
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if name in entry.derived:
+                    return entry.derived[name]
+                build_lock = entry.building.setdefault(name, threading.Lock())
+        if entry is None:
+            return build()
+        with build_lock:
+            with self._lock:
+                if name in entry.derived:
+                    return entry.derived[name]
+            try:
+                value = build()
+                with self._lock:
+                    entry.derived[name] = value
+            finally:
+                with self._lock:
+                    entry.building.pop(name, None)
+        return value
+
+    def latest(self, match, name=None):
+        """数据满足match(frame)的数据集中最近使用的一个（给出name时只考虑已构建该结构的），返回(数据, 该结构)，没有时返回None"""
+        with self._lock:
+            candidates = [entry for entry in self._entries.values()
+                          if (name is None or name in entry.derived) and match(entry.frame)]
+            if not candidates:
+                return None
+            entry = max(candidates, key=lambda candidate: candidate.last_used)
+            return entry.frame, entry.derived.get(name)
+
+    def release(self, session_id):
+        """会话不再引用任何数据集"""
+        with self._lock:
+            self._release(session_id)
+
+    def _release(self, session_id):
+        key = self._session_keys.pop(session_id, None)
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.sessions.pop(session_id, None)
+            entry.last_used = time.monotonic()
+
+    def evict_idle(self, now=None):
+        """释放超时会话的引用，以及没有会话引用且空闲超时的数据集，返回释放的数据集数量"""
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                for session_id, last_seen in list(entry.sessions.items()):
+                    if now - last_seen > self.idle_seconds:
+                        del entry.sessions[session_id]
+                        if self._session_keys.get(session_id) == key:
+                            del self._session_keys[session_id]
+                if not entry.sessions and now - entry.last_used > self.idle_seconds:
+                    del self._entries[key]
+                    evicted += 1
+            self.evictions += evicted
+        return evicted
+
+    def refcount(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return len(entry.sessions) if entry is not None else 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'datasets': len(self._entries),
+                'sessions': sum(len(entry.sessions) for entry in self._entries.values()),
+                'bytes': sum(entry.nbytes for entry in self._entries.values()),
+                'loads': self.loads,
+                'hits': self.hits,
+                'evictions': self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._session_keys.clear()
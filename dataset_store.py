@@ -0,0 +1,214 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # Windows没有fcntl，改用msvcrt锁定锁文件
+    fcntl = None
+    import msvcrt
+
+from data_prep import add_product_attributes, concat_frames
+from olap_cube import build_fact
+
+# 数据集存储目录（可通过环境变量覆盖）
+DATASET_DIR = os.environ.get(
+    "SALES_DASHBOARD_DATASET_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".dataset_store")
+)
+
+# 发运月份缺失的行单独存为一个分区
+UNKNOWN_MONTH = '未知月份'
+
+# 修改数据集时锁定的文件（位于数据集目录中，清空数据集时保留）
+LOCK_FILE = '.lock'
+
+
+def partition_spans(layout):
+    """分区布局中每个分区 (月份, 来源文件哈希) -> 在合并结果中的行范围"""
+    spans, start = {}, 0
+    for month, source_hash, rows in layout:
+        spans[(month, source_hash)] = (start, start + rows)
+        start += rows
+    return spans
+
+
+def common_prefix(previous_layout, layout):
+    """两个版本的分区布局开头相同的部分：返回(行数, 分区数)"""
+    rows = count = 0
+    for old, new in zip(previous_layout, layout):
+        if old != new:
+            break
+        rows += new[2]
+        count += 1
+    return rows, count
+
+
+def month_period(month):
+    """分区月份对应的Period，发运月份缺失的分区为None"""
+    return None if month == UNKNOWN_MONTH else pd.Period(month, freq='M')
+
+
+class DatasetStore:
+    """按发运月份分区的本地数据集：每个月一份明细文件和一份预聚合事实表
+
+    新文件只解析一次并按月追加；重新上传某个月的数据会替换该月分区，而不是重复追加。
+    """
+
+    def __init__(self, root=DATASET_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'partitions': {}}
+
+    def _write_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """修改分区和清单期间持有的锁（对进程内的其他线程和其他服务进程都有效），并在锁内重新读取清单
+
+        多个会话同时导入时依次执行，每次都在最新的清单上修改，不会丢失其他会话写入的月份。
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, LOCK_FILE), 'a+b') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                self.manifest = self._read_manifest()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _path(self, kind, month):
+        return os.path.join(self.root, kind, f"{month}.parquet")
+
+    @property
+    def partitions(self):
+        return self.manifest['partitions']
+
+    @property
+    def version(self):
+        """数据集版本：由各分区及其来源文件决定，任何分区变化都会得到新的版本"""
+        digest = hashlib.sha256()
+        for month in sorted(self.partitions):
+            digest.update(f"{month}:{self.partitions[month]['source_hash']};".encode())
+        return digest.hexdigest()
+
+    def months(self):
+        return sorted(self.partitions)
+
+    def has_source(self, source_hash):
+        """文件是否已导入且其涉及的各月份分区仍来自该文件（其中某个月份之后被其他文件替换时需要重新导入）"""
+        months = self.manifest.get('sources', {}).get(source_hash)
+        if months is None:
+            # 旧版本的清单没有记录文件涉及的月份
+            return any(info['source_hash'] == source_hash for info in self.partitions.values())
+        return all(self.partitions.get(month, {}).get('source_hash') == source_hash for month in months)
+
+    def ingest(self, df, source_hash, source_name):
+        """将一个预处理后的文件按月写入分区，返回涉及的月份"""
+        if not pd.api.types.is_datetime64_any_dtype(df['发运月份']):
+            raise ValueError("发运月份无法识别为日期，不能按月分区")
+
+        labels = df['发运月份'].dt.strftime('%Y-%m').fillna(UNKNOWN_MONTH)
+        months = []
+        with self._locked():
+            for month, part in df.groupby(labels, sort=True):
+                part = part.reset_index(drop=True)
+                for col in part.columns:
+                    if isinstance(part[col].dtype, pd.CategoricalDtype):
+                        part[col] = part[col].cat.remove_unused_categories()
+                self._write_parquet(part, self._path('rows', month))
+                # 只重新计算该月分区的聚合结果
+                self._write_parquet(build_fact(part), self._path('cube', month))
+                self.partitions[month] = {
+                    'source_hash': source_hash,
+                    'source_name': source_name,
+                    'rows': len(part),
+                    'ingested_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                }
+                months.append(month)
+
+            # 记录文件涉及的月份，不再拥有任何分区的文件不再保留记录
+            sources = self.manifest.setdefault('sources', {})
+            sources[source_hash] = months
+            for source, source_months in list(sources.items()):
+                if not any(self.partitions.get(month, {}).get('source_hash') == source for month in source_months):
+                    del sources[source]
+            self._write_manifest()
+            return months
+
+    def _write_parquet(self, frame, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _load_partitions(self, kind, previous=None):
+        """按月份顺序合并某类分区；previous为之前版本的合并结果时，来源文件未变的分区直接从中截取，只读取新增或替换的分区"""
+        spans = partition_spans(previous.attrs.get('dataset_layout', [])) if previous is not None else {}
+        frames, layout, reused = [], [], False
+        for month in self.months():
+            source_hash = self.partitions[month]['source_hash']
+            span = spans.pop((month, source_hash), None)
+            if span is not None:
+                frame = previous.iloc[span[0]:span[1]]
+                reused = True
+            else:
+                # 旧版本写入的分区没有产品属性列，读取时补上
+                frame = add_product_attributes(pd.read_parquet(self._path(kind, month)))
+            frames.append(frame)
+            layout.append([month, source_hash, len(frame)])
+
+        result = concat_frames(frames)
+        if reused and spans:
+            # 之前版本的部分分区被替换：去掉只在被替换分区中出现的分类取值，与重新读取的结果一致
+            for col in result.columns:
+                if isinstance(result[col].dtype, pd.CategoricalDtype):
+                    result[col] = result[col].cat.remove_unused_categories()
+        result.attrs['dataset_root'] = self.root
+        result.attrs['dataset_layout'] = layout
+        return result
+
+    def load_frame(self, previous=None):
+        """读取全部分区的明细数据
+
+        previous为同一数据集之前版本的读取结果时在其基础上构建：导入新的月份只读取并解析该月分区，其余分区直接从previous中复制。
+        """
+        return self._load_partitions('rows', previous)
+
+    def load_fact(self, previous=None):
+        """合并各分区的事实表（分区按月份互不重叠，直接拼接即为整体事实表），previous的用法与load_frame相同"""
+        return self._load_partitions('cube', previous)
+
+    def clear(self):
+        """删除全部分区（数据集目录由所有会话和服务进程共享，界面上需要确认后才调用）"""
+        with self._locked():
+            for kind in ('rows', 'cube'):
+                shutil.rmtree(os.path.join(self.root, kind), ignore_errors=True)
+            self.manifest = {'partitions': {}}
+            self._write_manifest()
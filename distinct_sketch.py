@@ -0,0 +1,177 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# HyperLogLog寄存器数为 2**HLL_PRECISION，相对标准误差约为 1.04/sqrt(寄存器数)
+HLL_PRECISION = 12
+
+# 发运月份无法识别时的月份序号
+NO_MONTH = np.iinfo(np.int64).min
+
+# 数据行数达到该值时，渗透率页面默认使用草图估计去重客户数（可通过环境变量覆盖）
+SKETCH_DEFAULT_MIN_ROWS = int(os.environ.get("SALES_DASHBOARD_SKETCH_ROWS", "1000000"))
+
+
+def hll_standard_error(precision=HLL_PRECISION):
+    """HyperLogLog估计值的相对标准误差"""
+    return 1.04 / np.sqrt(1 << precision)
+
+
+def _leading_zeros(values):
+    """uint64数组每个元素的前导零个数（0记为64）"""
+    values = values.astype(np.uint64, copy=True)
+    zeros = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        # 高shift位全为0时左移并累加
+        mask = values < np.uint64(1 << (64 - shift))
+        zeros += mask * shift
+        values[mask] <<= np.uint64(shift)
+    zeros += values == 0
+    return zeros
+
+
+def hash_positions(values, precision=HLL_PRECISION):
+    """每个取值对应的寄存器编号和秩（哈希值去掉前precision位后的前导零个数+1）"""
+    hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+    register = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes << np.uint64(precision)
+    rank = np.minimum(_leading_zeros(rest) + 1, 64 - precision + 1).astype(np.uint8)
+    return register, rank
+
+
+def hll_estimate(registers, precision=HLL_PRECISION):
+    """由寄存器（最后一维）估计去重数量，基数较小时使用线性计数修正"""
+    m = 1 << precision
+    alpha = 0.7213 / (1 + 1.079 / m)
+    registers = np.asarray(registers, dtype=np.float64)
+    raw = alpha * m * m / np.power(2.0, -registers).sum(axis=-1)
+    empty = (registers == 0).sum(axis=-1)
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(empty, 1))
+    return np.where((raw <= 2.5 * m) & (empty > 0), linear, raw)
+
+
+class PenetrationSketches:
+    """按 区域×月份×是否新品 预先计算的客户去重计数草图（HyperLogLog）
+
+    任意区域组合、月份范围（包括累计）的去重客户数都可以通过合并对应单元的寄存器（逐位取最大值）得到，
+    不需要再扫描明细。
+    """
+
+    def __init__(self, cells, registers, precision=HLL_PRECISION):
+        self.cells = cells
+        self.registers = registers
+        self.precision = precision
+
+    @classmethod
+    def from_fact(cls, fact, new_products, col='客户简称', precision=HLL_PRECISION):
+        """由事实表（或原始数据）构建，发运月份无法识别的行只计入不分月份的统计
+
+        已有布尔列“新品”时直接使用（如数据库中已判断过是否新品），否则按产品代码判断。
+        """
+        # 月份用Period的序号表示（无法识别的为NO_MONTH），避免逐个生成Period对象
+        month = pd.to_datetime(fact['发运月份'], errors='coerce')
+        month_ordinal = ((month.dt.year - 1970) * 12 + month.dt.month - 1).fillna(NO_MONTH).astype(np.int64)
+        cell_frame = pd.DataFrame({
+            '所属区域': fact['所属区域'].to_numpy(),
+            '月份': month_ordinal.to_numpy(),
+            '新品': (fact['新品'].to_numpy(dtype=bool) if '新品' in fact.columns
+                     else fact['产品代码'].isin(new_products).to_numpy()),
+        })
+        grouped = cell_frame.groupby(list(cell_frame.columns), dropna=False, sort=False, observed=True)
+        cell_idx = grouped.ngroup().to_numpy()
+        cells = grouped.size().reset_index()[list(cell_frame.columns)]
+        cells['所属区域'] = cells['所属区域'].astype(object)
+
+        # 哈希只对不同客户计算一次，再按(单元, 客户)去重后写入寄存器
+        customer_idx, customers = pd.factorize(fact[col], use_na_sentinel=True)
+        register, rank = hash_positions(customers, precision)
+        valid = customer_idx >= 0
+        pairs = np.unique(cell_idx[valid].astype(np.int64) * max(len(customers), 1) + customer_idx[valid])
+        pair_cell, pair_customer = np.divmod(pairs, max(len(customers), 1))
+
+        registers = np.zeros((len(cells), 1 << precision), dtype=np.uint8)
+        np.maximum.at(registers, (pair_cell, register[pair_customer]), rank[pair_customer])
+
+        return cls(cells, registers, precision)
+
+    @classmethod
+    def from_chunks(cls, chunks, new_products, col='客户简称', precision=HLL_PRECISION):
+        """逐块构建后合并，结果与在完整数据上调用from_fact相同，内存占用只与块大小和单元数有关
+
+        chunks至少包含一块（可以为空块）。
+        """
+        sketches = None
+        for chunk in chunks:
+            part = cls.from_fact(chunk, new_products, col, precision)
+            sketches = part if sketches is None else sketches.merge(part)
+        return sketches
+
+    def merge(self, other):
+        """合并两个草图：相同单元的寄存器逐位取最大值，其余单元直接保留"""
+        cells = pd.concat([self.cells, other.cells], ignore_index=True)
+        grouped = cells.groupby(list(cells.columns), dropna=False, sort=False)
+        cell_idx = grouped.ngroup().to_numpy()
+        merged_cells = grouped.size().reset_index()[list(cells.columns)]
+        merged_cells['所属区域'] = merged_cells['所属区域'].astype(object)
+
+        registers = np.zeros((len(merged_cells), 1 << self.precision), dtype=np.uint8)
+        np.maximum.at(registers, cell_idx, np.concatenate([self.registers, other.registers]))
+        return PenetrationSketches(merged_cells, registers, self.precision)
+
+    def select_months(self, months):
+        """只保留给定月份（Period，None表示发运月份无法识别）的单元，用于在替换部分月份的数据后合并新的草图"""
+        ordinals = [NO_MONTH if month is None else month.ordinal for month in months]
+        mask = self.cells['月份'].isin(ordinals).to_numpy()
+        return PenetrationSketches(self.cells[mask].reset_index(drop=True), self.registers[mask], self.precision)
+
+    @property
+    def standard_error(self):
+        return hll_standard_error(self.precision)
+
+    def _mask(self, regions=None, new=None):
+        mask = np.ones(len(self.cells), dtype=bool)
+        if regions:
+            mask &= self.cells['所属区域'].isin(regions).to_numpy()
+        if new is not None:
+            mask &= self.cells['新品'].to_numpy() == new
+        return mask
+
+    def _merge(self, mask):
+        if not mask.any():
+            return np.zeros(1 << self.precision, dtype=np.uint8)
+        return self.registers[mask].max(axis=0)
+
+    def count(self, regions=None, new=None):
+        """选中区域（None表示全部）的去重客户数估计，new=True只统计购买新品的客户"""
+        return float(hll_estimate(self._merge(self._mask(regions, new)), self.precision))
+
+    def count_by_region(self, regions=None, new=None):
+        mask = self._mask(regions, new)
+        names = self.cells.loc[mask, '所属区域'].unique()
+        counts = [self.count([name], new) for name in names]
+        return pd.Series(counts, index=pd.Index(names, name='所属区域')).sort_index()
+
+    def monthly(self, regions=None, new=None, cumulative=False):
+        """按月的去重客户数；cumulative=True时为截至当月的累计去重客户数
+
+        月份标签为月末日期，范围为选中单元的首末月份，与 groupby(pd.Grouper(freq='M')) 一致（中间没有数据的月份计为0）。
+        """
+        mask = self._mask(regions, new)
+        ordinals = self.cells['月份'].to_numpy()
+        mask &= ordinals != NO_MONTH
+        if not mask.any():
+            return pd.DataFrame({'月份': pd.DatetimeIndex([]), '客户数': np.empty(0)})
+        first, last = ordinals[mask].min(), ordinals[mask].max()
+
+        merged = np.zeros((last - first + 1, 1 << self.precision), dtype=np.uint8)
+        for position in range(len(merged)):
+            selected = mask & (ordinals == first + position)
+            if selected.any():
+                merged[position] = self.registers[selected].max(axis=0)
+        if cumulative:
+            merged = np.maximum.accumulate(merged, axis=0)
+        counts = np.where(merged.any(axis=1), hll_estimate(merged, self.precision), 0.0)
+        months = pd.period_range(pd.Period(ordinal=first, freq='M'), periods=len(merged), freq='M')
+        return pd.DataFrame({'月份': months.to_timestamp(how='end').normalize(), '客户数': counts})
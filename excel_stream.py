@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+# 已知的数值列，其余非数值列按分类编码累积
+NUMERIC_COLUMNS = ['单价（箱）', '数量（箱）']
+CHUNK_ROWS = 50_000
+
+
+class _CategoryBuilder:
+    """逐块累积分类编码：全局只保存不同取值和int32编码"""
+
+    def __init__(self):
+        self.lookup = {}
+        self.values = []
+        self.chunks = []
+
+    def append(self, values):
+        codes, uniques = pd.factorize(values)
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            code = self.lookup.get(value)
+            if code is None:
+                code = len(self.values)
+                self.lookup[value] = code
+                self.values.append(value)
+            mapping[i] = code
+        global_codes = np.full(len(codes), -1, dtype=np.int32)
+        present = codes >= 0
+        global_codes[present] = mapping[codes[present]]
+        self.chunks.append(global_codes)
+
+    def finish(self):
+        codes = np.concatenate(self.chunks) if self.chunks else np.empty(0, dtype=np.int32)
+        categories = pd.Index(self.values)
+        result = pd.Categorical.from_codes(codes, categories=categories)
+        # 与astype('category')一致，分类按取值排序
+        try:
+            result = result.reorder_categories(categories.sort_values())
+        except TypeError:
+            pass
+        return result
+
+
+class _NumericBuilder:
+    def __init__(self):
+        self.chunks = []
+
+    def append(self, values):
+        """追加一块取值，有非空取值无法转换为数值时不追加并返回False"""
+        numeric = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+        if np.isnan(numeric).sum() > pd.isna(values).sum():
+            return False
+        self.chunks.append(numeric)
+        return True
+
+    def to_category(self):
+        """已累积的取值转为分类列（后续的块中出现文本时使用，与pd.read_excel得到的混合类型列一致）"""
+        builder = _CategoryBuilder()
+        for chunk in self.chunks:
+            values = chunk.astype(object)
+            integral = ~np.isnan(chunk) & (chunk == np.round(chunk))
+            values[integral] = chunk[integral].astype(np.int64)
+            builder.append(values)
+        return builder
+
+    def finish(self):
+        values = np.concatenate(self.chunks) if self.chunks else np.empty(0, dtype=np.float64)
+        # 全部为整数且无缺失时还原为整数列，与pd.read_excel的结果一致
+        if len(values) and not np.isnan(values).any() and np.array_equal(values, np.round(values)):
+            return values.astype(np.int64)
+        return values
+
+
+def iter_sheet_chunks(source, chunk_rows=CHUNK_ROWS, sheet_name=None):
+    """以只读模式逐行解析工作表，按块产出 (表头, 行列表, 已读行数, 估计总行数)"""
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        total_rows = max((sheet.max_row or 1) - 1, 0)
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(col) if col is not None else f"Unnamed: {i}" for i, col in enumerate(header)]
+
+        width = len(header)
+        chunk = []
+        rows_read = 0
+        for row in rows:
+            # 跳过完全空白的行（与pd.read_excel一致）
+            if all(value is None for value in row):
+                continue
+            # 只读模式下行尾的空单元格可能被省略，补齐到表头宽度
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            chunk.append(row[:width])
+            if len(chunk) >= chunk_rows:
+                rows_read += len(chunk)
+                yield header, chunk, rows_read, total_rows
+                chunk = []
+        if chunk:
+            rows_read += len(chunk)
+            yield header, chunk, rows_read, total_rows
+    finally:
+        workbook.close()
+
+
+def read_excel_streaming(source, chunk_rows=CHUNK_ROWS, sheet_name=None, progress=None):
+    """流式读取Excel：逐块转换类型并追加到紧凑的列存储中，峰值内存与文件大小基本无关
+
+    progress(已读行数, 估计总行数) 在每块读取后调用。列类型按第一块推断：推断为数值的列在后续的块中
+    出现文本时改按分类列保存（不把文本转为缺失值）；已知的数值列（NUMERIC_COLUMNS）出现文本时报错。
+    """
+    header = None
+    builders = {}
+    for header, chunk, rows_read, total_rows in iter_sheet_chunks(source, chunk_rows, sheet_name):
+        columns = list(zip(*chunk)) if chunk else [[] for _ in header]
+        for col, values in zip(header, columns):
+            values = np.asarray(values, dtype=object)
+            if col not in builders:
+                is_numeric = col in NUMERIC_COLUMNS or pd.api.types.is_numeric_dtype(
+                    pd.Series(values).infer_objects())
+                builders[col] = _NumericBuilder() if is_numeric else _CategoryBuilder()
+            if builders[col].append(values) is False:
+                if col in NUMERIC_COLUMNS:
+                    invalid = pd.to_numeric(pd.Series(values), errors='coerce').isna().to_numpy() & ~pd.isna(values)
+                    raise ValueError(f"数值列“{col}”中有无法识别为数值的取值：{values[invalid][0]!r}"
+                                     f"（第{rows_read - len(chunk) + 1:,}至{rows_read:,}条数据之间）")
+                builders[col] = builders[col].to_category()
+                builders[col].append(values)
+        if progress is not None:
+            progress(rows_read, total_rows)
+
+    if header is None:
+        return pd.DataFrame()
+
+    df = pd.DataFrame({col: builders[col].finish() for col in header})
+
+    # 发运月份只有少量不同取值，按取值转换后再映射回每一行
+    if '发运月份' in df.columns and isinstance(df['发运月份'].dtype, pd.CategoricalDtype):
+        try:
+            months = pd.to_datetime(df['发运月份'].cat.categories)
+            codes = df['发运月份'].cat.codes.to_numpy()
+            df['发运月份'] = pd.Series(months.take(codes, allow_fill=True, fill_value=pd.NaT), index=df.index)
+        except Exception:
+            # 无法转换时保留原格式，由后续预处理给出提示
+            pass
+    return df
@@ -0,0 +1,129 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+
+class DimensionIndex:
+    """单个维度列的 取值 -> 行位置 倒排索引（按取值分段的有序位置数组）"""
+
+    def __init__(self, column):
+        codes, values = self._encode(column)
+        self.values = values
+        self.has_missing = bool((codes < 0).any())
+        # 稳定排序保证每个取值内部的行位置仍然有序
+        self.order = np.argsort(codes, kind='stable').astype(np.int64)
+        counts = np.bincount(codes[codes >= 0], minlength=len(values))
+        start = int((codes < 0).sum())
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]) + start
+
+    @staticmethod
+    def _encode(column):
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            return column.cat.codes.to_numpy(), pd.Index(column.cat.categories)
+        codes, values = pd.factorize(column)
+        return codes, pd.Index(values)
+
+    def extend(self, tail, start):
+        """保留前start行的索引，追加tail（第start行起的数据）的索引，结果与在合并后的整列上重新建立索引相同
+
+        只对tail排序，之前的部分按取值分段直接合并，不再对全部行重新排序。
+        """
+        # 之前的索引中每个位置对应的编码（缺失值为-1，排在最前），去掉start及之后的行
+        counts = np.diff(np.concatenate([[0], self.offsets]))
+        head_codes = np.repeat(np.arange(-1, len(self.values)), counts)
+        keep = self.order < start
+        head_codes, head_positions = head_codes[keep], self.order[keep]
+
+        tail_codes, tail_values = self._encode(tail)
+        values = self.values.append(tail_values[~tail_values.isin(self.values)])
+        tail_codes = np.where(tail_codes >= 0, values.get_indexer(tail_values)[tail_codes], -1)
+        tail_order = np.argsort(tail_codes, kind='stable')
+        tail_codes, tail_positions = tail_codes[tail_order], tail_order.astype(np.int64) + start
+
+        # 每个取值的分段中，之前的行在前、新追加的行在后，位置仍然有序
+        head_counts = np.bincount(head_codes + 1, minlength=len(values) + 1)
+        tail_counts = np.bincount(tail_codes + 1, minlength=len(values) + 1)
+        ends = np.cumsum(head_counts + tail_counts)
+        starts = ends - head_counts - tail_counts
+        order = np.empty(len(head_positions) + len(tail_positions), dtype=np.int64)
+        groups = head_codes + 1
+        order[starts[groups] + np.arange(len(groups)) - (np.cumsum(head_counts) - head_counts)[groups]] = head_positions
+        groups = tail_codes + 1
+        order[starts[groups] + head_counts[groups] + np.arange(len(groups))
+              - (np.cumsum(tail_counts) - tail_counts)[groups]] = tail_positions
+
+        # 去掉不再出现的取值
+        present = ends[1:] > starts[1:]
+        index = copy.copy(self)
+        index.values = values[present]
+        index.has_missing = bool(ends[0] > 0)
+        index.order = order
+        index.offsets = np.append(ends[:-1][present], ends[-1])
+        return index
+
+    def positions(self, selected):
+        """选中取值对应的行位置（升序）"""
+        codes = self.values.get_indexer(pd.Index(selected).unique())
+        codes = codes[codes >= 0]
+        if len(codes) == 0:
+            return np.empty(0, dtype=np.int64)
+        parts = [self.order[self.offsets[c]:self.offsets[c + 1]] for c in codes]
+        result = np.concatenate(parts)
+        if len(codes) > 1:
+            result.sort()
+        return result
+
+    def covers_all(self, selected):
+        """选中了全部取值且没有缺失值时，筛选不会排除任何行"""
+        if self.has_missing:
+            return False
+        return self.values.isin(selected).all()
+
+
+class FilterEngine:
+    """预先为筛选维度建立索引，筛选时只做位置数组求交，最后一次性取出结果"""
+
+    def __init__(self, df, columns):
+        self.indexes = {col: DimensionIndex(df[col]) for col in columns if col in df.columns}
+
+    def extend(self, df, start):
+        """df的前start行与建立索引时的数据相同：保留这部分索引，只为其余行建立索引后合并"""
+        engine = copy.copy(self)
+        engine.indexes = {col: index.extend(df[col].iloc[start:], start) for col, index in self.indexes.items()}
+        return engine
+
+    def select(self, selections, on_empty=None):
+        """按顺序应用各维度的筛选条件，返回行位置（None表示不筛选）
+
+        与逐个调用safe_filter的语义一致：某个条件使结果为空时跳过该条件，并调用on_empty。
+        """
+        current = None
+        for col, selected in selections:
+            if not selected or col not in self.indexes:
+                continue
+            index = self.indexes[col]
+            if index.covers_all(selected):
+                continue
+            positions = index.positions(selected)
+            candidate = positions if current is None else np.intersect1d(current, positions, assume_unique=True)
+            if len(candidate) == 0:
+                if on_empty is not None:
+                    on_empty()
+                continue
+            current = candidate
+        return current
+
+    def restrict(self, positions, col, selected):
+        """在已有行位置上再按某一维度筛选（不做空结果回退）"""
+        subset = self.indexes[col].positions(selected)
+        if positions is None:
+            return subset
+        return np.intersect1d(positions, subset, assume_unique=True)
+
+    @staticmethod
+    def take(df, positions):
+        """根据行位置取出数据；None表示全部数据（返回浅拷贝，新增列不会影响原数据）"""
+        if positions is None:
+            return df.copy(deep=False)
+        return df.take(positions)
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import time
+
+import pandas as pd
+
+# 缓存目录与容量上限（可通过环境变量覆盖）
+CACHE_DIR = os.environ.get(
+    "SALES_DASHBOARD_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ingest_cache")
+)
+CACHE_BUDGET_BYTES = int(os.environ.get("SALES_DASHBOARD_CACHE_BUDGET_MB", "2048")) * 1024 * 1024
+
+# 预处理逻辑变化时递增，使旧的缓存文件自动失效
+CACHE_VERSION = 3
+
+
+def content_hash(data):
+    """计算上传文件内容的哈希值，作为缓存键"""
+    digest = hashlib.sha256()
+    digest.update(f"v{CACHE_VERSION}:".encode())
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+
+def load_cached(key):
+    """读取缓存的预处理结果，未命中时返回None"""
+    path = _cache_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_parquet(path)
+    except Exception:
+        # 缓存文件损坏时删除，按未命中处理
+        _remove(path)
+        return None
+    # 更新访问时间，用于LRU淘汰
+    now = time.time()
+    try:
+        os.utime(path, (now, now))
+    except OSError:
+        pass
+    return df
+
+
+def store(key, df):
+    """将预处理后的数据写入缓存，写入失败不影响正常加载"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = _cache_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        # 先写临时文件再原子替换，避免并发会话读到半个文件
+        os.replace(tmp_path, path)
+    except Exception:
+        _remove(f"{_cache_path(key)}.{os.getpid()}.tmp")
+        return False
+    evict()
+    return True
+
+
+def evict(budget_bytes=None):
+    """按最近访问时间淘汰缓存文件，直到总大小不超过预算"""
+    budget_bytes = CACHE_BUDGET_BYTES if budget_bytes is None else budget_bytes
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".parquet"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= budget_bytes:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,105 @@
+import pandas as pd
+
+from data_prep import add_product_attributes, decategorize
+
+# 事实表粒度（产品名称、简化产品名称由产品代码决定，不会增加行数）
+CUBE_KEYS = ['所属区域', '客户简称', '产品代码', '产品名称', '简化产品名称', '申请人', '发运月份']
+
+
+def build_fact(df):
+    """按 区域×客户×产品×申请人×月份 聚合原始数据，得到事实表"""
+    keys = [key for key in CUBE_KEYS if key in df.columns]
+    source = df[keys + ['销售额', '数量（箱）', '单价（箱）']]
+
+    # 按月聚合，月内日期差异不影响按月分组的结果
+    if pd.api.types.is_datetime64_any_dtype(source['发运月份']):
+        source = source.assign(发运月份=source['发运月份'].dt.to_period('M').dt.to_timestamp())
+
+    fact = source.groupby(keys, observed=True, dropna=False, sort=False).agg(
+        销售额=('销售额', 'sum'),
+        数量=('数量（箱）', 'sum'),
+        单价合计=('单价（箱）', 'sum'),
+        单价行数=('单价（箱）', 'count'),
+    ).reset_index()
+
+    # 包装类型、规格等属性由产品名称决定，按不同名称计算一次
+    return add_product_attributes(fact)
+
+
+class SalesCube:
+    """预聚合的事实表，每个数据集只构建一次"""
+
+    def __init__(self, fact):
+        self.fact = fact
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(build_fact(df))
+
+    def filter(self, selections):
+        """按与原始数据相同的顺序和回退规则筛选（某个条件使结果为空时跳过该条件）"""
+        fact = self.fact
+        for col, selected in selections:
+            if not selected:
+                continue
+            candidate = fact[fact[col].isin(selected)]
+            if not candidate.empty:
+                fact = candidate
+        return CubeView(fact)
+
+    def view(self):
+        return CubeView(self.fact)
+
+
+class CubeView:
+    """筛选后的事实表，提供各标签页使用的汇总查询"""
+
+    def __init__(self, fact):
+        self.fact = fact
+
+    def __len__(self):
+        return len(self.fact)
+
+    @property
+    def empty(self):
+        return self.fact.empty
+
+    def restrict(self, col, selected):
+        """再按某一维度筛选（不做空结果回退）"""
+        return CubeView(self.fact[self.fact[col].isin(selected)])
+
+    def total(self, measure='销售额'):
+        return self.fact[measure].sum()
+
+    def nunique(self, col):
+        """精确去重计数（客户、产品均是事实表粒度的一部分）"""
+        return self.fact[col].nunique()
+
+    def mean_price(self):
+        """与原始行上的单价均值一致"""
+        count = self.fact['单价行数'].sum()
+        return self.fact['单价合计'].sum() / count if count > 0 else float('nan')
+
+    def sum_by(self, keys, measure='销售额'):
+        return self.fact.groupby(keys, observed=True)[measure].sum().reset_index().pipe(decategorize)
+
+    def nunique_by(self, keys, col='客户简称'):
+        return self.fact.groupby(keys, observed=True)[col].nunique().reset_index().pipe(decategorize)
+
+    def monthly_nunique(self, col='客户简称'):
+        """按月统计去重数量，与 groupby(pd.Grouper(freq='M')) 的结果一致"""
+        fact = self.fact
+        if not pd.api.types.is_datetime64_dtype(fact['发运月份']):
+            fact = fact.assign(发运月份=pd.to_datetime(fact['发运月份']))
+        return fact.groupby(pd.Grouper(key='发运月份', freq='M'))[col].nunique().reset_index()
+
+    def cumulative_monthly_nunique(self, col='客户简称'):
+        """截至每月的累计去重数量：每个取值只在首次出现的月份计数再累加，月份与 monthly_nunique 一致"""
+        fact = self.fact
+        if not pd.api.types.is_datetime64_dtype(fact['发运月份']):
+            fact = fact.assign(发运月份=pd.to_datetime(fact['发运月份']))
+        months = self.monthly_nunique(col)[['发运月份']]
+        first_seen = fact.groupby(col, observed=True)['发运月份'].min().dropna().to_frame()
+        new_counts = first_seen.groupby(pd.Grouper(key='发运月份', freq='M')).size()
+        counts = new_counts.reindex(months['发运月份'], fill_value=0).cumsum().to_numpy()
+        return months.assign(**{col: counts})
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+
+# 后台预计算的线程数和最多保留状态的数据集数量（可通过环境变量覆盖）
+PRECOMPUTE_WORKERS = int(os.environ.get("SALES_DASHBOARD_PRECOMPUTE_WORKERS", str(min(4, os.cpu_count() or 1))))
+PRECOMPUTE_MAX_DATASETS = 8
+
+
+class Precomputer:
+    """后台预计算：数据集加载后，在线程池中并行计算各页面不筛选时用到的聚合结果
+
+    任务本身负责把结果写入页面使用的缓存（函数缓存或图表缓存），这里只记录任务状态；
+    同一数据集键只提交一次，页面打开时等待属于自己的任务完成即可直接命中缓存。
+    """
+
+    def __init__(self, max_workers=PRECOMPUTE_WORKERS, max_datasets=PRECOMPUTE_MAX_DATASETS):
+        self.max_datasets = max_datasets
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix='precompute')
+        # 数据集键 -> [(页面, 任务名称, Future)]
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.timings = {}
+
+    # 任务的返回值不保留在Future中（结果已写入缓存）
+    def _run(self, key, name, func):
+        start = time.perf_counter()
+        try:
+            func()
+        finally:
+            with self._lock:
+                self.timings[(key, name)] = time.perf_counter() - start
+
+    def submit(self, key, tasks):
+        """提交一个数据集的预计算任务 [(页面, 任务名称, 函数)]，已提交过的键直接跳过，返回是否新提交"""
+        with self._lock:
+            if key in self._jobs:
+                self._jobs.move_to_end(key)
+                return False
+            self._jobs[key] = [
+                (page, name, self._executor.submit(self._run, key, name, func))
+                for page, name, func in tasks
+            ]
+            while len(self._jobs) > self.max_datasets:
+                old_key, old_jobs = self._jobs.popitem(last=False)
+                for _, name, future in old_jobs:
+                    future.cancel()
+                    self.timings.pop((old_key, name), None)
+            return True
+
+    def _futures(self, key, page=None):
+        with self._lock:
+            return [future for job_page, _, future in self._jobs.get(key, [])
+                    if page is None or job_page == page]
+
+    def progress(self, key, page=None):
+        """已完成的任务数和任务总数（page为None时统计所有页面）"""
+        futures = self._futures(key, page)
+        return sum(future.done() for future in futures), len(futures)
+
+    def ready(self, key, page=None):
+        done, total = self.progress(key, page)
+        return done == total
+
+    def elapsed(self, key):
+        """已完成任务的累计耗时（秒）"""
+        with self._lock:
+            return sum(seconds for (job_key, _), seconds in self.timings.items() if job_key == key)
+
+    def pending_pages(self, key):
+        """还有任务未完成的页面（按提交顺序）"""
+        with self._lock:
+            jobs = list(self._jobs.get(key, []))
+        return list(OrderedDict.fromkeys(page for page, _, future in jobs if not future.done()))
+
+    def errors(self, key):
+        """失败的任务：任务名称 -> 异常（页面打开时会自行重新计算）"""
+        with self._lock:
+            jobs = list(self._jobs.get(key, []))
+        return {name: future.exception() for _, name, future in jobs
+                if future.done() and not future.cancelled() and future.exception() is not None}
+
+    def wait(self, key, page, on_progress=None, poll_seconds=0.5):
+        """等待页面的任务全部完成，期间以 (已完成, 总数) 调用on_progress"""
+        futures = self._futures(key, page)
+        while True:
+            pending = [future for future in futures if not future.done()]
+            if on_progress is not None:
+                on_progress(len(futures) - len(pending), len(futures))
+            if not pending:
+                return
+            wait_futures(pending, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+
+    def clear(self):
+        with self._lock:
+            for jobs in self._jobs.values():
+                for _, _, future in jobs:
+                    future.cancel()
+            self._jobs.clear()
+            self.timings.clear()
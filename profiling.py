@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+import tracemalloc
+import weakref
+
+
+class Span:
+    """一个命名的计时区间：耗时、输入/输出行数和内存峰值增量"""
+
+    __slots__ = ('name', 'depth', 'rows_in', 'rows_out', 'seconds', 'peak_memory_delta',
+                 '_start', '_start_memory', '_peak')
+
+    def __init__(self, name, depth, rows_in=None):
+        self.name = name
+        self.depth = depth
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.peak_memory_delta = None
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'seconds': self.seconds,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_memory_delta': self.peak_memory_delta,
+        }
+
+
+class _NullSpan:
+    """未启用时使用的空区间，进入/退出和设置属性都不做任何事"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+# tracemalloc的跟踪状态是进程级的：记录启用中的分析器数量，最后一个关闭时才停止跟踪
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_started_tracing = False
+
+
+def _acquire_tracing():
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracing_users += 1
+
+
+def _release_tracing():
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        _tracing_users -= 1
+        # 只停止由这里启动的跟踪，避免持续的分配开销
+        if _tracing_users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+# 峰值统计（tracemalloc.reset_peak）也是进程级的：启用中的分析器的最外层区间依次执行（嵌套区间在其中），
+# 其他会话的分析器不会在区间中途重置峰值
+_peak_lock = threading.Lock()
+
+
+class _SpanContext:
+    def __init__(self, profiler, span):
+        self.profiler = profiler
+        self.span = span
+
+    def __enter__(self):
+        return self.profiler._enter(self.span)
+
+    def __exit__(self, *exc):
+        self.profiler._exit(self.span)
+        return False
+
+
+class Profiler:
+    """按阶段记录耗时和内存的轻量分析器
+
+    未启用时 span() 直接返回共享的空区间，几乎没有开销；启用时用tracemalloc统计各区间的内存峰值
+    （嵌套区间的峰值会计入外层区间）。多个会话同时启用时各自的最外层区间依次执行，峰值不会被其他分析器中途重置；
+    tracemalloc统计的是整个进程的分配，未启用的会话和后台线程同时运行时峰值会包含它们的分配。
+    使用完毕后调用close()（或对象被回收时）释放内存跟踪。
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.spans = []
+        self._stack = []
+        self._release = weakref.finalize(self, _release_tracing) if enabled else None
+        if enabled:
+            _acquire_tracing()
+
+    def close(self):
+        """释放内存跟踪（没有其他启用中的分析器时停止跟踪），可以重复调用"""
+        if self._release is not None:
+            self._release()
+
+    def span(self, name, rows_in=None):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _SpanContext(self, Span(name, len(self._stack), rows_in))
+
+    def _enter(self, span):
+        if not self._stack:
+            _peak_lock.acquire()
+        self.spans.append(span)
+        self._stack.append(span)
+        span._start_memory = tracemalloc.get_traced_memory()[0]
+        span._peak = span._start_memory
+        if len(self._stack) > 1:
+            # 外层区间在进入子区间之前达到的峰值
+            parent = self._stack[-2]
+            parent._peak = max(parent._peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        span._start = time.perf_counter()
+        return span
+
+    def _exit(self, span):
+        span.seconds = time.perf_counter() - span._start
+        span._peak = max(span._peak, tracemalloc.get_traced_memory()[1])
+        span.peak_memory_delta = span._peak - span._start_memory
+        self._stack.pop()
+        if self._stack:
+            parent = self._stack[-1]
+            parent._peak = max(parent._peak, span._peak)
+        else:
+            _peak_lock.release()
+
+    def records(self):
+        return [span.to_dict() for span in self.spans if span.seconds is not None]
+
+    def to_jsonl(self, **extra):
+        """每个区间一行JSON，extra中的字段（如时间戳、会话）附加到每一行"""
+        return ''.join(json.dumps({**extra, **record}, ensure_ascii=False) + '\n' for record in self.records())
@@ -0,0 +1,153 @@
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from data_prep import decategorize
+
+# 逐块转换为Python对象后按行写入，每块的行数
+WRITE_CHUNK_ROWS = 10_000
+# Excel单个工作表的最大行数（含表头）
+EXCEL_MAX_ROWS = 1_048_576
+
+
+def region_summary(df):
+    """区域销售汇总"""
+    summary = df.groupby('所属区域', observed=True).agg({
+        '销售额': 'sum',
+        '客户简称': pd.Series.nunique,
+        '产品代码': pd.Series.nunique,
+        '数量（箱）': 'sum'
+    }).reset_index()
+    summary.columns = ['区域', '销售额', '客户数', '产品数', '销售数量']
+    return summary
+
+
+def product_summary(df):
+    """产品销售汇总"""
+    summary = df.groupby(['产品代码', '简化产品名称'], observed=True).agg({
+        '销售额': 'sum',
+        '客户简称': pd.Series.nunique,
+        '数量（箱）': 'sum'
+    }).sort_values('销售额', ascending=False).reset_index()
+    summary.columns = ['产品代码', '产品名称', '销售额', '购买客户数', '销售数量']
+    return summary
+
+
+def cube_region_summary(view):
+    """区域销售汇总（在事实表视图上计算，结果与region_summary相同）"""
+    summary = view.sum_by('所属区域')
+    for col, frame in [('客户数', view.nunique_by('所属区域', '客户简称')),
+                       ('产品数', view.nunique_by('所属区域', '产品代码')),
+                       ('销售数量', view.sum_by('所属区域', '数量'))]:
+        summary[col] = frame.iloc[:, -1].to_numpy()
+    summary.columns = ['区域', '销售额', '客户数', '产品数', '销售数量']
+    return decategorize(summary)
+
+
+def cube_product_summary(view):
+    """产品销售汇总（在事实表视图上计算，结果与product_summary相同）"""
+    keys = ['产品代码', '简化产品名称']
+    summary = view.sum_by(keys)
+    summary['购买客户数'] = view.nunique_by(keys, '客户简称').iloc[:, -1].to_numpy()
+    summary['销售数量'] = view.sum_by(keys, '数量').iloc[:, -1].to_numpy()
+    summary = summary.sort_values('销售额', ascending=False).reset_index(drop=True)
+    summary.columns = ['产品代码', '产品名称', '销售额', '购买客户数', '销售数量']
+    return decategorize(summary)
+
+
+def frame_chunks(frame, chunk_rows=WRITE_CHUNK_ROWS):
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+def write_sheet(workbook, sheet_name, frame, chunk_rows=WRITE_CHUNK_ROWS):
+    """按行顺序写入工作表（constant_memory模式下每行写完即落盘，不能回头修改之前的行）"""
+    write_sheet_chunks(workbook, sheet_name, frame.columns, len(frame), frame_chunks(frame, chunk_rows))
+
+
+def write_sheet_chunks(workbook, sheet_name, columns, n_rows, chunks):
+    """逐块写入工作表，数据块可以来自数据库游标等不能一次载入内存的来源；n_rows为总行数"""
+    if n_rows + 1 > EXCEL_MAX_ROWS:
+        raise ValueError(f"工作表「{sheet_name}」共{n_rows}行，超过Excel的最大行数，请改用CSV或Parquet格式导出")
+
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, [str(col) for col in columns])
+    row_index = 1
+    for block in chunks:
+        block = block.astype(object)
+        block = block.where(block.notna(), None)
+        for row in block.itertuples(index=False, name=None):
+            worksheet.write_row(row_index, 0, row)
+            row_index += 1
+
+
+def write_workbook(output, sheets):
+    """以constant_memory模式写入多个工作表，sheets为 [(工作表名, 列名, 行数, 数据块)]"""
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd'})
+    try:
+        for sheet_name, columns, n_rows, chunks in sheets:
+            write_sheet_chunks(workbook, sheet_name, columns, n_rows, chunks)
+    finally:
+        workbook.close()
+
+
+def write_excel_report(df, new_products_df, output):
+    """以constant_memory模式生成Excel报告，output可以是文件路径或可写的文件对象"""
+    # 销售概览表
+    sheets = [('销售数据总览', df.columns, len(df), frame_chunks(df))]
+
+    # 新品分析表
+    if not new_products_df.empty:
+        sheets.append(('新品销售数据', new_products_df.columns, len(new_products_df), frame_chunks(new_products_df)))
+
+    for sheet_name, summary in [('区域销售汇总', region_summary(df)), ('产品销售汇总', product_summary(df))]:
+        sheets.append((sheet_name, summary.columns, len(summary), frame_chunks(summary)))
+    write_workbook(output, sheets)
+
+
+def excel_report_bytes(df, new_products_df):
+    output = BytesIO()
+    write_excel_report(df, new_products_df, output)
+    return output.getvalue()
+
+
+def csv_bytes(df):
+    """原始数据CSV（带BOM，Excel打开时中文不会乱码）"""
+    output = BytesIO()
+    df.to_csv(output, index=False, encoding='utf-8-sig')
+    return output.getvalue()
+
+
+def parquet_bytes(df):
+    output = BytesIO()
+    df.to_parquet(output, index=False)
+    return output.getvalue()
+
+
+def csv_bytes_chunks(chunks):
+    """逐块写入的CSV（与csv_bytes格式相同），只有第一块写表头"""
+    output = BytesIO()
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(output, index=False, header=i == 0, encoding='utf-8-sig' if i == 0 else 'utf-8')
+    return output.getvalue()
+
+
+def parquet_bytes_chunks(chunks):
+    """逐块写入的Parquet，表结构取自第一块（全为空值的列按文本处理），分类列按普通列写入"""
+    output = BytesIO()
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(decategorize(chunk), preserve_index=False)
+            if writer is None:
+                schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                    for field in table.schema]).remove_metadata()
+                writer = pq.ParquetWriter(output, schema)
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return output.getvalue()
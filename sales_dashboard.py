@@ -1,4 +1,5 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
 import numpy as np
 import plotly.express as px
@@ -7,7 +8,30 @@ from plotly.subplots import make_subplots
 import matplotlib.pyplot as plt
 import seaborn as sns
 from io import BytesIO
+import os
 import traceback
+import threading
+import time
+import uuid
+
+import ingest_cache
+from data_prep import preprocess, decategorize, product_dimension, append_product_dimension, NEW_PRODUCTS, WEIGHT_CLASS_LABELS, UNKNOWN_ATTRIBUTE
+import customer_segments
+from basket_analysis import CoOccurrence, build_incidence, association_rules
+from filter_engine import FilterEngine
+from olap_cube import SalesCube
+from distinct_sketch import PenetrationSketches, SKETCH_DEFAULT_MIN_ROWS
+from excel_stream import read_excel_streaming
+from dataset_store import DatasetStore, common_prefix, partition_spans, month_period
+from dataset_registry import DatasetRegistry
+from arrow_store import ArrowStore, dataset_slot
+from sql_backend import SqlCube, SqlStore, SQL_ENGINES, SQL_DETAIL_MAX_ROWS
+from chart_cache import ChartCache
+from precompute import Precomputer
+from profiling import Profiler
+from chart_render import (set_heatmap_text, scatter_mode, binned_density, SCATTER_MODES,
+                          SCATTER_WEBGL_MIN_ROWS, SCATTER_DENSITY_MIN_ROWS, SCATTER_DENSITY_BINS)
+import report_export
 
 # 设置页面配置
 st.set_page_config(
@@ -155,52 +179,292 @@ def format_yuan(value):
     return f"{value:,.0f}元"
 
 
-# 安全筛选函数
-def safe_filter(df, filter_func):
-    """安全应用筛选条件，确保筛选后的数据不为空"""
-    try:
-        filtered = filter_func(df)
-        if filtered.empty:
-            st.warning("当前筛选条件下没有匹配的数据。请尝试放宽筛选条件。")
-            return df  # 返回原始数据而不是空数据
-        return filtered
-    except Exception as e:
-        st.error(f"筛选数据时出错: {str(e)}")
+# 筛选结果为空时的提示（该筛选条件会被跳过，保留之前的数据）
+def warn_empty_filter():
+    st.warning("当前筛选条件下没有匹配的数据。请尝试放宽筛选条件。")
+
+
+# 以下按数据集构建的结构保存在数据集注册表中（数据集键与注册表的键相同），数据集空闲释放时一起释放
+# 按月数据集（store_root不为None）的新版本：注册表中还有同一数据集之前版本已构建的同名结构时，
+# 调用extend(该结构, 之前版本的数据)只处理变化的分区，返回None时再完整构建
+def dataset_derived(dataset_key, name, build, store_root=None, extend=None):
+    def build_or_extend():
+        if store_root is not None and extend is not None:
+            previous = get_dataset_registry().latest(lambda frame: frame.attrs.get('dataset_root') == store_root, name)
+            if previous is not None:
+                value = extend(previous[1], previous[0])
+                if value is not None:
+                    return value
+        return build()
+    return get_dataset_registry().derived(dataset_key, name, build_or_extend)
+
+
+# 筛选维度索引，每个数据集只构建一次；按月数据集的新版本保留开头未变化的分区的索引，只为之后的行建立索引
+def get_filter_engine(dataset_key, df):
+    def extend(engine, previous):
+        rows, _ = common_prefix(previous.attrs['dataset_layout'], df.attrs['dataset_layout'])
+        return engine.extend(df, rows) if rows else None
+
+    return dataset_derived(dataset_key, 'filter_engine',
+                           lambda: FilterEngine(df, ['所属区域', '客户简称', '产品代码', '申请人']),
+                           df.attrs.get('dataset_root'), extend)
+
+
+# 产品维度表（代码、名称、简化名称、包装类型等产品属性、是否新品），每个数据集只构建一次
+# 按月数据集只追加了之后的月份时，在之前版本的维度表中追加新出现的产品
+def get_product_dimension(dataset_key, df):
+    def extend(dimension, previous):
+        previous_layout = previous.attrs['dataset_layout']
+        rows, count = common_prefix(previous_layout, df.attrs['dataset_layout'])
+        if not rows or count < len(previous_layout):
+            return None
+        return append_product_dimension(dimension, df.iloc[rows:])
+
+    return dataset_derived(dataset_key, 'product_dimension', lambda: product_dimension(df),
+                           df.attrs.get('dataset_root'), extend)
+
+
+# 预聚合事实表，每个数据集只构建一次
+def get_sales_cube(dataset_key, df):
+    return dataset_derived(dataset_key, 'sales_cube', lambda: SalesCube.from_frame(df))
+
+
+# 图表和聚合结果缓存，进程内所有会话共享（按内存预算淘汰）
+@st.cache_resource
+def get_chart_cache():
+    return ChartCache()
+
+
+# 后台预计算线程池，进程内所有会话共享
+@st.cache_resource
+def get_precomputer():
+    return Precomputer()
+
+
+# 区域×月份×是否新品的客户去重计数草图（市场渗透率页面），每个数据集只构建一次
+# SQL后端在数据库中去重后逐块构建，不载入完整的事实表；按月数据集的新版本保留来源未变的月份的单元，只为变化的分区构建
+def get_penetration_sketches(dataset_key, cube):
+    def build():
+        if isinstance(cube, SqlCube):
+            return cube.penetration_sketches(NEW_PRODUCTS)
+        return PenetrationSketches.from_fact(cube.fact, NEW_PRODUCTS)
+
+    def extend(sketches, previous):
+        spans = partition_spans(cube.fact.attrs['dataset_layout'])
+        kept = spans.keys() & partition_spans(previous.attrs['dataset_layout']).keys()
+        added = [cube.fact.iloc[start:stop] for key, (start, stop) in spans.items() if key not in kept]
+        return sketches.select_months([month_period(month) for month, _ in kept]).merge(
+            PenetrationSketches.from_chunks(added or [cube.fact.iloc[:0]], NEW_PRODUCTS))
+
+    store_root = None if isinstance(cube, SqlCube) else cube.fact.attrs.get('dataset_root')
+    return dataset_derived(dataset_key, 'penetration_sketches', build, store_root, extend)
+
+
+# 在整个数据集上拟合的RFM客户分群（客户细分页面），筛选条件变化时只重新归类
+def get_customer_segmentation(dataset_key, df):
+    return dataset_derived(dataset_key, 'customer_segmentation',
+                           lambda: customer_segments.CustomerSegmentation.fit(df, NEW_PRODUCTS))
+
+
+# 共现矩阵按筛选条件签名缓存的最大数量
+PAGE_CACHE_ENTRIES = 32
+
+
+# 客户×产品共现矩阵（产品组合页面）
+# 以下缓存函数也在后台预计算中调用，不显示缓存的加载提示（页面等待预计算时另有进度提示）
+@st.cache_resource(max_entries=PAGE_CACHE_ENTRIES, show_spinner=False)
+def get_product_baskets(filter_key, _filtered_df):
+    return CoOccurrence(_filtered_df)
+
+
+# 与新品相关的关联规则（产品组合页面），购物篮为客户或客户×月份
+@st.cache_resource(max_entries=PAGE_CACHE_ENTRIES, show_spinner=False)
+def get_association_rules(filter_key, basket_mode, min_support, min_confidence, _filtered_df, _co_occurrence):
+    if basket_mode == "客户×月份":
+        incidence, _, items = build_incidence(_filtered_df, ['客户简称', '发运月份'])
+    else:
+        incidence, items = _co_occurrence.incidence, _co_occurrence.items
+    return association_rules(incidence, items, min_support, min_confidence, focus_items=NEW_PRODUCTS)
+
+
+# 按月（或截至每月累计）的客户数、购买新品客户数和渗透率；sketches不为None时由草图估计
+def penetration_by_month(cube, new_products_cube, sketches=None, regions=None, cumulative=False):
+    if sketches is None:
+        nunique = 'cumulative_monthly_nunique' if cumulative else 'monthly_nunique'
+        monthly_customers = getattr(cube, nunique)('客户简称')
+        monthly_new_customers = getattr(new_products_cube, nunique)('客户简称')
+    else:
+        monthly_customers = sketches.monthly(regions, cumulative=cumulative).round()
+        monthly_new_customers = sketches.monthly(regions, new=True, cumulative=cumulative).round()
+    monthly_customers.columns = ['月份', '客户总数']
+    monthly_new_customers.columns = ['月份', '购买新品客户数']
+
+    # 合并月度数据
+    frame = monthly_customers.merge(monthly_new_customers, on='月份', how='left')
+    frame['购买新品客户数'] = frame['购买新品客户数'].fillna(0)
+    frame['渗透率'] = (frame['购买新品客户数'] / frame['客户总数'] * 100).round(2)
+    if sketches is not None:
+        frame['渗透率'] = frame['渗透率'].clip(upper=100)
+    frame['月份_str'] = frame['月份'].dt.strftime('%Y-%m')
+    return frame
+
+
+# 月度渗透率在图表缓存中的标识（精确计数或草图估计，月度或累计）
+def penetration_frame_id(count_mode, cumulative):
+    return f"monthly_penetration:{count_mode}:{'cumulative' if cumulative else 'monthly'}"
+
+
+# 产品共现热力图
+def build_co_occurrence_heatmap(heatmap_data, product_names):
+    fig_co_heatmap = px.imshow(
+        heatmap_data,
+        labels=dict(x="产品名称", y="产品名称", color="共现次数"),
+        x=product_names,  # 使用简化名称
+        y=product_names,  # 使用简化名称
+        color_continuous_scale="Viridis",
+        title="产品共现热力图",
+        height=600  # 增加高度以容纳更多数据
+    )
+
+    fig_co_heatmap.update_layout(
+        margin=dict(t=80, b=80, l=100, r=100),
+        font=dict(size=14),
+        xaxis_tickangle=-45  # 倾斜x轴标签以防重叠
+    )
+
+    # 添加数值标签（只显示非零值）
+    values = heatmap_data.to_numpy()
+    set_heatmap_text(fig_co_heatmap, np.where(values > 0, values.astype(str), ''), font_size=12)
+    return fig_co_heatmap
+
+
+# 超过该大小的文件自动使用流式读取
+STREAMING_THRESHOLD_BYTES = 50 * 1024 * 1024
+
+
+# 流式读取Excel并在侧边栏显示进度
+def read_excel_with_progress(raw_bytes):
+    progress_bar = st.sidebar.progress(0.0, text="正在流式读取数据...")
+
+    def update(rows_read, total_rows):
+        fraction = min(rows_read / total_rows, 1.0) if total_rows else 0.0
+        progress_bar.progress(fraction, text=f"正在流式读取数据... 已读取 {rows_read:,} 行")
+
+    df = read_excel_streaming(BytesIO(raw_bytes), progress=update)
+    progress_bar.progress(1.0, text=f"流式读取完成，共 {len(df):,} 行")
+    return df
+
+
+# 解析Excel文件内容，大文件或指定时使用流式读取
+def read_workbook(raw_bytes, file_name, streaming=False):
+    use_streaming = streaming or len(raw_bytes) > STREAMING_THRESHOLD_BYTES
+    if use_streaming and not str(file_name).lower().endswith('.xls'):
+        # 大文件逐块读取，避免一次性构建整个工作簿对象
+        return read_excel_with_progress(raw_bytes)
+    return pd.read_excel(BytesIO(raw_bytes))
+
+
+# 进程内共享的数据集注册表：同一内容的数据集只保留一份，各会话拿到共享数据的视图
+@st.cache_resource
+def get_dataset_registry():
+    return DatasetRegistry()
+
+
+def shared_dataset(key, load):
+    """从注册表取得键对应数据集的视图（未加载时调用load()），当前会话对之前数据集的引用随之释放"""
+    session_id = st.session_state.setdefault('dataset_session_id', uuid.uuid4().hex)
+    return get_dataset_registry().acquire(session_id, key, load)
+
+
+def release_shared_dataset():
+    """当前会话不再引用任何共享数据集（数据集被清空时调用，空闲后即可释放）"""
+    session_id = st.session_state.get('dataset_session_id')
+    if session_id is not None:
+        get_dataset_registry().release(session_id)
+
+
+def mapped_dataset(name, version, load):
+    """进程间共享的数据集：从共享的Arrow文件以内存映射方式读取，没有或已过期时调用load()并发布新版本"""
+    store = ArrowStore()
+    df = store.load(name, version)
+    if df is not None:
+        df.attrs['arrow_store'] = 'hit'
         return df
+    df = load()
+    # 加载失败改用示例数据时不发布
+    if df.attrs.get('dataset_key') == version:
+        try:
+            store.publish(name, version, df)
+            df.attrs['arrow_store'] = 'published'
+        except Exception:
+            # 写入失败不影响正常加载
+            pass
+    return df
+
 
+# 数据文件的内容哈希（数据集注册表和摄取缓存的键）；上传的文件按file_id记在会话中，每次上传只计算一次
+def content_key(file_path):
+    if not hasattr(file_path, 'read'):
+        with open(file_path, 'rb') as f:
+            return ingest_cache.content_hash(f.read())
+    keys = st.session_state.setdefault('upload_content_keys', {})
+    file_id = getattr(file_path, 'file_id', None)
+    if file_id is None or file_id not in keys:
+        raw_bytes = file_path.getvalue() if hasattr(file_path, 'getvalue') else file_path.read()
+        keys[file_id] = ingest_cache.content_hash(raw_bytes)
+    return keys[file_id]
 
-# 加载数据函数
-@st.cache_data
-def load_data(file_path=None):
+
+# 加载数据函数：相同内容的数据在进程内只加载一次，同一台机器上的其他服务进程通过共享的Arrow文件读取
+def load_data(file_path=None, streaming=False):
+    if file_path is None:
+        return shared_dataset('sample', lambda: mapped_dataset('sample', 'sample', read_data))
+    key = content_key(file_path)
+    return shared_dataset(key, lambda: mapped_dataset(key, key, lambda: read_data(file_path, streaming)))
+
+
+# 读取并预处理数据文件（没有文件时使用示例数据）
+def read_data(file_path=None, streaming=False):
     # 如果提供了文件路径，从文件加载
     try:
+        cache_key = None
         if file_path is not None:
             try:
                 # 检查是否是FileUploader对象还是字符串路径
                 if hasattr(file_path, 'read'):
                     # 是上传的文件对象
-                    df = pd.read_excel(file_path)
-                    st.sidebar.success(f"文件加载成功！")
+                    raw_bytes = file_path.getvalue() if hasattr(file_path, 'getvalue') else file_path.read()
                 else:
                     # 是文件路径字符串
-                    df = pd.read_excel(file_path)
+                    with open(file_path, 'rb') as f:
+                        raw_bytes = f.read()
+
+                # 相同内容的文件直接读取已预处理的缓存
+                cache_key = ingest_cache.content_hash(raw_bytes)
+                cached_df = ingest_cache.load_cached(cache_key)
+                if cached_df is not None:
+                    cached_df.attrs['ingest_cache'] = 'hit'
+                    cached_df.attrs['dataset_key'] = cache_key
+                    return cached_df
+
+                df = read_workbook(raw_bytes, getattr(file_path, 'name', file_path), streaming)
+                if hasattr(file_path, 'read'):
+                    st.sidebar.success(f"文件加载成功！")
             except Exception as e:
                 st.error(f"文件加载失败: {str(e)}。使用示例数据进行演示。")
+                cache_key = None
                 df = load_sample_data()
         else:
             df = load_sample_data()
 
         # 数据预处理
-        df['销售额'] = df['单价（箱）'] * df['数量（箱）']
-
-        # 确保发运月份是日期类型
-        try:
-            df['发运月份'] = pd.to_datetime(df['发运月份'])
-        except Exception as e:
-            st.info(f"发运月份转换为日期类型时出错。原因：{str(e)}。将保持原格式。")
+        df = preprocess(df, on_warning=st.info)
 
-        # 添加简化产品名称列
-        df['简化产品名称'] = df.apply(lambda row: get_simplified_product_name(row['产品代码'], row['产品名称']), axis=1)
+        # 写入摄取缓存，供之后加载相同内容时使用
+        if cache_key is not None:
+            ingest_cache.store(cache_key, df)
+            df.attrs['ingest_cache'] = 'miss'
+        df.attrs['dataset_key'] = cache_key or 'sample'
 
         return df
     except Exception as e:
@@ -210,33 +474,7 @@ def load_data(file_path=None):
         return load_sample_data()
 
 
-# 创建产品代码到简化产品名称的映射函数 (修复版)
-def get_simplified_product_name(product_code, product_name):
-    try:
-        # 从产品名称中提取关键部分
-        if '口力' in product_name:
-            # 提取"口力"之后的产品类型
-            name_parts = product_name.split('口力')[1].split('-')[0].strip()
-            # 进一步简化，只保留主要部分（去掉规格和包装形式）
-            for suffix in ['G分享装袋装', 'G盒装', 'G袋装', 'KG迷你包', 'KG随手包']:
-                name_parts = name_parts.split(suffix)[0]
-
-            # 去掉可能的数字和单位
-            import re
-            simple_name = re.sub(r'\d+\w*\s*', '', name_parts).strip()
-
-            # 始终包含产品代码以确保唯一性
-            return f"{simple_name} ({product_code})"
-        else:
-            # 如果无法提取，则返回产品代码
-            return product_code
-    except Exception as e:
-        # 出错时返回产品代码
-        return product_code
-
-
 # 创建示例数据（以防用户没有上传文件）
-@st.cache_data
 def load_sample_data():
     # 创建简化版示例数据
     data = {
@@ -271,23 +509,170 @@ def load_sample_data():
     return df
 
 
+# 将上传的文件按月追加到本地数据集（已导入过的文件直接跳过）
+def ingest_into_dataset(store, files, streaming=False):
+    for uploaded in files:
+        raw_bytes = uploaded.getvalue()
+        source_hash = ingest_cache.content_hash(raw_bytes)
+        if store.has_source(source_hash):
+            continue
+        try:
+            file_df = preprocess(read_workbook(raw_bytes, uploaded.name, streaming), on_warning=st.sidebar.info)
+            months = store.ingest(file_df, source_hash, uploaded.name)
+            st.sidebar.success(f"{uploaded.name} 已导入月份: {', '.join(months)}")
+        except Exception as e:
+            st.sidebar.error(f"导入文件 {uploaded.name} 失败: {str(e)}")
+
+
+# 按月数据集的查询后端：界面上的选项 -> 数据库引擎（None表示在内存中用pandas查询，DuckDB需要单独安装）
+QUERY_BACKENDS = {'pandas（内存）': None, 'SQLite': 'sqlite', 'DuckDB': 'duckdb'}
+QUERY_BACKENDS = {label: engine for label, engine in QUERY_BACKENDS.items() if engine is None or engine in SQL_ENGINES}
+
+
+# 读取数据集的全部分区（按数据集版本在进程内共享，其他服务进程通过共享的Arrow文件读取同一版本）
+# 注册表中还有同一数据集之前的版本时在其基础上读取，只读取新增或替换的分区
+def load_dataset(store_root, version):
+    def load():
+        previous = get_dataset_registry().latest(lambda frame: frame.attrs.get('dataset_root') == store_root)
+        df = DatasetStore(store_root).load_frame(previous[0] if previous is not None else None)
+        df.attrs['dataset_key'] = f"dataset:{version}"
+        return df
+
+    return shared_dataset(f"dataset:{version}",
+                          lambda: mapped_dataset(dataset_slot(store_root), f"dataset:{version}", load))
+
+
+# 数据集的事实表由各月分区的聚合结果直接拼接，无需重新扫描明细；新版本只读取变化的分区的聚合结果
+def get_dataset_cube(dataset_key, store_root):
+    return dataset_derived(dataset_key, 'sales_cube', lambda: SalesCube(DatasetStore(store_root).load_fact()),
+                           store_root, lambda cube, previous: SalesCube(DatasetStore(store_root).load_fact(cube.fact)))
+
+
+# SQL后端：明细最多载入 SQL_DETAIL_MAX_ROWS 行（超过时均匀抽样，按数据集版本在进程内共享），汇总查询在数据库中执行
+def load_sql_dataset(store_root, engine, version):
+    def load():
+        store = SqlStore(store_root, engine)
+        df = store.load_frame(limit=SQL_DETAIL_MAX_ROWS)
+        df.attrs['dataset_key'] = f"sql:{engine}:{version}"
+        df.attrs['dataset_rows'] = store.row_count
+        return df
+
+    return shared_dataset(f"sql:{engine}:{version}", load)
+
+
+# SQL后端的筛选器取值和产品维度表来自数据库中的完整数据，每个数据集只查询一次
+def get_sql_dimensions(dataset_key, store):
+    def build():
+        values = {col: store.dimension_values(col) for col in ['所属区域', '客户简称', '申请人']}
+        return values, store.product_dimension()
+    return dataset_derived(dataset_key, 'sql_dimensions', build)
+
+
+# SQL后端按筛选条件下推取出的明细缓存的最大数量：每份最多 SQL_DETAIL_MAX_ROWS 行，只保留最近的少数几份
+SQL_DETAIL_CACHE_ENTRIES = 2
+# 只使用汇总查询的页面（查询全部在数据库中执行），SQL后端打开这些页面时不载入筛选后的明细
+SQL_AGGREGATE_ONLY_PAGES = {"市场渗透率"}
+
+
+# SQL后端按筛选条件下推取出的明细（同样最多 SQL_DETAIL_MAX_ROWS 行，超过时均匀抽样）
+@st.cache_resource(max_entries=SQL_DETAIL_CACHE_ENTRIES)
+def get_sql_detail(filter_key, _store, clauses):
+    return _store.load_frame(clauses, limit=SQL_DETAIL_MAX_ROWS)
+
+
+# 性能诊断（在侧边栏底部开启），开启后记录本次运行各阶段的耗时、行数和内存峰值
+profiler = Profiler(enabled=st.session_state.get('profiling_enabled', False))
+
 # 侧边栏 - 上传文件区域
 st.sidebar.markdown('<div class="sidebar-header">数据导入</div>', unsafe_allow_html=True)
-uploaded_file = st.sidebar.file_uploader("上传Excel销售数据文件", type=["xlsx", "xls"])
+data_mode = st.sidebar.radio(
+    "数据模式",
+    ["单个文件", "按月数据集"],
+    horizontal=True,
+    help="按月数据集模式会在本地保存已导入的月份，新文件只追加对应月份的分区；重新上传某月数据会替换该月分区。"
+)
+if data_mode == "按月数据集":
+    uploaded_file = None
+    uploaded_files = st.sidebar.file_uploader(
+        "上传按月的Excel销售数据文件（可多选）", type=["xlsx", "xls"], accept_multiple_files=True
+    )
+    query_backend_label = st.sidebar.radio(
+        "查询后端",
+        list(QUERY_BACKENDS),
+        horizontal=True,
+        help=f"SQL后端把数据集保存在本地数据库文件中，筛选和分组汇总在数据库内执行，只取回汇总结果；"
+             f"明细类分析（散点图、客户细分、产品组合和原始数据）最多载入{SQL_DETAIL_MAX_ROWS:,}行，超过时均匀抽样；"
+             "导出直接从数据库读取完整数据。"
+    )
+    query_backend = QUERY_BACKENDS[query_backend_label]
+else:
+    uploaded_file = st.sidebar.file_uploader("上传Excel销售数据文件", type=["xlsx", "xls"])
+    uploaded_files = []
+    query_backend = None
+streaming_mode = st.sidebar.checkbox(
+    "流式读取（适用于超大文件）",
+    value=False,
+    help=f"逐块解析工作表以限制内存占用。超过{STREAMING_THRESHOLD_BYTES // 1024 // 1024}MB的xlsx文件会自动使用流式读取。"
+)
 
 # 加载数据
-try:
-    if uploaded_file is not None:
-        df = load_data(uploaded_file)
-        st.sidebar.success(f"已成功加载文件: {uploaded_file.name}")
-    else:
-        # 使用示例数据进行演示
-        df = load_data()
-        st.sidebar.info("正在使用示例数据。请上传您的数据文件获取真实分析。")
-except Exception as e:
-    st.error(f"加载数据时出错: {str(e)}")
-    df = load_sample_data()
-    st.sidebar.warning("由于错误，使用示例数据进行演示。请检查您的数据文件格式。")
+with profiler.span('load_data') as load_span:
+    dataset_store = None
+    sql_store = None
+    try:
+        if data_mode == "按月数据集":
+            dataset_store = DatasetStore() if query_backend is None else SqlStore(engine=query_backend)
+            ingest_into_dataset(dataset_store, uploaded_files, streaming=streaming_mode)
+            if not dataset_store.months():
+                dataset_store = None
+
+        if dataset_store is not None:
+            if isinstance(dataset_store, SqlStore):
+                sql_store = dataset_store
+                df = load_sql_dataset(sql_store.root, sql_store.engine, sql_store.version)
+                st.sidebar.success(f"已加载数据集（{query_backend_label}）: {len(sql_store.months())}个月份，"
+                                   f"共{df.attrs['dataset_rows']}行")
+                if df.attrs['dataset_rows'] > len(df):
+                    st.sidebar.caption(f"明细类分析基于均匀抽样的{len(df):,}行（筛选后按条件重新抽样），"
+                                       "汇总指标、图表和导出在数据库中按完整数据计算。")
+            else:
+                df = load_dataset(dataset_store.root, dataset_store.version)
+                st.sidebar.success(f"已加载数据集: {len(dataset_store.months())}个月份，共{len(df)}行")
+            with st.sidebar.expander("数据集分区"):
+                st.dataframe(pd.DataFrame([
+                    {'月份': month, '行数': info['rows'], '来源文件': info['source_name'], '导入时间': info['ingested_at']}
+                    for month, info in sorted(dataset_store.partitions.items())
+                ]), hide_index=True)
+                st.caption("导入新文件时只解析并写入该文件涉及的月份分区；数据集变化后，只读取新增或替换的分区，"
+                           "筛选索引、汇总和渗透率草图也只为这些分区计算（客户分群需在全部客户上重新拟合）。")
+                # 数据集目录由所有会话和服务进程共享，清空会影响所有用户，需要先确认
+                confirm_clear = st.checkbox("确认清空（数据集由所有用户共享，清空后需要重新导入）", key='confirm_clear_dataset')
+                if st.button("清空数据集", disabled=not confirm_clear):
+                    dataset_store.clear()
+                    release_shared_dataset()
+                    del st.session_state['confirm_clear_dataset']
+                    st.rerun()
+        elif uploaded_file is not None:
+            df = load_data(uploaded_file, streaming=streaming_mode)
+            st.sidebar.success(f"已成功加载文件: {uploaded_file.name}")
+            cache_status = df.attrs.get('ingest_cache')
+            if df.attrs.get('arrow_store') == 'hit':
+                st.sidebar.caption("共享数据文件：命中（内存映射其他进程已加载的数据）")
+            elif cache_status == 'hit':
+                st.sidebar.caption("摄取缓存：命中（直接读取已预处理的数据）")
+            elif cache_status == 'miss':
+                st.sidebar.caption("摄取缓存：未命中（已解析Excel并写入缓存）")
+        else:
+            # 使用示例数据进行演示
+            df = load_data()
+            st.sidebar.info("正在使用示例数据。请上传您的数据文件获取真实分析。")
+    except Exception as e:
+        st.error(f"加载数据时出错: {str(e)}")
+        dataset_store = None
+        sql_store = None
+        df = load_sample_data()
+        st.sidebar.warning("由于错误，使用示例数据进行演示。请检查您的数据文件格式。")
+    load_span.rows_out = len(df)
 
 # 显示数据预览
 with st.expander("数据预览", expanded=False):
@@ -295,31 +680,63 @@ with st.expander("数据预览", expanded=False):
     st.dataframe(df.head())
     st.write(f"总行数: {len(df)}")
     st.write(f"列名: {', '.join(df.columns)}")
+    if 'memory_before' in df.attrs:
+        st.write(f"内存占用: 压缩前 {df.attrs['memory_before'] / 1024 ** 2:.2f} MB，"
+                 f"压缩后 {df.attrs['memory_after'] / 1024 ** 2:.2f} MB")
+
+# 共现矩阵表格以稠密形式展示的最大产品数
+MAX_DENSE_CO_OCCURRENCE_ITEMS = 200
+
+# 关联规则表格最多展示的行数
+MAX_DISPLAY_RULES = 200
+
+# 关联规则的默认购物篮、最小支持度（%）和最小置信度（%），后台预计算按默认值生成规则
+RULE_BASKET_MODES = ["客户", "客户×月份"]
+RULE_DEFAULT_MIN_SUPPORT = 1.0
+RULE_DEFAULT_MIN_CONFIDENCE = 20
 
 # 定义新品产品代码
-new_products = ['F0110C', 'F0183F', 'F01K8A', 'F0183K', 'F0101P']
+new_products = NEW_PRODUCTS
 new_products_df = df[df['产品代码'].isin(new_products)]
 
-# 创建产品代码到简化名称的映射字典（用于图表显示）
-product_name_mapping = {
-    code: df[df['产品代码'] == code]['简化产品名称'].iloc[0] if len(df[df['产品代码'] == code]) > 0 else code
-    for code in df['产品代码'].unique()
-}
+dataset_key = df.attrs.get('dataset_key', 'sample')
+# 数据集的总行数（SQL后端只载入了部分明细时以数据库中的行数为准）
+dataset_rows = df.attrs.get('dataset_rows', len(df))
+# 市场渗透率页面默认使用草图估计去重客户数的条件：数据量较大且去重计数需要扫描内存中的明细
+# （SQL后端的精确去重计数下推到数据库执行，默认使用精确计数）
+sketch_by_default = sql_store is None and dataset_rows >= SKETCH_DEFAULT_MIN_ROWS
+
+# 产品代码到简化名称的映射（用于筛选器和图表显示），来自每个数据集只构建一次的产品维度表
+with profiler.span('product_dimension', rows_in=dataset_rows) as dimension_span:
+    if sql_store is not None:
+        dimension_values, products = get_sql_dimensions(dataset_key, sql_store)
+    else:
+        dimension_values = None
+        products = get_product_dimension(dataset_key, df)
+    product_name_mapping = products['简化产品名称'].to_dict()
+    dimension_span.rows_out = len(products)
+
+
+# 筛选器的取值列表
+def filter_options(col):
+    if dimension_values is not None:
+        return dimension_values[col]
+    return sorted(df[col].astype(str).unique())
+
 
 # 侧边栏 - 筛选器
 st.sidebar.markdown('<div class="sidebar-header">筛选数据</div>', unsafe_allow_html=True)
 
 # 区域筛选器
-all_regions = sorted(df['所属区域'].astype(str).unique())
+all_regions = filter_options('所属区域')
 selected_regions = st.sidebar.multiselect("选择区域", all_regions, default=all_regions)
 
 # 客户筛选器
-all_customers = sorted(df['客户简称'].astype(str).unique())
+all_customers = filter_options('客户简称')
 selected_customers = st.sidebar.multiselect("选择客户", all_customers, default=[])
 
 # 产品代码筛选器
-all_products = sorted(df['产品代码'].astype(str).unique())
-product_options = [(code, product_name_mapping[code]) for code in all_products]
+all_products = products.index.tolist()
 selected_products = st.sidebar.multiselect(
     "选择产品",
     options=all_products,
@@ -328,45 +745,183 @@ selected_products = st.sidebar.multiselect(
 )
 
 # 申请人筛选器
-all_applicants = sorted(df['申请人'].astype(str).unique())
+all_applicants = filter_options('申请人')
 selected_applicants = st.sidebar.multiselect("选择申请人", all_applicants, default=[])
 
-# 应用筛选条件
-filtered_df = df.copy()
+filter_selections = [
+    ('所属区域', selected_regions),
+    ('客户简称', selected_customers),
+    ('产品代码', selected_products),
+    ('申请人', selected_applicants),
+]
+
+
+# 筛选条件签名：数据集相同且筛选条件相同时，各页面的中间结果可直接复用
+def make_filter_key(selections):
+    return dataset_key, tuple((col, tuple(sorted(map(str, selected)))) for col, selected in selections)
+
+
+filter_key = make_filter_key(filter_selections)
+# 不筛选时（区域全选、其余筛选器为空，即各筛选器的默认值）的签名，后台预计算的结果按它写入缓存
+default_filter_key = make_filter_key([(col, all_regions if col == '所属区域' else [])
+                                      for col, _ in filter_selections])
+
+if sql_store is not None:
+    # SQL后端：筛选条件下推到数据库（回退规则相同），只取回筛选后的明细
+    with profiler.span('filter', rows_in=dataset_rows) as filter_span:
+        try:
+            sql_clauses = sql_store.resolve(filter_selections, on_empty=warn_empty_filter)
+        except Exception as e:
+            st.error(f"筛选数据时出错: {str(e)}")
+            sql_clauses = []
+        if st.session_state.get('active_page') in SQL_AGGREGATE_ONLY_PAGES:
+            # 当前页面用不到明细，只保留列结构和匹配的行数
+            filtered_df = df.iloc[:0]
+            filtered_df.attrs = {**df.attrs, 'population_rows': sql_store.count_rows(sql_clauses)}
+        elif sql_clauses:
+            filtered_df = get_sql_detail(filter_key, sql_store, tuple(sql_clauses))
+        else:
+            filtered_df = df.copy(deep=False)
+        filtered_new_products_df = filtered_df[filtered_df['产品代码'].isin(new_products).to_numpy()]
+        filter_span.rows_out = len(filtered_df)
+    # 没有生效的筛选条件时使用整个数据集的视图
+    filtered_positions = sql_clauses or None
+else:
+    # 应用筛选条件（各维度索引求交后一次性取出数据）
+    with profiler.span('filter_index'):
+        filter_engine = get_filter_engine(dataset_key, df)
+    with profiler.span('filter', rows_in=len(df)) as filter_span:
+        try:
+            filtered_positions = filter_engine.select(filter_selections, on_empty=warn_empty_filter)
+        except Exception as e:
+            st.error(f"筛选数据时出错: {str(e)}")
+            filtered_positions = None
+        filtered_df = FilterEngine.take(df, filtered_positions)
+
+        # 检查筛选后是否还有数据
+        if filtered_df.empty:
+            st.error("应用所有筛选条件后没有匹配的数据。请调整筛选条件。")
+            # 重置为原始数据
+            filtered_positions = None
+            filtered_df = FilterEngine.take(df, filtered_positions)
+            st.warning("已重置为原始数据。")
+
+        # 根据筛选后的数据筛选新品数据
+        filtered_new_products_df = FilterEngine.take(
+            df, filter_engine.restrict(filtered_positions, '产品代码', new_products))
+        filter_span.rows_out = len(filtered_df)
+
+# 筛选后的明细行数：SQL后端超过明细载入上限时 filtered_df 只是均匀抽样的样本
+detail_rows = filtered_df.attrs.get('population_rows', len(filtered_df))
+
+
+# 明细类分析（散点图、客户细分、产品组合、明细表格）基于样本时的提示；汇总指标、图表和导出使用完整数据
+def warn_sampled_detail():
+    if detail_rows > len(filtered_df):
+        st.warning(f"当前筛选共{detail_rows:,}行，超过明细载入上限，以下分析基于均匀抽样的{len(filtered_df):,}行"
+                   "（按客户、产品汇总的销售额等为样本内的数值）。")
+
+
+# 汇总类查询从预聚合事实表中获取（SQL后端在数据库中查询），筛选条件与原始数据保持一致
+with profiler.span('cube') as cube_span:
+    if sql_store is not None:
+        sales_cube = sql_store.cube()
+    elif dataset_store is not None:
+        sales_cube = get_dataset_cube(dataset_key, dataset_store.root)
+    else:
+        sales_cube = get_sales_cube(dataset_key, df)
+    if filtered_positions is None:
+        filtered_cube = sales_cube.view()
+    else:
+        filtered_cube = sales_cube.filter(filter_selections)
+    filtered_new_products_cube = filtered_cube.restrict('产品代码', new_products)
+    cube_span.rows_out = len(filtered_cube)
+
+# 各分析页面封装为独立函数，只有当前选中的页面会被计算和渲染
+chart_cache = get_chart_cache()
+
+
+# 按筛选条件签名缓存图表，相同数据集和筛选条件下不再重复生成
+def show_chart(chart_id, build):
+    with profiler.span(f"chart:{chart_id}"):
+        st.plotly_chart(chart_cache.figure((filter_key, chart_id), build), use_container_width=True)
+
+
+# 各页面默认视图（不筛选、各选项为默认值）最耗时的计算 [(页面, 任务名称, 函数)]，结果写入页面使用的同一缓存
+# 客户细分默认按新品占比分档，RFM聚类只在切换到该方式时才拟合
+def precompute_tasks():
+    unfiltered_df = df.copy(deep=False)
+    unfiltered_new_products_df = new_products_df.copy(deep=False)
+    unfiltered_cube = sales_cube.view()
+    unfiltered_new_products_cube = unfiltered_cube.restrict('产品代码', new_products)
+    use_sketches = sketch_by_default
+
+    def customer_features():
+        chart_cache.frame((default_filter_key, 'customer_features'),
+                          lambda: customer_segments.customer_features(unfiltered_df, unfiltered_new_products_df))
+
+    def product_baskets():
+        co_occurrence = get_product_baskets(default_filter_key, unfiltered_df)
+        get_association_rules(default_filter_key, RULE_BASKET_MODES[0], RULE_DEFAULT_MIN_SUPPORT / 100,
+                              RULE_DEFAULT_MIN_CONFIDENCE / 100, unfiltered_df, co_occurrence)
+
+    def penetration(cumulative):
+        def compute():
+            sketches = get_penetration_sketches(dataset_key, sales_cube) if use_sketches else None
+            chart_cache.frame(
+                (default_filter_key, penetration_frame_id('sketch' if use_sketches else 'exact', cumulative)),
+                lambda: penetration_by_month(unfiltered_cube, unfiltered_new_products_cube, sketches,
+                                             all_regions if use_sketches else None, cumulative))
+        return compute
+
+    tasks = [
+        ("客户细分", 'customer_features', customer_features),
+        ("市场渗透率", 'monthly_penetration', penetration(False)),
+        ("市场渗透率", 'cumulative_penetration', penetration(True)),
+    ]
+    if unfiltered_df['客户简称'].nunique() > 1 and unfiltered_df['产品代码'].nunique() > 1:
+        tasks.append(("产品组合", 'product_baskets', product_baskets))
+
+    # 后台线程调用缓存函数时使用提交任务的会话的运行上下文
+    script_ctx = get_script_run_ctx()
+
+    def with_script_ctx(func):
+        def run():
+            add_script_run_ctx(threading.current_thread(), script_ctx)
+            try:
+                func()
+            finally:
+                add_script_run_ctx(threading.current_thread(), None)
+        return run
 
-if selected_regions:
-    filtered_df = safe_filter(filtered_df, lambda d: d[d['所属区域'].isin(selected_regions)])
+    return [(page, name, with_script_ctx(func)) for page, name, func in tasks]
 
-if selected_customers:
-    filtered_df = safe_filter(filtered_df, lambda d: d[d['客户简称'].isin(selected_customers)])
 
-if selected_products:
-    filtered_df = safe_filter(filtered_df, lambda d: d[d['产品代码'].isin(selected_products)])
+precomputer = get_precomputer()
 
-if selected_applicants:
-    filtered_df = safe_filter(filtered_df, lambda d: d[d['申请人'].isin(selected_applicants)])
 
-# 检查筛选后是否还有数据
-if filtered_df.empty:
-    st.error("应用所有筛选条件后没有匹配的数据。请调整筛选条件。")
-    # 重置为原始数据
-    filtered_df = df.copy()
-    st.warning("已重置为原始数据。")
+# 页面的预计算任务未完成时显示进度并等待（只有不筛选时页面才会用到预计算的结果）
+def wait_for_precompute(page):
+    if filter_key != default_filter_key or precomputer.ready(dataset_key, page):
+        return
+    progress_bar = st.progress(0.0, text=f"正在后台准备{page}的数据...")
 
-# 根据筛选后的数据筛选新品数据
-filtered_new_products_df = filtered_df[filtered_df['产品代码'].isin(new_products)]
+    def update(done, total):
+        progress_bar.progress(done / total, text=f"正在后台准备{page}的数据... {done}/{total}")
 
-# 导航栏
-st.markdown('<div class="sub-header">导航</div>', unsafe_allow_html=True)
-tabs = st.tabs(["销售概览", "新品分析", "客户细分", "产品组合", "市场渗透率"])
+    with profiler.span(f"precompute_wait:{page}"):
+        precomputer.wait(dataset_key, page, on_progress=update)
+    progress_bar.empty()
 
-with tabs[0]:  # 销售概览
+
+# 销售概览
+def render_sales_overview():
     # KPI指标行
     st.markdown('<div class="sub-header">🔑 关键绩效指标</div>', unsafe_allow_html=True)
     col1, col2, col3, col4 = st.columns(4)
 
     try:
-        total_sales = filtered_df['销售额'].sum()
+        total_sales = filtered_cube.total('销售额')
         with col1:
             st.markdown(f"""
             <div class="card">
@@ -375,7 +930,7 @@ with tabs[0]:  # 销售概览
             </div>
             """, unsafe_allow_html=True)
 
-        total_customers = filtered_df['客户简称'].nunique()
+        total_customers = filtered_cube.nunique('客户简称')
         with col2:
             st.markdown(f"""
             <div class="card">
@@ -384,7 +939,7 @@ with tabs[0]:  # 销售概览
             </div>
             """, unsafe_allow_html=True)
 
-        total_products = filtered_df['产品代码'].nunique()
+        total_products = filtered_cube.nunique('产品代码')
         with col3:
             st.markdown(f"""
             <div class="card">
@@ -393,7 +948,7 @@ with tabs[0]:  # 销售概览
             </div>
             """, unsafe_allow_html=True)
 
-        avg_price = filtered_df['单价（箱）'].mean()
+        avg_price = filtered_cube.mean_price()
         with col4:
             st.markdown(f"""
             <div class="card">
@@ -410,60 +965,66 @@ with tabs[0]:  # 销售概览
 
     try:
         # 区域销售额柱状图
-        region_sales = filtered_df.groupby('所属区域')['销售额'].sum().reset_index()
+        region_sales = filtered_cube.sum_by('所属区域')
 
         if not region_sales.empty:
             with col1:
-                fig_region = px.bar(
-                    region_sales,
-                    x='所属区域',
-                    y='销售额',
-                    color='所属区域',
-                    title='各区域销售额',
-                    labels={'销售额': '销售额 (元)', '所属区域': '区域'},
-                    height=500,
-                    color_discrete_sequence=px.colors.qualitative.Bold
-                )
-                # 添加文本标签
-                fig_region.update_traces(
-                    text=[format_yuan(val) for val in region_sales['销售额']],
-                    textposition='outside',
-                    textfont=dict(size=14)
-                )
-                fig_region.update_layout(
-                    xaxis_title=dict(text="区域", font=dict(size=16)),
-                    yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
-                    xaxis_tickfont=dict(size=14),
-                    yaxis_tickfont=dict(size=14),
-                    margin=dict(t=60, b=80, l=80, r=60),
-                    plot_bgcolor='rgba(0,0,0,0)'
-                )
-                # 确保Y轴有足够空间显示数据标签
-                fig_region.update_yaxes(
-                    range=[0, region_sales['销售额'].max() * 1.2]
-                )
-                st.plotly_chart(fig_region, use_container_width=True)
+                def build_fig_region():
+                    fig_region = px.bar(
+                        region_sales,
+                        x='所属区域',
+                        y='销售额',
+                        color='所属区域',
+                        title='各区域销售额',
+                        labels={'销售额': '销售额 (元)', '所属区域': '区域'},
+                        height=500,
+                        color_discrete_sequence=px.colors.qualitative.Bold
+                    )
+                    # 添加文本标签
+                    fig_region.update_traces(
+                        text=[format_yuan(val) for val in region_sales['销售额']],
+                        textposition='outside',
+                        textfont=dict(size=14)
+                    )
+                    fig_region.update_layout(
+                        xaxis_title=dict(text="区域", font=dict(size=16)),
+                        yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
+                        xaxis_tickfont=dict(size=14),
+                        yaxis_tickfont=dict(size=14),
+                        margin=dict(t=60, b=80, l=80, r=60),
+                        plot_bgcolor='rgba(0,0,0,0)'
+                    )
+                    # 确保Y轴有足够空间显示数据标签
+                    fig_region.update_yaxes(
+                        range=[0, region_sales['销售额'].max() * 1.2]
+                    )
+                    return fig_region
+
+                show_chart('region_sales', build_fig_region)
 
             with col2:
                 # 区域销售占比饼图
-                fig_region_pie = px.pie(
-                    region_sales,
-                    values='销售额',
-                    names='所属区域',
-                    title='各区域销售占比',
-                    hole=0.4,
-                    color_discrete_sequence=px.colors.qualitative.Bold
-                )
-                fig_region_pie.update_traces(
-                    textposition='inside',
-                    textinfo='percent+label',
-                    textfont=dict(size=14)
-                )
-                fig_region_pie.update_layout(
-                    margin=dict(t=60, b=60, l=60, r=60),
-                    font=dict(size=14)
-                )
-                st.plotly_chart(fig_region_pie, use_container_width=True)
+                def build_fig_region_pie():
+                    fig_region_pie = px.pie(
+                        region_sales,
+                        values='销售额',
+                        names='所属区域',
+                        title='各区域销售占比',
+                        hole=0.4,
+                        color_discrete_sequence=px.colors.qualitative.Bold
+                    )
+                    fig_region_pie.update_traces(
+                        textposition='inside',
+                        textinfo='percent+label',
+                        textfont=dict(size=14)
+                    )
+                    fig_region_pie.update_layout(
+                        margin=dict(t=60, b=60, l=60, r=60),
+                        font=dict(size=14)
+                    )
+                    return fig_region_pie
+
+                show_chart('region_share', build_fig_region_pie)
         else:
             st.warning("没有足够的区域销售数据来创建图表。")
     except Exception as e:
@@ -473,90 +1034,132 @@ with tabs[0]:  # 销售概览
     st.markdown('<div class="sub-header section-gap">📦 产品销售分析</div>', unsafe_allow_html=True)
 
 
-    # 提取包装类型
-    def extract_packaging(product_name):
-        try:
-            if '袋装' in product_name:
-                return '袋装'
-            elif '盒装' in product_name:
-                return '盒装'
-            elif '随手包' in product_name:
-                return '随手包'
-            elif '迷你包' in product_name:
-                return '迷你包'
-            elif '分享装' in product_name:
-                return '分享装'
-            else:
-                return '其他'
-        except:
-            return '其他'
-
-
     try:
-        filtered_df['包装类型'] = filtered_df['产品名称'].apply(extract_packaging)
-        packaging_sales = filtered_df.groupby('包装类型')['销售额'].sum().reset_index()
+        packaging_sales = filtered_cube.sum_by('包装类型')
 
         col1, col2 = st.columns(2)
 
         if not packaging_sales.empty:
             with col1:
                 # 包装类型销售额柱状图
-                fig_packaging = px.bar(
-                    packaging_sales.sort_values(by='销售额', ascending=False),
-                    x='包装类型',
-                    y='销售额',
-                    color='包装类型',
-                    title='不同包装类型销售额',
-                    labels={'销售额': '销售额 (元)', '包装类型': '包装类型'},
-                    height=500
-                )
-                # 添加文本标签
-                fig_packaging.update_traces(
-                    text=[format_yuan(val) for val in packaging_sales['销售额']],
-                    textposition='outside',
-                    textfont=dict(size=14)
-                )
-                fig_packaging.update_layout(
-                    xaxis_title=dict(text="包装类型", font=dict(size=16)),
-                    yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
-                    xaxis_tickfont=dict(size=14),
-                    yaxis_tickfont=dict(size=14),
-                    margin=dict(t=60, b=80, l=80, r=60),
-                    plot_bgcolor='rgba(0,0,0,0)'
-                )
-                # 确保Y轴有足够空间显示数据标签
-                fig_packaging.update_yaxes(
-                    range=[0, packaging_sales['销售额'].max() * 1.2]
-                )
-                st.plotly_chart(fig_packaging, use_container_width=True)
+                def build_fig_packaging():
+                    fig_packaging = px.bar(
+                        packaging_sales.sort_values(by='销售额', ascending=False),
+                        x='包装类型',
+                        y='销售额',
+                        color='包装类型',
+                        title='不同包装类型销售额',
+                        labels={'销售额': '销售额 (元)', '包装类型': '包装类型'},
+                        height=500
+                    )
+                    # 添加文本标签
+                    fig_packaging.update_traces(
+                        text=[format_yuan(val) for val in packaging_sales['销售额']],
+                        textposition='outside',
+                        textfont=dict(size=14)
+                    )
+                    fig_packaging.update_layout(
+                        xaxis_title=dict(text="包装类型", font=dict(size=16)),
+                        yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
+                        xaxis_tickfont=dict(size=14),
+                        yaxis_tickfont=dict(size=14),
+                        margin=dict(t=60, b=80, l=80, r=60),
+                        plot_bgcolor='rgba(0,0,0,0)'
+                    )
+                    # 确保Y轴有足够空间显示数据标签
+                    fig_packaging.update_yaxes(
+                        range=[0, packaging_sales['销售额'].max() * 1.2]
+                    )
+                    return fig_packaging
+
+                show_chart('packaging_sales', build_fig_packaging)
 
         with col2:
-            # 价格-销量散点图
+            # 价格-销量散点图：行数较多时改用WebGL，行数很大时在服务端按价格×数量分箱汇总后再绘制
             try:
-                fig_price_qty = px.scatter(
-                    filtered_df,
-                    x='单价（箱）',
-                    y='数量（箱）',
-                    size='销售额',
-                    color='所属区域',
-                    hover_name='简化产品名称',  # 使用简化产品名称
-                    title='价格与销售数量关系',
-                    labels={'单价（箱）': '单价 (元/箱)', '数量（箱）': '销售数量 (箱)'},
-                    height=500
+                requested_mode = st.radio(
+                    "散点图渲染方式", list(SCATTER_MODES), horizontal=True, key="price_qty_render_mode",
+                    help=f"自动：不足{SCATTER_WEBGL_MIN_ROWS:,}行用SVG，{SCATTER_DENSITY_MIN_ROWS:,}行及以上按网格汇总，其余使用WebGL。"
                 )
+                warn_sampled_detail()
+                price_qty_mode = scatter_mode(len(filtered_df), SCATTER_MODES[requested_mode])
+                price_qty_columns = ['单价（箱）', '数量（箱）', '销售额', '所属区域', '简化产品名称']
+
+                def build_fig_price_qty():
+                    if price_qty_mode == 'density':
+                        fig_price_qty = px.scatter(
+                            decategorize(binned_density(filtered_df, '单价（箱）', '数量（箱）', '销售额', '所属区域')),
+                            x='单价（箱）',
+                            y='数量（箱）',
+                            size='销售额',
+                            color='所属区域',
+                            hover_data={'行数': ':,', '销售额': ':,.2f'},
+                            title='价格与销售数量关系（按价格×数量分箱汇总）',
+                            labels={'单价（箱）': '单价 (元/箱)', '数量（箱）': '销售数量 (箱)'},
+                            height=500
+                        )
+                    else:
+                        fig_price_qty = px.scatter(
+                            decategorize(filtered_df[price_qty_columns]),
+                            x='单价（箱）',
+                            y='数量（箱）',
+                            size='销售额',
+                            color='所属区域',
+                            hover_name='简化产品名称',  # 使用简化产品名称
+                            title='价格与销售数量关系',
+                            labels={'单价（箱）': '单价 (元/箱)', '数量（箱）': '销售数量 (箱)'},
+                            height=500,
+                            render_mode='webgl' if price_qty_mode == 'webgl' else 'svg'
+                        )
+
+                    # 添加趋势线
+                    fig_price_qty.update_layout(
+                        xaxis_title=dict(text="单价 (元/箱)", font=dict(size=16)),
+                        yaxis_title=dict(text="销售数量 (箱)", font=dict(size=16)),
+                        xaxis_tickfont=dict(size=14),
+                        yaxis_tickfont=dict(size=14),
+                        margin=dict(t=60, b=80, l=80, r=60),
+                        plot_bgcolor='rgba(0,0,0,0)'
+                    )
+                    return fig_price_qty
+
+                show_chart(f'price_quantity:{price_qty_mode}', build_fig_price_qty)
+                if price_qty_mode == 'density':
+                    st.caption(f"共{len(filtered_df):,}行，已按单价×数量分成{SCATTER_DENSITY_BINS}×{SCATTER_DENSITY_BINS}个格子汇总，"
+                               "气泡大小为格子内的销售额合计。")
+            except Exception as e:
+                st.error(f"创建价格-销量散点图时出错: {str(e)}")
 
-                # 添加趋势线
-                fig_price_qty.update_layout(
-                    xaxis_title=dict(text="单价 (元/箱)", font=dict(size=16)),
-                    yaxis_title=dict(text="销售数量 (箱)", font=dict(size=16)),
+        # 规格档位销售额（规格档位在加载数据时由产品名称提取）
+        weight_class_sales = filtered_cube.sum_by('规格档位')
+        if not weight_class_sales.empty:
+            weight_class_order = WEIGHT_CLASS_LABELS + [UNKNOWN_ATTRIBUTE]
+
+            def build_fig_weight_class():
+                fig_weight_class = px.bar(
+                    weight_class_sales,
+                    x='规格档位',
+                    y='销售额',
+                    color='规格档位',
+                    category_orders={'规格档位': weight_class_order},
+                    text=[format_yuan(val) for val in weight_class_sales['销售额']],
+                    title='不同规格档位销售额',
+                    labels={'销售额': '销售额 (元)', '规格档位': '规格档位'},
+                    height=450
+                )
+                fig_weight_class.update_traces(textposition='outside', textfont=dict(size=14))
+                fig_weight_class.update_layout(
+                    xaxis_title=dict(text="规格档位", font=dict(size=16)),
+                    yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
                     xaxis_tickfont=dict(size=14),
                     yaxis_tickfont=dict(size=14),
                     margin=dict(t=60, b=80, l=80, r=60),
                     plot_bgcolor='rgba(0,0,0,0)'
                 )
-                st.plotly_chart(fig_price_qty, use_container_width=True)
-            except Exception as e:
-                st.error(f"创建价格-销量散点图时出错: {str(e)}")
+                fig_weight_class.update_yaxes(range=[0, weight_class_sales['销售额'].max() * 1.2])
+                return fig_weight_class
+
+            show_chart('weight_class_sales', build_fig_weight_class)
     except Exception as e:
         st.error(f"创建产品销售分析图表时出错: {str(e)}")
 
@@ -564,37 +1167,40 @@ with tabs[0]:  # 销售概览
     st.markdown('<div class="sub-header section-gap">👨‍💼 申请人销售业绩</div>', unsafe_allow_html=True)
 
     try:
-        applicant_performance = filtered_df.groupby('申请人')['销售额'].sum().sort_values(ascending=False).reset_index()
+        applicant_performance = filtered_cube.sum_by('申请人').sort_values('销售额', ascending=False)
 
         if not applicant_performance.empty:
-            fig_applicant = px.bar(
-                applicant_performance,
-                x='申请人',
-                y='销售额',
-                color='申请人',
-                title='申请人销售业绩排名',
-                labels={'销售额': '销售额 (元)', '申请人': '申请人'},
-                height=500
-            )
-            # 添加文本标签
-            fig_applicant.update_traces(
-                text=[format_yuan(val) for val in applicant_performance['销售额']],
-                textposition='outside',
-                textfont=dict(size=14)
-            )
-            fig_applicant.update_layout(
-                xaxis_title=dict(text="申请人", font=dict(size=16)),
-                yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
-                xaxis_tickfont=dict(size=14),
-                yaxis_tickfont=dict(size=14),
-                margin=dict(t=60, b=80, l=80, r=60),
-                plot_bgcolor='rgba(0,0,0,0)'
-            )
-            # 确保Y轴有足够空间显示数据标签
-            fig_applicant.update_yaxes(
-                range=[0, applicant_performance['销售额'].max() * 1.2]
-            )
-            st.plotly_chart(fig_applicant, use_container_width=True)
+            def build_fig_applicant():
+                fig_applicant = px.bar(
+                    applicant_performance,
+                    x='申请人',
+                    y='销售额',
+                    color='申请人',
+                    title='申请人销售业绩排名',
+                    labels={'销售额': '销售额 (元)', '申请人': '申请人'},
+                    height=500
+                )
+                # 添加文本标签
+                fig_applicant.update_traces(
+                    text=[format_yuan(val) for val in applicant_performance['销售额']],
+                    textposition='outside',
+                    textfont=dict(size=14)
+                )
+                fig_applicant.update_layout(
+                    xaxis_title=dict(text="申请人", font=dict(size=16)),
+                    yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
+                    xaxis_tickfont=dict(size=14),
+                    yaxis_tickfont=dict(size=14),
+                    margin=dict(t=60, b=80, l=80, r=60),
+                    plot_bgcolor='rgba(0,0,0,0)'
+                )
+                # 确保Y轴有足够空间显示数据标签
+                fig_applicant.update_yaxes(
+                    range=[0, applicant_performance['销售额'].max() * 1.2]
+                )
+                return fig_applicant
+
+            show_chart('applicant_sales', build_fig_applicant)
         else:
             st.warning("没有足够的申请人销售数据来创建图表。")
     except Exception as e:
@@ -602,9 +1208,12 @@ with tabs[0]:  # 销售概览
 
     # 原始数据表
     with st.expander("查看筛选后的原始数据"):
+        warn_sampled_detail()
         st.dataframe(filtered_df)
 
-with tabs[1]:  # 新品分析
+
+# 新品分析
+def render_new_products():
     st.markdown('<div class="sub-header">🆕 新品销售分析</div>', unsafe_allow_html=True)
 
     # 检查新品数据是否为空
@@ -615,7 +1224,8 @@ with tabs[1]:  # 新品分析
         col1, col2, col3 = st.columns(3)
 
         try:
-            new_products_sales = filtered_new_products_df['销售额'].sum()
+            new_products_sales = filtered_new_products_cube.total('销售额')
+            total_sales = filtered_cube.total('销售额')
             with col1:
                 st.markdown(f"""
                 <div class="card">
@@ -633,7 +1243,7 @@ with tabs[1]:  # 新品分析
                 </div>
                 """, unsafe_allow_html=True)
 
-            new_products_customers = filtered_new_products_df['客户简称'].nunique()
+            new_products_customers = filtered_new_products_cube.nunique('客户简称')
             with col3:
                 st.markdown(f"""
                 <div class="card">
@@ -649,38 +1259,41 @@ with tabs[1]:  # 新品分析
 
         try:
             # 使用简化产品名称
-            product_sales = filtered_new_products_df.groupby(['产品代码', '简化产品名称'])['销售额'].sum().reset_index()
+            product_sales = filtered_new_products_cube.sum_by(['产品代码', '简化产品名称'])
             product_sales = product_sales.sort_values('销售额', ascending=False)
 
             if not product_sales.empty:
-                fig_product_sales = px.bar(
-                    product_sales,
-                    x='简化产品名称',  # 使用简化产品名称
-                    y='销售额',
-                    color='简化产品名称',  # 使用简化产品名称
-                    title='新品产品销售额对比',
-                    labels={'销售额': '销售额 (元)', '简化产品名称': '产品名称'},
-                    height=500
-                )
-                # 添加文本标签
-                fig_product_sales.update_traces(
-                    text=[format_yuan(val) for val in product_sales['销售额']],
-                    textposition='outside',
-                    textfont=dict(size=14)
-                )
-                fig_product_sales.update_layout(
-                    xaxis_title=dict(text="产品名称", font=dict(size=16)),
-                    yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
-                    xaxis_tickfont=dict(size=14),
-                    yaxis_tickfont=dict(size=14),
-                    margin=dict(t=60, b=80, l=80, r=60),
-                    plot_bgcolor='rgba(0,0,0,0)'
-                )
-                # 确保Y轴有足够空间显示数据标签
-                fig_product_sales.update_yaxes(
-                    range=[0, product_sales['销售额'].max() * 1.2]
-                )
-                st.plotly_chart(fig_product_sales, use_container_width=True)
+                def build_fig_product_sales():
+                    fig_product_sales = px.bar(
+                        product_sales,
+                        x='简化产品名称',  # 使用简化产品名称
+                        y='销售额',
+                        color='简化产品名称',  # 使用简化产品名称
+                        title='新品产品销售额对比',
+                        labels={'销售额': '销售额 (元)', '简化产品名称': '产品名称'},
+                        height=500
+                    )
+                    # 添加文本标签
+                    fig_product_sales.update_traces(
+                        text=[format_yuan(val) for val in product_sales['销售额']],
+                        textposition='outside',
+                        textfont=dict(size=14)
+                    )
+                    fig_product_sales.update_layout(
+                        xaxis_title=dict(text="产品名称", font=dict(size=16)),
+                        yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
+                        xaxis_tickfont=dict(size=14),
+                        yaxis_tickfont=dict(size=14),
+                        margin=dict(t=60, b=80, l=80, r=60),
+                        plot_bgcolor='rgba(0,0,0,0)'
+                    )
+                    # 确保Y轴有足够空间显示数据标签
+                    fig_product_sales.update_yaxes(
+                        range=[0, product_sales['销售额'].max() * 1.2]
+                    )
+                    return fig_product_sales
+
+                show_chart('new_product_sales', build_fig_product_sales)
             else:
                 st.warning("没有足够的新品销售数据来创建图表。")
         except Exception as e:
@@ -693,52 +1306,57 @@ with tabs[1]:  # 新品分析
         try:
             with col1:
                 # 区域新品销售额堆叠柱状图
-                region_product_sales = filtered_new_products_df.groupby(['所属区域', '简化产品名称'])[
-                    '销售额'].sum().reset_index()
+                region_product_sales = filtered_new_products_cube.sum_by(['所属区域', '简化产品名称'])
 
-                if not region_product_sales.empty:
-                    fig_region_product = px.bar(
-                        region_product_sales,
-                        x='所属区域',
-                        y='销售额',
-                        color='简化产品名称',  # 使用简化产品名称
-                        title='各区域新品销售额分布',
-                        labels={'销售额': '销售额 (元)', '所属区域': '区域', '简化产品名称': '产品名称'},
-                        height=500
-                    )
-                    fig_region_product.update_layout(
-                        xaxis_title=dict(text="区域", font=dict(size=16)),
-                        yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
-                        xaxis_tickfont=dict(size=14),
-                        yaxis_tickfont=dict(size=14),
-                        margin=dict(t=60, b=80, l=80, r=60),
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        legend_title="产品名称",
-                        legend_font=dict(size=12)
-                    )
-                    st.plotly_chart(fig_region_product, use_container_width=True)
+                if not region_product_sales.empty:
+                    def build_fig_region_product():
+                        fig_region_product = px.bar(
+                            region_product_sales,
+                            x='所属区域',
+                            y='销售额',
+                            color='简化产品名称',  # 使用简化产品名称
+                            title='各区域新品销售额分布',
+                            labels={'销售额': '销售额 (元)', '所属区域': '区域', '简化产品名称': '产品名称'},
+                            height=500
+                        )
+                        fig_region_product.update_layout(
+                            xaxis_title=dict(text="区域", font=dict(size=16)),
+                            yaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
+                            xaxis_tickfont=dict(size=14),
+                            yaxis_tickfont=dict(size=14),
+                            margin=dict(t=60, b=80, l=80, r=60),
+                            plot_bgcolor='rgba(0,0,0,0)',
+                            legend_title="产品名称",
+                            legend_font=dict(size=12)
+                        )
+                        return fig_region_product
+
+                    show_chart('new_product_region_sales', build_fig_region_product)
                 else:
                     st.warning("没有足够的区域新品销售数据来创建图表。")
 
             with col2:
                 # 新品占比饼图
-                fig_new_vs_old = px.pie(
-                    values=[new_products_sales, total_sales - new_products_sales],
-                    names=['新品', '非新品'],
-                    title='新品销售额占总销售额比例',
-                    hole=0.4,
-                    color_discrete_sequence=['#ff9999', '#66b3ff']
-                )
-                fig_new_vs_old.update_traces(
-                    textposition='inside',
-                    textinfo='percent+label',
-                    textfont=dict(size=14)
-                )
-                fig_new_vs_old.update_layout(
-                    margin=dict(t=60, b=60, l=60, r=60),
-                    font=dict(size=14)
-                )
-                st.plotly_chart(fig_new_vs_old, use_container_width=True)
+                def build_fig_new_vs_old():
+                    fig_new_vs_old = px.pie(
+                        values=[new_products_sales, total_sales - new_products_sales],
+                        names=['新品', '非新品'],
+                        title='新品销售额占总销售额比例',
+                        hole=0.4,
+                        color_discrete_sequence=['#ff9999', '#66b3ff']
+                    )
+                    fig_new_vs_old.update_traces(
+                        textposition='inside',
+                        textinfo='percent+label',
+                        textfont=dict(size=14)
+                    )
+                    fig_new_vs_old.update_layout(
+                        margin=dict(t=60, b=60, l=60, r=60),
+                        font=dict(size=14)
+                    )
+                    return fig_new_vs_old
+
+                show_chart('new_product_share', build_fig_new_vs_old)
         except Exception as e:
             st.error(f"创建区域新品销售分析图表时出错: {str(e)}")
 
@@ -747,11 +1365,10 @@ with tabs[1]:  # 新品分析
 
         try:
             # 计算各区域的新品总销售额
-            region_total_sales = filtered_new_products_df.groupby('所属区域')['销售额'].sum().reset_index()
+            region_total_sales = filtered_new_products_cube.sum_by('所属区域')
 
             # 计算各区域各新品的销售占比
-            region_product_sales = filtered_new_products_df.groupby(['所属区域', '产品代码', '简化产品名称'])[
-                '销售额'].sum().reset_index()
+            region_product_sales = filtered_new_products_cube.sum_by(['所属区域', '产品代码', '简化产品名称'])
 
             if not region_total_sales.empty and not region_product_sales.empty:
                 region_product_sales = region_product_sales.merge(region_total_sales, on='所属区域',
@@ -772,35 +1389,29 @@ with tabs[1]:  # 新品分析
                 )
 
                 # 使用Plotly创建热力图
-                fig_heatmap = px.imshow(
-                    pivot_percentage,
-                    labels=dict(x="产品名称", y="区域", color="销售占比 (%)"),
-                    x=pivot_percentage.columns,
-                    y=pivot_percentage.index,
-                    color_continuous_scale="YlGnBu",
-                    title="各区域内新品销售占比 (%)",
-                    height=500
-                )
+                def build_fig_heatmap():
+                    fig_heatmap = px.imshow(
+                        pivot_percentage,
+                        labels=dict(x="产品名称", y="区域", color="销售占比 (%)"),
+                        x=pivot_percentage.columns,
+                        y=pivot_percentage.index,
+                        color_continuous_scale="YlGnBu",
+                        title="各区域内新品销售占比 (%)",
+                        height=500
+                    )
 
-                fig_heatmap.update_layout(
-                    xaxis_title=dict(text="产品名称", font=dict(size=16)),
-                    yaxis_title=dict(text="区域", font=dict(size=16)),
-                    margin=dict(t=80, b=80, l=100, r=100),
-                    font=dict(size=14)
-                )
+                    fig_heatmap.update_layout(
+                        xaxis_title=dict(text="产品名称", font=dict(size=16)),
+                        yaxis_title=dict(text="区域", font=dict(size=16)),
+                        margin=dict(t=80, b=80, l=100, r=100),
+                        font=dict(size=14)
+                    )
 
-                # 添加注释
-                for i in range(len(pivot_percentage.index)):
-                    for j in range(len(pivot_percentage.columns)):
-                        fig_heatmap.add_annotation(
-                            x=j,
-                            y=i,
-                            text=f"{pivot_percentage.iloc[i, j]:.1f}%",
-                            showarrow=False,
-                            font=dict(color="black" if pivot_percentage.iloc[i, j] < 50 else "white", size=14)
-                        )
+                    # 添加数值标签
+                    set_heatmap_text(fig_heatmap, pivot_percentage.map(lambda value: f"{value:.1f}%"), font_size=14)
+                    return fig_heatmap
 
-                st.plotly_chart(fig_heatmap, use_container_width=True)
+                show_chart('new_product_region_heatmap', build_fig_heatmap)
             else:
                 st.warning("没有足够的区域内新品销售数据来创建热力图。")
         except Exception as e:
@@ -808,11 +1419,14 @@ with tabs[1]:  # 新品分析
 
         # 新品数据表
         with st.expander("查看新品销售数据"):
+            warn_sampled_detail()
             display_columns = [col for col in filtered_new_products_df.columns if
                                col != '产品代码' or col != '产品名称']
             st.dataframe(filtered_new_products_df[display_columns])
 
-with tabs[2]:  # 客户细分
+
+# 客户细分
+def render_customer_segments():
     st.markdown('<div class="sub-header">👥 客户细分分析</div>', unsafe_allow_html=True)
 
     try:
@@ -820,39 +1434,35 @@ with tabs[2]:  # 客户细分
         if filtered_df.empty:
             st.warning("没有数据可供分析。请调整筛选条件。")
         else:
+            warn_sampled_detail()
+            segment_mode = st.radio(
+                "客户分群方式", ["新品占比分档", "RFM聚类"], horizontal=True, key="segment_mode",
+                help="RFM聚类：按最近购买间隔、购买月数、销售额、产品种类数和新品占比，在整个数据集上做k-means聚类，"
+                     "筛选后的客户归入最近的聚类中心。"
+            )
+
             # 计算客户特征
-            customer_features = filtered_df.groupby('客户简称').agg({
-                '销售额': 'sum',  # 总销售额
-                '产品代码': lambda x: len(set(x)),  # 购买的不同产品数量
-                '数量（箱）': 'sum',  # 总购买数量
-                '单价（箱）': 'mean'  # 平均单价
-            }).reset_index()
+            with profiler.span('customer_features', rows_in=len(filtered_df)) as features_span:
+                if segment_mode == "RFM聚类":
+                    with profiler.span('segmentation_fit'):
+                        segmentation = get_customer_segmentation(dataset_key, df)
+                    customer_features = chart_cache.frame(
+                        (filter_key, 'customer_features:rfm'),
+                        lambda: segmentation.segment(filtered_df, filtered_new_products_df, new_products))
+                else:
+                    customer_features = chart_cache.frame(
+                        (filter_key, 'customer_features'),
+                        lambda: customer_segments.customer_features(filtered_df, filtered_new_products_df))
+                features_span.rows_out = len(customer_features)
 
-            # 确保new_products_df不为空
-            if not filtered_new_products_df.empty:
-                # 添加新品购买指标
-                new_products_by_customer = filtered_new_products_df.groupby('客户简称')['销售额'].sum().reset_index()
-                customer_features = customer_features.merge(new_products_by_customer, on='客户简称', how='left',
-                                                            suffixes=('', '_新品'))
-                customer_features['销售额_新品'] = customer_features['销售额_新品'].fillna(0)
-                customer_features['新品占比'] = customer_features['销售额_新品'] / customer_features['销售额'] * 100
-            else:
-                # 如果没有新品数据，添加默认值
+            # 如果没有新品数据，使用默认值
+            if filtered_new_products_df.empty:
                 st.info("当前筛选条件下没有新品销售数据。将使用默认值0进行分析。")
-                customer_features['销售额_新品'] = 0
-                customer_features['新品占比'] = 0
-
-            # 简单客户分类
-            customer_features['客户类型'] = pd.cut(
-                customer_features['新品占比'],
-                bins=[0, 10, 30, 100],
-                labels=['保守型客户', '平衡型客户', '创新型客户']
-            )
 
             # 客户分类展示
             st.markdown('<div class="sub-header section-gap">客户类型分布</div>', unsafe_allow_html=True)
 
-            simple_segments = customer_features.groupby('客户类型').agg({
+            simple_segments = customer_features.groupby('客户类型', observed=True).agg({
                 '客户简称': 'count',
                 '销售额': 'mean',
                 '新品占比': 'mean'
@@ -864,121 +1474,131 @@ with tabs[2]:  # 客户细分
             if not simple_segments.empty:
                 # 创建图表代码...
                 # 使用Plotly绘制客户类型分布
-                fig_customer_types = px.bar(
-                    simple_segments,
-                    x='客户类型',
-                    y='客户数量',
-                    color='客户类型',
-                    title='客户类型分布',
-                    text='客户数量',
-                    height=500
-                )
+                def build_fig_customer_types():
+                    fig_customer_types = px.bar(
+                        decategorize(simple_segments),
+                        x='客户类型',
+                        y='客户数量',
+                        color='客户类型',
+                        title='客户类型分布',
+                        text='客户数量',
+                        height=500
+                    )
 
-                fig_customer_types.update_traces(
-                    texttemplate='%{text}',
-                    textposition='outside',
-                    textfont=dict(size=14)
-                )
-                fig_customer_types.update_layout(
-                    xaxis_title=dict(text="客户类型", font=dict(size=16)),
-                    yaxis_title=dict(text="客户数量", font=dict(size=16)),
-                    xaxis_tickfont=dict(size=14),
-                    yaxis_tickfont=dict(size=14),
-                    margin=dict(t=60, b=80, l=80, r=60),
-                    plot_bgcolor='rgba(0,0,0,0)'
-                )
-                # 确保Y轴有足够空间显示数据标签
-                fig_customer_types.update_yaxes(
-                    range=[0, simple_segments['客户数量'].max() * 1.2]
-                )
+                    fig_customer_types.update_traces(
+                        texttemplate='%{text}',
+                        textposition='outside',
+                        textfont=dict(size=14)
+                    )
+                    fig_customer_types.update_layout(
+                        xaxis_title=dict(text="客户类型", font=dict(size=16)),
+                        yaxis_title=dict(text="客户数量", font=dict(size=16)),
+                        xaxis_tickfont=dict(size=14),
+                        yaxis_tickfont=dict(size=14),
+                        margin=dict(t=60, b=80, l=80, r=60),
+                        plot_bgcolor='rgba(0,0,0,0)'
+                    )
+                    # 确保Y轴有足够空间显示数据标签
+                    fig_customer_types.update_yaxes(
+                        range=[0, simple_segments['客户数量'].max() * 1.2]
+                    )
+                    return fig_customer_types
 
-                st.plotly_chart(fig_customer_types, use_container_width=True)
+                show_chart(f'customer_types:{segment_mode}', build_fig_customer_types)
 
                 # 客户类型特征对比
                 st.markdown('<div class="sub-header section-gap">不同客户类型的特征对比</div>', unsafe_allow_html=True)
 
                 # 创建子图 - 优化版
-                fig = make_subplots(rows=1, cols=2,
-                                    subplot_titles=("客户类型平均销售额", "客户类型平均新品占比"),
-                                    specs=[[{"type": "bar"}, {"type": "bar"}]])
-
-                # 添加平均销售额柱状图
-                fig.add_trace(
-                    go.Bar(
-                        x=simple_segments['客户类型'],
-                        y=simple_segments['平均销售额'],
-                        name='平均销售额',
-                        marker_color='rgb(55, 83, 109)',
-                        text=[format_yuan(val) for val in simple_segments['平均销售额']],  # 添加文本标签
-                        textposition='outside',  # 标签位置设为外部
-                        textfont=dict(size=14)
-                    ),
-                    row=1, col=1
-                )
+                def build_fig():
+                    fig = make_subplots(rows=1, cols=2,
+                                        subplot_titles=("客户类型平均销售额", "客户类型平均新品占比"),
+                                        specs=[[{"type": "bar"}, {"type": "bar"}]])
+
+                    # 添加平均销售额柱状图
+                    fig.add_trace(
+                        go.Bar(
+                            x=simple_segments['客户类型'],
+                            y=simple_segments['平均销售额'],
+                            name='平均销售额',
+                            marker_color='rgb(55, 83, 109)',
+                            text=[format_yuan(val) for val in simple_segments['平均销售额']],  # 添加文本标签
+                            textposition='outside',  # 标签位置设为外部
+                            textfont=dict(size=14)
+                        ),
+                        row=1, col=1
+                    )
 
-                # 添加平均新品占比柱状图
-                fig.add_trace(
-                    go.Bar(
-                        x=simple_segments['客户类型'],
-                        y=simple_segments['平均新品占比'],
-                        name='平均新品占比',
-                        marker_color='rgb(26, 118, 255)',
-                        text=[f"{x:.1f}%" for x in simple_segments['平均新品占比']],  # 添加文本标签
-                        textposition='outside',  # 标签位置设为外部
-                        textfont=dict(size=14)
-                    ),
-                    row=1, col=2
-                )
+                    # 添加平均新品占比柱状图
+                    fig.add_trace(
+                        go.Bar(
+                            x=simple_segments['客户类型'],
+                            y=simple_segments['平均新品占比'],
+                            name='平均新品占比',
+                            marker_color='rgb(26, 118, 255)',
+                            text=[f"{x:.1f}%" for x in simple_segments['平均新品占比']],  # 添加文本标签
+                            textposition='outside',  # 标签位置设为外部
+                            textfont=dict(size=14)
+                        ),
+                        row=1, col=2
+                    )
 
-                # 优化图表布局
-                fig.update_layout(
-                    height=500,  # 增加高度
-                    showlegend=False,
-                    margin=dict(t=80, b=80, l=80, r=80),  # 增加边距
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    font=dict(
-                        family="Arial, sans-serif",
-                        size=14,  # 增加字体大小
-                        color="rgb(50, 50, 50)"
-                    ),
-                    title_font=dict(size=18)  # 标题字体大小
-                )
+                    # 优化图表布局
+                    fig.update_layout(
+                        height=500,  # 增加高度
+                        showlegend=False,
+                        margin=dict(t=80, b=80, l=80, r=80),  # 增加边距
+                        plot_bgcolor='rgba(0,0,0,0)',
+                        font=dict(
+                            family="Arial, sans-serif",
+                            size=14,  # 增加字体大小
+                            color="rgb(50, 50, 50)"
+                        ),
+                        title_font=dict(size=18)  # 标题字体大小
+                    )
 
-                # 优化X轴和Y轴
-                fig.update_xaxes(
-                    title_text="客户类型",
-                    title_font=dict(size=16),
-                    tickfont=dict(size=14),
-                    row=1, col=1
-                )
+                    # 优化X轴和Y轴
+                    fig.update_xaxes(
+                        title_text="客户类型",
+                        title_font=dict(size=16),
+                        tickfont=dict(size=14),
+                        row=1, col=1
+                    )
 
-                fig.update_yaxes(
-                    title_text="平均销售额 (元)",
-                    title_font=dict(size=16),
-                    tickfont=dict(size=14),
-                    tickformat=",",  # 添加千位分隔符
-                    row=1, col=1
-                )
+                    fig.update_yaxes(
+                        title_text="平均销售额 (元)",
+                        title_font=dict(size=16),
+                        tickfont=dict(size=14),
+                        tickformat=",",  # 添加千位分隔符
+                        row=1, col=1
+                    )
 
-                fig.update_xaxes(
-                    title_text="客户类型",
-                    title_font=dict(size=16),
-                    tickfont=dict(size=14),
-                    row=1, col=2
-                )
+                    fig.update_xaxes(
+                        title_text="客户类型",
+                        title_font=dict(size=16),
+                        tickfont=dict(size=14),
+                        row=1, col=2
+                    )
 
-                fig.update_yaxes(
-                    title_text="平均新品占比 (%)",
-                    title_font=dict(size=16),
-                    tickfont=dict(size=14),
-                    row=1, col=2
-                )
+                    fig.update_yaxes(
+                        title_text="平均新品占比 (%)",
+                        title_font=dict(size=16),
+                        tickfont=dict(size=14),
+                        row=1, col=2
+                    )
 
-                # 确保Y轴有足够空间显示数据标签
-                fig.update_yaxes(range=[0, simple_segments['平均销售额'].max() * 1.3], row=1, col=1)
-                fig.update_yaxes(range=[0, simple_segments['平均新品占比'].max() * 1.3], row=1, col=2)
+                    # 确保Y轴有足够空间显示数据标签
+                    fig.update_yaxes(range=[0, simple_segments['平均销售额'].max() * 1.3], row=1, col=1)
+                    fig.update_yaxes(range=[0, simple_segments['平均新品占比'].max() * 1.3], row=1, col=2)
+                    return fig
 
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(f'customer_type_features:{segment_mode}', build_fig)
+
+                if segment_mode == "RFM聚类":
+                    # 各分群的RFM特征均值
+                    st.dataframe(customer_features.groupby('客户类型', observed=True)[customer_segments.RFM_COLUMNS[:2] + [
+                        '销售额', '产品代码', '新品占比']].mean().round(2).rename(columns={
+                            '最近购买间隔': '最近购买间隔(月)', '产品代码': '产品种类数'}))
             else:
                 st.warning("无法创建客户类型分布图：分类后的数据为空。")
 
@@ -988,33 +1608,35 @@ with tabs[2]:  # 客户细分
                 st.markdown('<div class="sub-header section-gap">客户销售额与新品占比关系</div>',
                             unsafe_allow_html=True)
 
-                fig_scatter = px.scatter(
-                    customer_features,
-                    x='销售额',
-                    y='新品占比',
-                    color='客户类型',
-                    size='产品代码',  # 购买的产品种类数量
-                    hover_name='客户简称',
-                    title='客户销售额与新品占比关系',
-                    labels={
-                        '销售额': '销售额 (元)',
-                        '新品占比': '新品销售占比 (%)',
-                        '产品代码': '购买产品种类数'
-                    },
-                    height=500
-                )
+                def build_fig_scatter():
+                    fig_scatter = px.scatter(
+                        decategorize(customer_features),
+                        x='销售额',
+                        y='新品占比',
+                        color='客户类型',
+                        size='产品代码',  # 购买的产品种类数量
+                        hover_name='客户简称',
+                        title='客户销售额与新品占比关系',
+                        labels={
+                            '销售额': '销售额 (元)',
+                            '新品占比': '新品销售占比 (%)',
+                            '产品代码': '购买产品种类数'
+                        },
+                        height=500
+                    )
 
-                fig_scatter.update_layout(
-                    xaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
-                    yaxis_title=dict(text="新品销售占比 (%)", font=dict(size=16)),
-                    xaxis_tickfont=dict(size=14),
-                    yaxis_tickfont=dict(size=14),
-                    margin=dict(t=60, b=80, l=80, r=60),
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    legend_font=dict(size=14)
-                )
+                    fig_scatter.update_layout(
+                        xaxis_title=dict(text="销售额 (元)", font=dict(size=16)),
+                        yaxis_title=dict(text="新品销售占比 (%)", font=dict(size=16)),
+                        xaxis_tickfont=dict(size=14),
+                        yaxis_tickfont=dict(size=14),
+                        margin=dict(t=60, b=80, l=80, r=60),
+                        plot_bgcolor='rgba(0,0,0,0)',
+                        legend_font=dict(size=14)
+                    )
+                    return fig_scatter
 
-                st.plotly_chart(fig_scatter, use_container_width=True)
+                show_chart(f'customer_scatter:{segment_mode}', build_fig_scatter)
 
                 # 新品接受度最高的客户
                 st.markdown('<div class="sub-header section-gap">新品接受度最高的客户</div>', unsafe_allow_html=True)
@@ -1022,36 +1644,38 @@ with tabs[2]:  # 客户细分
                 top_acceptance = customer_features.sort_values('新品占比', ascending=False).head(10)
 
                 if not top_acceptance.empty:
-                    fig_top_acceptance = px.bar(
-                        top_acceptance,
-                        x='客户简称',
-                        y='新品占比',
-                        color='新品占比',
-                        title='新品接受度最高的前10名客户',
-                        labels={'新品占比': '新品销售占比 (%)', '客户简称': '客户'},
-                        height=500,
-                        color_continuous_scale=px.colors.sequential.Viridis
-                    )
-                    # 添加文本标签
-                    fig_top_acceptance.update_traces(
-                        text=[f"{x:.1f}%" for x in top_acceptance['新品占比']],
-                        textposition='outside',
-                        textfont=dict(size=14)
-                    )
-                    fig_top_acceptance.update_layout(
-                        xaxis_title=dict(text="客户", font=dict(size=16)),
-                        yaxis_title=dict(text="新品销售占比 (%)", font=dict(size=16)),
-                        xaxis_tickfont=dict(size=14),
-                        yaxis_tickfont=dict(size=14),
-                        margin=dict(t=60, b=80, l=80, r=60),
-                        plot_bgcolor='rgba(0,0,0,0)'
-                    )
-                    # 确保Y轴有足够空间显示数据标签
-                    fig_top_acceptance.update_yaxes(
-                        range=[0, top_acceptance['新品占比'].max() * 1.2]
-                    )
+                    def build_fig_top_acceptance():
+                        fig_top_acceptance = px.bar(
+                            top_acceptance,
+                            x='客户简称',
+                            y='新品占比',
+                            color='新品占比',
+                            title='新品接受度最高的前10名客户',
+                            labels={'新品占比': '新品销售占比 (%)', '客户简称': '客户'},
+                            height=500,
+                            color_continuous_scale=px.colors.sequential.Viridis
+                        )
+                        # 添加文本标签
+                        fig_top_acceptance.update_traces(
+                            text=[f"{x:.1f}%" for x in top_acceptance['新品占比']],
+                            textposition='outside',
+                            textfont=dict(size=14)
+                        )
+                        fig_top_acceptance.update_layout(
+                            xaxis_title=dict(text="客户", font=dict(size=16)),
+                            yaxis_title=dict(text="新品销售占比 (%)", font=dict(size=16)),
+                            xaxis_tickfont=dict(size=14),
+                            yaxis_tickfont=dict(size=14),
+                            margin=dict(t=60, b=80, l=80, r=60),
+                            plot_bgcolor='rgba(0,0,0,0)'
+                        )
+                        # 确保Y轴有足够空间显示数据标签
+                        fig_top_acceptance.update_yaxes(
+                            range=[0, top_acceptance['新品占比'].max() * 1.2]
+                        )
+                        return fig_top_acceptance
 
-                    st.plotly_chart(fig_top_acceptance, use_container_width=True)
+                    show_chart('top_acceptance', build_fig_top_acceptance)
                 else:
                     st.warning("没有足够的数据来显示新品接受度最高的客户。")
             else:
@@ -1064,87 +1688,72 @@ with tabs[2]:  # 客户细分
         st.error(f"客户细分分析出错: {str(e)}")
         st.info("请尝试调整筛选条件或检查数据格式。")
 
-with tabs[3]:  # 产品组合
+
+# 产品组合
+def render_product_mix():
     st.markdown('<div class="sub-header">🔄 产品组合分析</div>', unsafe_allow_html=True)
 
     try:
         # 共现矩阵分析
         st.markdown('<div class="sub-header section-gap">产品共现矩阵分析</div>', unsafe_allow_html=True)
         st.info("共现矩阵显示不同产品一起被同一客户购买的频率，有助于发现产品间的关联。")
+        warn_sampled_detail()
 
         # 准备数据 - 创建交易矩阵
         if not filtered_df.empty and filtered_df['客户简称'].nunique() > 1 and filtered_df['产品代码'].nunique() > 1:
-            transaction_data = filtered_df.groupby(['客户简称', '产品代码'])['销售额'].sum().unstack().fillna(0)
-            # 转换为二进制格式（是否购买）
-            transaction_binary = transaction_data.applymap(lambda x: 1 if x > 0 else 0)
-
-            # 创建产品共现矩阵
-            co_occurrence = pd.DataFrame(0, index=transaction_binary.columns, columns=transaction_binary.columns)
-
-            # 创建产品代码到简化名称的映射
-            name_mapping = {code: df[df['产品代码'] == code]['简化产品名称'].iloc[0]
-            if len(df[df['产品代码'] == code]) > 0 else code
-                            for code in transaction_binary.columns}
-
-            # 计算共现次数
-            for _, row in transaction_binary.iterrows():
-                bought_products = row.index[row == 1].tolist()
-                for p1 in bought_products:
-                    for p2 in bought_products:
-                        if p1 != p2:
-                            co_occurrence.loc[p1, p2] += 1
+            # 客户×产品稀疏购买矩阵及共现矩阵（Bᵀ·B）
+            with profiler.span('co_occurrence', rows_in=len(filtered_df)) as co_span:
+                co_occurrence = get_product_baskets(filter_key, filtered_df)
+                co_span.rows_out = co_occurrence.n_items
 
             # 筛选新品的共现情况
-            new_product_co_occurrence = pd.DataFrame()
-            valid_new_products = [p for p in new_products if p in co_occurrence.index]
+            valid_new_products = [p for p in new_products if p in co_occurrence]
 
             if valid_new_products:
-                for np_code in valid_new_products:
-                    top_co = co_occurrence.loc[np_code].sort_values(ascending=False).head(5)
-                    new_product_co_occurrence[np_code] = top_co
-
                 # 可视化每个新品的前5个共现产品
                 for np_code in valid_new_products:
-                    np_name = name_mapping.get(np_code, np_code)  # 获取新品的简化名称
+                    np_name = product_name_mapping.get(np_code, np_code)  # 获取新品的简化名称
                     st.markdown(f'<div class="sub-header">与"{np_name}"共同购买最多的产品</div>',
                                 unsafe_allow_html=True)
 
-                    co_data = co_occurrence.loc[np_code].sort_values(ascending=False).head(5).reset_index()
+                    co_data = co_occurrence.top(np_code, 5).reset_index()
                     co_data.columns = ['产品代码', '共现次数']
 
                     # 添加简化产品名称
-                    co_data['简化产品名称'] = co_data['产品代码'].map(name_mapping)
+                    co_data['简化产品名称'] = co_data['产品代码'].map(product_name_mapping)
 
                     if not co_data.empty and co_data['共现次数'].max() > 0:
-                        fig_co = px.bar(
-                            co_data,
-                            x='简化产品名称',  # 使用简化产品名称
-                            y='共现次数',
-                            color='简化产品名称',
-                            title=f'与{np_name}共同购买最多的产品',
-                            labels={'共现次数': '共同购买次数', '简化产品名称': '产品名称'},
-                            height=500
-                        )
-                        # 添加文本标签
-                        fig_co.update_traces(
-                            text=co_data['共现次数'],
-                            textposition='outside',
-                            textfont=dict(size=14)
-                        )
-                        fig_co.update_layout(
-                            xaxis_title=dict(text="产品名称", font=dict(size=16)),
-                            yaxis_title=dict(text="共同购买次数", font=dict(size=16)),
-                            xaxis_tickfont=dict(size=14),
-                            yaxis_tickfont=dict(size=14),
-                            margin=dict(t=60, b=80, l=80, r=60),
-                            plot_bgcolor='rgba(0,0,0,0)'
-                        )
-                        # 确保Y轴有足够空间显示数据标签
-                        fig_co.update_yaxes(
-                            range=[0, co_data['共现次数'].max() * 1.2]
-                        )
+                        def build_fig_co():
+                            fig_co = px.bar(
+                                co_data,
+                                x='简化产品名称',  # 使用简化产品名称
+                                y='共现次数',
+                                color='简化产品名称',
+                                title=f'与{np_name}共同购买最多的产品',
+                                labels={'共现次数': '共同购买次数', '简化产品名称': '产品名称'},
+                                height=500
+                            )
+                            # 添加文本标签
+                            fig_co.update_traces(
+                                text=co_data['共现次数'],
+                                textposition='outside',
+                                textfont=dict(size=14)
+                            )
+                            fig_co.update_layout(
+                                xaxis_title=dict(text="产品名称", font=dict(size=16)),
+                                yaxis_title=dict(text="共同购买次数", font=dict(size=16)),
+                                xaxis_tickfont=dict(size=14),
+                                yaxis_tickfont=dict(size=14),
+                                margin=dict(t=60, b=80, l=80, r=60),
+                                plot_bgcolor='rgba(0,0,0,0)'
+                            )
+                            # 确保Y轴有足够空间显示数据标签
+                            fig_co.update_yaxes(
+                                range=[0, co_data['共现次数'].max() * 1.2]
+                            )
+                            return fig_co
 
-                        st.plotly_chart(fig_co, use_container_width=True)
+                        show_chart(f'co_occurrence_top:{np_code}', build_fig_co)
                     else:
                         st.info(f"没有与{np_name}共同购买的产品记录。")
 
@@ -1153,51 +1762,80 @@ with tabs[3]:  # 产品组合
                 st.info("热力图显示产品之间的共现关系，颜色越深表示两个产品一起购买的频率越高。")
 
                 # 筛选主要产品以避免图表过于复杂
-                top_products = filtered_df.groupby('产品代码')['销售额'].sum().sort_values(ascending=False).head(
-                    10).index.tolist()
+                top_products = filtered_cube.sum_by('产品代码').sort_values('销售额', ascending=False).head(
+                    10)['产品代码'].tolist()
                 # 确保所有新品都包含在内
-                for np in valid_new_products:
-                    if np not in top_products:
-                        top_products.append(np)
+                for np_code in valid_new_products:
+                    if np_code not in top_products:
+                        top_products.append(np_code)
 
                 # 创建简化名称映射的列表
-                top_product_names = [name_mapping.get(code, code) for code in top_products]
-
-                # 创建热力图数据
-                heatmap_data = co_occurrence.loc[top_products, top_products].copy()
+                top_product_names = [product_name_mapping.get(code, code) for code in top_products]
 
                 # 创建热力图
-                fig_co_heatmap = px.imshow(
-                    heatmap_data,
-                    labels=dict(x="产品名称", y="产品名称", color="共现次数"),
-                    x=top_product_names,  # 使用简化名称
-                    y=top_product_names,  # 使用简化名称
-                    color_continuous_scale="Viridis",
-                    title="产品共现热力图",
-                    height=600  # 增加高度以容纳更多数据
-                )
-
-                fig_co_heatmap.update_layout(
-                    margin=dict(t=80, b=80, l=100, r=100),
-                    font=dict(size=14),
-                    xaxis_tickangle=-45  # 倾斜x轴标签以防重叠
-                )
-
-                # 添加数值注释
-                for i in range(len(top_products)):
-                    for j in range(len(top_products)):
-                        if heatmap_data.iloc[i, j] > 0:  # 只显示非零值
-                            fig_co_heatmap.add_annotation(
-                                x=j,
-                                y=i,
-                                text=str(heatmap_data.iloc[i, j]),
-                                showarrow=False,
-                                font=dict(color="white" if heatmap_data.iloc[
-                                                               i, j] > heatmap_data.max().max() / 2 else "black",
-                                          size=12)
-                            )
+                show_chart('co_occurrence_heatmap', lambda: build_co_occurrence_heatmap(
+                    co_occurrence.dense(top_products), top_product_names))
+
+                # 关联规则：共现次数受畅销产品影响，提升度衡量购买前项后购买后项的概率相对平均水平的提高
+                st.markdown('<div class="sub-header section-gap">新品关联规则</div>', unsafe_allow_html=True)
+                st.info("提升度大于1表示购买了前项产品的客户更倾向于同时购买后项产品，可用于找出真正带动新品的产品。")
+
+                rule_col1, rule_col2, rule_col3 = st.columns(3)
+                with rule_col1:
+                    basket_mode = st.radio("购物篮", RULE_BASKET_MODES, horizontal=True, key="rule_basket_mode")
+                with rule_col2:
+                    min_support = st.slider("最小支持度 (%)", 0.1, 20.0, RULE_DEFAULT_MIN_SUPPORT, 0.1,
+                                            key="rule_min_support")
+                with rule_col3:
+                    min_confidence = st.slider("最小置信度 (%)", 1, 100, RULE_DEFAULT_MIN_CONFIDENCE,
+                                               key="rule_min_confidence")
+
+                with profiler.span('association_rules', rows_in=len(filtered_df)) as rules_span:
+                    rules = get_association_rules(filter_key, basket_mode, min_support / 100, min_confidence / 100,
+                                                  filtered_df, co_occurrence)
+                    rules_span.rows_out = len(rules)
+
+                if rules.empty:
+                    st.warning("当前阈值下没有与新品相关的关联规则，可以降低最小支持度或最小置信度。")
+                else:
+                    top_rules = rules.head(MAX_DISPLAY_RULES)
+                    display_rules = pd.DataFrame({
+                        '前项': top_rules['前项'].map(
+                            lambda codes: ' + '.join(product_name_mapping.get(code, code) for code in codes)),
+                        '后项': top_rules['后项'].map(lambda code: product_name_mapping.get(code, code)),
+                        '同时购买数': top_rules['同时购买数'],
+                        '支持度(%)': (top_rules['支持度'] * 100).round(2),
+                        '置信度(%)': (top_rules['置信度'] * 100).round(2),
+                        '提升度': top_rules['提升度'].round(3),
+                    })
+
+                    def build_fig_rules():
+                        chart_rules = display_rules.head(10).assign(
+                            规则=lambda frame: frame['前项'] + ' → ' + frame['后项'])
+                        fig_rules = px.bar(
+                            chart_rules.iloc[::-1],
+                            x='提升度',
+                            y='规则',
+                            orientation='h',
+                            text='提升度',
+                            hover_data=['支持度(%)', '置信度(%)', '同时购买数'],
+                            title='提升度最高的新品关联规则',
+                            height=500
+                        )
+                        fig_rules.update_traces(textposition='outside', textfont=dict(size=14))
+                        fig_rules.update_layout(
+                            xaxis_title=dict(text="提升度", font=dict(size=16)),
+                            yaxis_title=dict(text="", font=dict(size=16)),
+                            xaxis_tickfont=dict(size=14),
+                            yaxis_tickfont=dict(size=12),
+                            margin=dict(t=60, b=80, l=80, r=60),
+                            plot_bgcolor='rgba(0,0,0,0)'
+                        )
+                        return fig_rules
 
-                st.plotly_chart(fig_co_heatmap, use_container_width=True)
+                    show_chart(f'association_rules:{basket_mode}:{min_support}:{min_confidence}', build_fig_rules)
+                    st.caption(f"共{len(rules)}条与新品相关的规则，按提升度降序。")
+                    st.dataframe(display_rules, hide_index=True)
             else:
                 st.warning("在当前筛选条件下，未找到新品数据或共现关系。")
 
@@ -1205,7 +1843,8 @@ with tabs[3]:  # 产品组合
             st.markdown('<div class="sub-header section-gap">产品购买模式分析</div>', unsafe_allow_html=True)
 
             # 计算平均每单购买的产品种类数
-            avg_products_per_order = transaction_binary.sum(axis=1).mean()
+            products_per_customer = co_occurrence.items_per_basket()
+            avg_products_per_order = products_per_customer.mean()
 
             col1, col2 = st.columns(2)
 
@@ -1219,9 +1858,8 @@ with tabs[3]:  # 产品组合
 
             with col2:
                 # 计算含有新品的订单比例
-                orders_with_new_products = transaction_binary[valid_new_products].any(
-                    axis=1).sum() if valid_new_products else 0
-                total_orders = len(transaction_binary)
+                orders_with_new_products = co_occurrence.baskets_with_any(valid_new_products)
+                total_orders = len(products_per_customer)
                 percentage_orders_with_new = (orders_with_new_products / total_orders * 100) if total_orders > 0 else 0
 
                 st.markdown(f"""
@@ -1232,62 +1870,103 @@ with tabs[3]:  # 产品组合
                 """, unsafe_allow_html=True)
 
             # 购买产品种类数分布
-            products_per_order = transaction_binary.sum(axis=1).value_counts().sort_index().reset_index()
+            products_per_order = products_per_customer.value_counts().sort_index().reset_index()
             products_per_order.columns = ['产品种类数', '客户数']
 
             if not products_per_order.empty:
-                fig_products_dist = px.bar(
-                    products_per_order,
-                    x='产品种类数',
-                    y='客户数',
-                    title='客户购买产品种类数分布',
-                    labels={'产品种类数': '购买产品种类数', '客户数': '客户数量'},
-                    height=500
-                )
-                # 添加文本标签
-                fig_products_dist.update_traces(
-                    text=products_per_order['客户数'],
-                    textposition='outside',
-                    textfont=dict(size=14)
-                )
-                fig_products_dist.update_layout(
-                    xaxis_title=dict(text="购买产品种类数", font=dict(size=16)),
-                    yaxis_title=dict(text="客户数量", font=dict(size=16)),
-                    xaxis_tickfont=dict(size=14),
-                    yaxis_tickfont=dict(size=14),
-                    margin=dict(t=60, b=80, l=80, r=60),
-                    plot_bgcolor='rgba(0,0,0,0)'
-                )
-                # 确保Y轴有足够空间显示数据标签
-                fig_products_dist.update_yaxes(
-                    range=[0, products_per_order['客户数'].max() * 1.2]
-                )
+                def build_fig_products_dist():
+                    fig_products_dist = px.bar(
+                        products_per_order,
+                        x='产品种类数',
+                        y='客户数',
+                        title='客户购买产品种类数分布',
+                        labels={'产品种类数': '购买产品种类数', '客户数': '客户数量'},
+                        height=500
+                    )
+                    # 添加文本标签
+                    fig_products_dist.update_traces(
+                        text=products_per_order['客户数'],
+                        textposition='outside',
+                        textfont=dict(size=14)
+                    )
+                    fig_products_dist.update_layout(
+                        xaxis_title=dict(text="购买产品种类数", font=dict(size=16)),
+                        yaxis_title=dict(text="客户数量", font=dict(size=16)),
+                        xaxis_tickfont=dict(size=14),
+                        yaxis_tickfont=dict(size=14),
+                        margin=dict(t=60, b=80, l=80, r=60),
+                        plot_bgcolor='rgba(0,0,0,0)'
+                    )
+                    # 确保Y轴有足够空间显示数据标签
+                    fig_products_dist.update_yaxes(
+                        range=[0, products_per_order['客户数'].max() * 1.2]
+                    )
+                    return fig_products_dist
 
-                st.plotly_chart(fig_products_dist, use_container_width=True)
+                show_chart('products_per_customer', build_fig_products_dist)
             else:
                 st.warning("没有足够的数据来显示客户购买产品种类数分布。")
 
             # 产品组合表格
             with st.expander("查看产品共现矩阵"):
-                # 转换产品代码为简化名称
-                display_co_occurrence = co_occurrence.copy()
-                display_co_occurrence.index = [name_mapping.get(code, code) for code in display_co_occurrence.index]
-                display_co_occurrence.columns = [name_mapping.get(code, code) for code in display_co_occurrence.columns]
-                st.dataframe(display_co_occurrence)
+                if co_occurrence.n_items <= MAX_DENSE_CO_OCCURRENCE_ITEMS:
+                    # 转换产品代码为简化名称
+                    display_co_occurrence = co_occurrence.dense()
+                    display_co_occurrence.index = [product_name_mapping.get(code, code) for code in display_co_occurrence.index]
+                    display_co_occurrence.columns = [product_name_mapping.get(code, code) for code in display_co_occurrence.columns]
+                    st.dataframe(display_co_occurrence)
+                else:
+                    # 产品过多时只展示非零共现对，避免生成巨大的稠密矩阵
+                    st.write(f"产品数量为{co_occurrence.n_items}，仅展示非零共现产品对：")
+                    co_pairs = co_occurrence.pairs()
+                    co_pairs['产品A'] = co_pairs['产品A'].map(lambda code: product_name_mapping.get(code, code))
+                    co_pairs['产品B'] = co_pairs['产品B'].map(lambda code: product_name_mapping.get(code, code))
+                    st.dataframe(co_pairs)
         else:
             st.warning("当前筛选条件下的数据不足以进行产品组合分析。需要多个客户和多个产品。")
     except Exception as e:
         st.error(f"产品组合分析出错: {str(e)}")
         st.info("请尝试调整筛选条件或检查数据格式。")
 
-with tabs[4]:  # 市场渗透率
+
+# 市场渗透率
+def render_market_penetration():
     st.markdown('<div class="sub-header">🌐 新品市场渗透率分析</div>', unsafe_allow_html=True)
 
     try:
+        # 去重客户数：数据量较大时默认合并预先计算的草图得到近似值，也可以切换为精确计数
+        exact_counts = st.checkbox(
+            "精确去重计数", value=not sketch_by_default, key="penetration_exact",
+            help="关闭后按 区域×月份×是否新品 预先计算的HyperLogLog草图合并估计客户数，不再扫描明细，结果为近似值。"
+        )
+        if not exact_counts and (selected_customers or selected_products or selected_applicants):
+            st.caption("草图只按区域和月份预先计算，当前筛选包含客户、产品或申请人条件，已改用精确计数。")
+            exact_counts = True
+
+        if exact_counts:
+            sketches = None
+            sketch_regions = None
+            approx = ''
+        else:
+            with profiler.span('penetration_sketches'):
+                sketches = get_penetration_sketches(dataset_key, sales_cube)
+            sketch_regions = selected_regions or None
+            approx = '≈'
+            # 95%置信区间的相对误差；渗透率是两个估计值之比，误差按两者合成
+            count_error = 1.96 * sketches.standard_error
+            rate_error = count_error * np.sqrt(2)
+            st.caption(f"客户数为HyperLogLog近似值（{1 << sketches.precision}个寄存器），95%置信区间约为±{count_error:.1%}，"
+                       f"渗透率的相对误差约为±{rate_error:.1%}。")
+        count_mode = 'exact' if exact_counts else 'sketch'
+
         # 计算总体渗透率
-        total_customers = filtered_df['客户简称'].nunique()
-        new_product_customers = filtered_new_products_df['客户简称'].nunique()
-        penetration_rate = (new_product_customers / total_customers * 100) if total_customers > 0 else 0
+        if sketches is None:
+            total_customers = filtered_cube.nunique('客户简称')
+            new_product_customers = filtered_new_products_cube.nunique('客户简称')
+        else:
+            total_customers = round(sketches.count(sketch_regions))
+            new_product_customers = round(sketches.count(sketch_regions, new=True))
+        penetration_rate = min(new_product_customers / total_customers * 100, 100) if total_customers > 0 else 0
 
         # KPI指标
         col1, col2, col3 = st.columns(3)
@@ -1296,7 +1975,7 @@ with tabs[4]:  # 市场渗透率
             st.markdown(f"""
             <div class="card">
                 <div class="metric-label">总客户数</div>
-                <div class="metric-value">{total_customers}</div>
+                <div class="metric-value">{approx}{total_customers}</div>
             </div>
             """, unsafe_allow_html=True)
 
@@ -1304,7 +1983,7 @@ with tabs[4]:  # 市场渗透率
             st.markdown(f"""
             <div class="card">
                 <div class="metric-label">购买新品的客户数</div>
-                <div class="metric-value">{new_product_customers}</div>
+                <div class="metric-value">{approx}{new_product_customers}</div>
             </div>
             """, unsafe_allow_html=True)
 
@@ -1312,58 +1991,68 @@ with tabs[4]:  # 市场渗透率
             st.markdown(f"""
             <div class="card">
                 <div class="metric-label">新品市场渗透率</div>
-                <div class="metric-value">{penetration_rate:.2f}%</div>
+                <div class="metric-value">{approx}{penetration_rate:.2f}%</div>
             </div>
             """, unsafe_allow_html=True)
 
         # 区域渗透率分析
         st.markdown('<div class="sub-header section-gap">各区域新品渗透率</div>', unsafe_allow_html=True)
 
-        if 'selected_regions' in locals() and selected_regions:
+        if selected_regions:
             # 按区域计算渗透率
-            region_customers = filtered_df.groupby('所属区域')['客户简称'].nunique().reset_index()
+            if sketches is None:
+                region_customers = filtered_cube.nunique_by('所属区域', '客户简称')
+                new_region_customers = filtered_new_products_cube.nunique_by('所属区域', '客户简称')
+            else:
+                region_customers = sketches.count_by_region(sketch_regions).round().astype(int).reset_index()
+                new_region_customers = sketches.count_by_region(
+                    sketch_regions, new=True).round().astype(int).reset_index()
             region_customers.columns = ['所属区域', '客户总数']
-
-            new_region_customers = filtered_new_products_df.groupby('所属区域')['客户简称'].nunique().reset_index()
             new_region_customers.columns = ['所属区域', '购买新品客户数']
 
             region_penetration = region_customers.merge(new_region_customers, on='所属区域', how='left')
             region_penetration['购买新品客户数'] = region_penetration['购买新品客户数'].fillna(0)
             region_penetration['渗透率'] = (
                     region_penetration['购买新品客户数'] / region_penetration['客户总数'] * 100).round(2)
+            if sketches is not None:
+                region_penetration['渗透率'] = region_penetration['渗透率'].clip(upper=100)
+                region_penetration['渗透率误差(±)'] = (region_penetration['渗透率'] * rate_error).round(2)
 
             if not region_penetration.empty:
                 # 创建区域渗透率条形图
-                fig_region_penetration = px.bar(
-                    region_penetration,
-                    x='所属区域',
-                    y='渗透率',
-                    color='所属区域',
-                    text='渗透率',
-                    title='各区域新品市场渗透率',
-                    labels={'渗透率': '渗透率 (%)', '所属区域': '区域'},
-                    height=500
-                )
+                def build_fig_region_penetration():
+                    fig_region_penetration = px.bar(
+                        region_penetration,
+                        x='所属区域',
+                        y='渗透率',
+                        color='所属区域',
+                        text='渗透率',
+                        error_y='渗透率误差(±)' if sketches is not None else None,
+                        title='各区域新品市场渗透率',
+                        labels={'渗透率': '渗透率 (%)', '所属区域': '区域'},
+                        height=500
+                    )
 
-                fig_region_penetration.update_traces(
-                    texttemplate='%{text:.2f}%',
-                    textposition='outside',
-                    textfont=dict(size=14)
-                )
-                fig_region_penetration.update_layout(
-                    xaxis_title=dict(text="区域", font=dict(size=16)),
-                    yaxis_title=dict(text="渗透率 (%)", font=dict(size=16)),
-                    xaxis_tickfont=dict(size=14),
-                    yaxis_tickfont=dict(size=14),
-                    margin=dict(t=60, b=80, l=80, r=60),
-                    plot_bgcolor='rgba(0,0,0,0)'
-                )
-                # 确保Y轴有足够空间显示数据标签
-                fig_region_penetration.update_yaxes(
-                    range=[0, region_penetration['渗透率'].max() * 1.2]
-                )
+                    fig_region_penetration.update_traces(
+                        texttemplate='%{text:.2f}%',
+                        textposition='outside',
+                        textfont=dict(size=14)
+                    )
+                    fig_region_penetration.update_layout(
+                        xaxis_title=dict(text="区域", font=dict(size=16)),
+                        yaxis_title=dict(text="渗透率 (%)", font=dict(size=16)),
+                        xaxis_tickfont=dict(size=14),
+                        yaxis_tickfont=dict(size=14),
+                        margin=dict(t=60, b=80, l=80, r=60),
+                        plot_bgcolor='rgba(0,0,0,0)'
+                    )
+                    # 确保Y轴有足够空间显示数据标签
+                    fig_region_penetration.update_yaxes(
+                        range=[0, region_penetration['渗透率'].max() * 1.2]
+                    )
+                    return fig_region_penetration
 
-                st.plotly_chart(fig_region_penetration, use_container_width=True)
+                show_chart(f'region_penetration:{count_mode}', build_fig_region_penetration)
 
                 # 区域渗透率表格
                 st.markdown('<div class="sub-header section-gap">区域渗透率详细数据</div>', unsafe_allow_html=True)
@@ -1373,7 +2062,7 @@ with tabs[4]:  # 市场渗透率
                 st.markdown('<div class="sub-header section-gap">渗透率与销售额的关系</div>', unsafe_allow_html=True)
 
                 # 计算每个区域的新品销售额
-                region_new_sales = filtered_new_products_df.groupby('所属区域')['销售额'].sum().reset_index()
+                region_new_sales = filtered_new_products_cube.sum_by('所属区域')
                 region_new_sales.columns = ['所属区域', '新品销售额']
 
                 # 合并渗透率和销售额数据
@@ -1381,39 +2070,41 @@ with tabs[4]:  # 市场渗透率
                 region_analysis['新品销售额'] = region_analysis['新品销售额'].fillna(0)
 
                 # 创建气泡图
-                fig_bubble = px.scatter(
-                    region_analysis,
-                    x='渗透率',
-                    y='新品销售额',
-                    size='客户总数',
-                    color='所属区域',
-                    hover_name='所属区域',
-                    text='所属区域',
-                    title='区域渗透率与新品销售额关系',
-                    labels={
-                        '渗透率': '渗透率 (%)',
-                        '新品销售额': '新品销售额 (元)',
-                        '客户总数': '客户总数'
-                    },
-                    height=500
-                )
+                def build_fig_bubble():
+                    fig_bubble = px.scatter(
+                        region_analysis,
+                        x='渗透率',
+                        y='新品销售额',
+                        size='客户总数',
+                        color='所属区域',
+                        hover_name='所属区域',
+                        text='所属区域',
+                        title='区域渗透率与新品销售额关系',
+                        labels={
+                            '渗透率': '渗透率 (%)',
+                            '新品销售额': '新品销售额 (元)',
+                            '客户总数': '客户总数'
+                        },
+                        height=500
+                    )
 
-                fig_bubble.update_traces(
-                    textposition='top center',
-                    marker=dict(sizemode='diameter', sizeref=0.1),
-                    textfont=dict(size=14)
-                )
+                    fig_bubble.update_traces(
+                        textposition='top center',
+                        marker=dict(sizemode='diameter', sizeref=0.1),
+                        textfont=dict(size=14)
+                    )
 
-                fig_bubble.update_layout(
-                    xaxis_title=dict(text="渗透率 (%)", font=dict(size=16)),
-                    yaxis_title=dict(text="新品销售额 (元)", font=dict(size=16)),
-                    xaxis_tickfont=dict(size=14),
-                    yaxis_tickfont=dict(size=14),
-                    margin=dict(t=60, b=80, l=80, r=60),
-                    plot_bgcolor='rgba(0,0,0,0)'
-                )
+                    fig_bubble.update_layout(
+                        xaxis_title=dict(text="渗透率 (%)", font=dict(size=16)),
+                        yaxis_title=dict(text="新品销售额 (元)", font=dict(size=16)),
+                        xaxis_tickfont=dict(size=14),
+                        yaxis_tickfont=dict(size=14),
+                        margin=dict(t=60, b=80, l=80, r=60),
+                        plot_bgcolor='rgba(0,0,0,0)'
+                    )
+                    return fig_bubble
 
-                st.plotly_chart(fig_bubble, use_container_width=True)
+                show_chart(f'region_penetration_bubble:{count_mode}', build_fig_bubble)
             else:
                 st.warning("没有足够的数据来计算区域渗透率。")
         else:
@@ -1424,42 +2115,26 @@ with tabs[4]:  # 市场渗透率
             st.markdown('<div class="sub-header section-gap">新品渗透率趋势</div>', unsafe_allow_html=True)
 
             try:
-                # 确保发运月份是日期类型
-                if not pd.api.types.is_datetime64_dtype(filtered_df['发运月份']):
-                    filtered_df['发运月份'] = pd.to_datetime(filtered_df['发运月份'])
-                if not pd.api.types.is_datetime64_dtype(filtered_new_products_df['发运月份']):
-                    filtered_new_products_df['发运月份'] = pd.to_datetime(filtered_new_products_df['发运月份'])
-
-                # 按月分组
-                monthly_customers = filtered_df.groupby(pd.Grouper(key='发运月份', freq='M'))[
-                    '客户简称'].nunique().reset_index()
-                monthly_customers.columns = ['月份', '客户总数']
-
-                monthly_new_customers = filtered_new_products_df.groupby(pd.Grouper(key='发运月份', freq='M'))[
-                    '客户简称'].nunique().reset_index()
-                monthly_new_customers.columns = ['月份', '购买新品客户数']
-
-                # 合并月度数据
-                monthly_penetration = monthly_customers.merge(monthly_new_customers, on='月份', how='left')
-                monthly_penetration['购买新品客户数'] = monthly_penetration['购买新品客户数'].fillna(0)
-                monthly_penetration['渗透率'] = (
-                        monthly_penetration['购买新品客户数'] / monthly_penetration['客户总数'] * 100).round(2)
-                monthly_penetration['月份_str'] = monthly_penetration['月份'].dt.strftime('%Y-%m')
-
-                if not monthly_penetration.empty and len(monthly_penetration) > 1:
-                    # 创建趋势线图
+                # 按筛选条件签名缓存的月度（或累计）渗透率
+                def monthly_penetration_frame(cumulative=False):
+                    return chart_cache.frame(
+                        (filter_key, penetration_frame_id(count_mode, cumulative)),
+                        lambda: penetration_by_month(filtered_cube, filtered_new_products_cube, sketches,
+                                                     sketch_regions, cumulative))
+
+                def build_penetration_line(frame, title):
                     fig_trend = px.line(
-                        monthly_penetration,
+                        frame,
                         x='月份',
                         y='渗透率',
                         markers=True,
-                        title='新品渗透率月度趋势',
+                        title=title,
                         labels={'渗透率': '渗透率 (%)', '月份': '月份'},
                         height=500
                     )
                     # 添加数据标签
                     fig_trend.update_traces(
-                        text=[f"{x:.1f}%" for x in monthly_penetration['渗透率']],
+                        text=[f"{x:.1f}%" for x in frame['渗透率']],
                         textposition='top center',
                         textfont=dict(size=14)
                     )
@@ -1471,8 +2146,20 @@ with tabs[4]:  # 市场渗透率
                         margin=dict(t=60, b=80, l=80, r=60),
                         plot_bgcolor='rgba(0,0,0,0)'
                     )
+                    return fig_trend
+
+                monthly_penetration = monthly_penetration_frame()
 
-                    st.plotly_chart(fig_trend, use_container_width=True)
+                if not monthly_penetration.empty and len(monthly_penetration) > 1:
+                    # 创建趋势线图
+                    show_chart(f'penetration_trend:{count_mode}', lambda: build_penetration_line(
+                        monthly_penetration, '新品渗透率月度趋势'))
+
+                    # 累计渗透率：截至每月购买过新品的客户占截至该月所有客户的比例
+                    st.markdown('<div class="sub-header section-gap">新品累计渗透率</div>', unsafe_allow_html=True)
+                    cumulative_penetration = monthly_penetration_frame(cumulative=True)
+                    show_chart(f'cumulative_penetration:{count_mode}', lambda: build_penetration_line(
+                        cumulative_penetration, '新品累计渗透率趋势'))
                 else:
                     st.warning("没有足够的月度数据来显示渗透率趋势。需要多个月份的数据。")
             except Exception as e:
@@ -1482,47 +2169,82 @@ with tabs[4]:  # 市场渗透率
         st.error(f"市场渗透率分析出错: {str(e)}")
         st.info("请尝试调整筛选条件或检查数据格式。")
 
+
+ANALYSIS_PAGES = {
+    "销售概览": render_sales_overview,
+    "新品分析": render_new_products,
+    "客户细分": render_customer_segments,
+    "产品组合": render_product_mix,
+    "市场渗透率": render_market_penetration,
+}
+
+# 导航栏
+st.markdown('<div class="sub-header">导航</div>', unsafe_allow_html=True)
+active_page = st.radio("导航", list(ANALYSIS_PAGES), horizontal=True, key="active_page",
+                       label_visibility="collapsed")
+
+# 其他页面的后台预计算进度（页面渲染完成后填充）
+precompute_status = st.empty()
+
+page_start = time.perf_counter()
+with profiler.span(f"page:{active_page}"):
+    wait_for_precompute(active_page)
+    ANALYSIS_PAGES[active_page]()
+page_timings = st.session_state.setdefault('page_timings', {})
+page_timings[active_page] = time.perf_counter() - page_start
+
+# 后台预计算：当前页面渲染完成后，在线程池中并行计算其他页面不筛选时的聚合结果（每个数据集只提交一次）
+with profiler.span('precompute_submit'):
+    precomputer.submit(dataset_key, precompute_tasks())
+pending_pages = [page for page in precomputer.pending_pages(dataset_key) if page != active_page]
+if pending_pages:
+    precompute_done, precompute_total = precomputer.progress(dataset_key)
+    precompute_status.caption(f"后台预计算中（{precompute_done}/{precompute_total}）：{'、'.join(pending_pages)} "
+                              "的数据准备好后打开会更快。")
+st.caption("页面计算耗时：" + "，".join(
+    f"{page} {page_timings[page]:.2f}秒" + ("（当前）" if page == active_page else "")
+    for page in ANALYSIS_PAGES if page in page_timings))
+
+# 侧边栏 - 缓存诊断
+with st.sidebar.expander("缓存诊断"):
+    cache_stats = chart_cache.stats()
+    st.write(f"命中: {cache_stats['hits']}，未命中: {cache_stats['misses']}，"
+             f"命中率: {cache_stats['hit_rate'] * 100:.1f}%")
+    st.write(f"缓存条目: {cache_stats['entries']}，淘汰次数: {cache_stats['evictions']}")
+    st.write(f"内存占用: {cache_stats['bytes'] / 1024 ** 2:.2f} MB / "
+             f"{cache_stats['budget_bytes'] / 1024 ** 2:.0f} MB")
+    if st.button("清空图表缓存"):
+        chart_cache.clear()
+    registry_stats = get_dataset_registry().stats()
+    st.write(f"共享数据集: {registry_stats['datasets']}个，会话引用: {registry_stats['sessions']}"
+             f"（当前数据集 {get_dataset_registry().refcount(dataset_key)}），"
+             f"内存占用: {registry_stats['bytes'] / 1024 ** 2:.2f} MB")
+    st.write(f"数据集加载: {registry_stats['loads']}次，复用: {registry_stats['hits']}次，"
+             f"空闲释放: {registry_stats['evictions']}次")
+    precompute_done, precompute_total = precomputer.progress(dataset_key)
+    st.write(f"后台预计算: 完成 {precompute_done}/{precompute_total} 项，累计耗时 {precomputer.elapsed(dataset_key):.2f}秒，"
+             f"失败 {len(precomputer.errors(dataset_key))} 项")
+
 # 底部下载区域
 st.markdown("---")
 st.markdown('<div class="sub-header">📊 导出分析结果</div>', unsafe_allow_html=True)
 
 
-# 创建Excel报告
-def generate_excel_report(df, new_products_df):
+# 导出文件格式：(下载按钮标签, 文件名, MIME类型)
+EXPORT_FORMATS = {
+    "Excel分析报告": ("下载Excel分析报告", "销售数据分析报告.xlsx",
+                      "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "原始数据CSV": ("下载CSV数据", "销售数据.csv", "text/csv"),
+    "原始数据Parquet": ("下载Parquet数据", "销售数据.parquet", "application/octet-stream"),
+}
+# 按筛选条件缓存的导出文件数量
+EXPORT_CACHE_ENTRIES = 4
+
+
+# 创建Excel报告（build返回报告内容）
+def generate_excel_report(build):
     try:
-        output = BytesIO()
-        writer = pd.ExcelWriter(output, engine='xlsxwriter')
-
-        # 销售概览表
-        df.to_excel(writer, sheet_name='销售数据总览', index=False)
-
-        # 新品分析表
-        if not new_products_df.empty:
-            new_products_df.to_excel(writer, sheet_name='新品销售数据', index=False)
-
-        # 区域销售汇总
-        region_summary = df.groupby('所属区域').agg({
-            '销售额': 'sum',
-            '客户简称': pd.Series.nunique,
-            '产品代码': pd.Series.nunique,
-            '数量（箱）': 'sum'
-        }).reset_index()
-        region_summary.columns = ['区域', '销售额', '客户数', '产品数', '销售数量']
-        region_summary.to_excel(writer, sheet_name='区域销售汇总', index=False)
-
-        # 产品销售汇总
-        product_summary = df.groupby(['产品代码', '简化产品名称']).agg({
-            '销售额': 'sum',
-            '客户简称': pd.Series.nunique,
-            '数量（箱）': 'sum'
-        }).sort_values('销售额', ascending=False).reset_index()
-        product_summary.columns = ['产品代码', '产品名称', '销售额', '购买客户数', '销售数量']
-        product_summary.to_excel(writer, sheet_name='产品销售汇总', index=False)
-
-        # 保存Excel
-        writer.close()
-
-        return output.getvalue()
+        return build()
     except Exception as e:
         st.error(f"生成Excel报告时出错: {str(e)}")
         # 返回一个简单的错误报告
@@ -1532,18 +2254,70 @@ def generate_excel_report(df, new_products_df):
         return error_output.getvalue()
 
 
+# SQL后端的Excel报告：明细表从数据库逐块读取，汇总表在数据库中计算
+def sql_excel_report_bytes(store, clauses, view):
+    new_clauses = list(clauses) + [('产品代码', tuple(new_products))]
+    columns = store.detail_columns()
+    sheets = [('销售数据总览', columns, store.count_rows(clauses), store.iter_frames(clauses))]
+    new_rows = store.count_rows(new_clauses)
+    if new_rows:
+        sheets.append(('新品销售数据', columns, new_rows, store.iter_frames(new_clauses)))
+    for sheet_name, summary in [('区域销售汇总', report_export.cube_region_summary(view)),
+                                ('产品销售汇总', report_export.cube_product_summary(view))]:
+        sheets.append((sheet_name, summary.columns, len(summary), report_export.frame_chunks(summary)))
+    output = BytesIO()
+    report_export.write_workbook(output, sheets)
+    return output.getvalue()
+
+
+# 导出文件只在用户请求时生成，并按筛选条件签名缓存
+@st.cache_resource(max_entries=EXPORT_CACHE_ENTRIES)
+def get_export(filter_key, export_format, _df, _new_products_df):
+    if export_format == "原始数据CSV":
+        return report_export.csv_bytes(_df)
+    if export_format == "原始数据Parquet":
+        return report_export.parquet_bytes(_df)
+    return generate_excel_report(lambda: report_export.excel_report_bytes(_df, _new_products_df))
+
+
+# SQL后端的导出直接从数据库逐块读取完整数据（不受明细载入上限影响）
+@st.cache_resource(max_entries=EXPORT_CACHE_ENTRIES)
+def get_sql_export(filter_key, export_format, _store, clauses, _view):
+    if export_format == "原始数据CSV":
+        return report_export.csv_bytes_chunks(_store.iter_frames(clauses))
+    if export_format == "原始数据Parquet":
+        return report_export.parquet_bytes_chunks(_store.iter_frames(clauses))
+    return generate_excel_report(lambda: sql_excel_report_bytes(_store, clauses, _view))
+
+
 # 下载按钮
 try:
-    excel_report = generate_excel_report(filtered_df, filtered_new_products_df)
-
-    st.markdown('<div class="download-button">', unsafe_allow_html=True)
-    st.download_button(
-        label="下载Excel分析报告",
-        data=excel_report,
-        file_name="销售数据分析报告.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    st.markdown('</div>', unsafe_allow_html=True)
+    export_format = st.radio("导出格式", list(EXPORT_FORMATS), horizontal=True)
+    # 会话中只记录最近一次请求生成的导出（筛选条件和格式），再次点击时替换
+    export_request = (filter_key, export_format)
+    if st.session_state.get('export_request') != export_request and st.button("生成导出文件"):
+        st.session_state['export_request'] = export_request
+
+    if st.session_state.get('export_request') == export_request:
+        with st.spinner("正在生成导出文件..."):
+            with profiler.span(f"export:{export_format}", rows_in=detail_rows):
+                if sql_store is not None:
+                    export_data = get_sql_export(filter_key, export_format, sql_store, tuple(sql_clauses),
+                                                 filtered_cube)
+                else:
+                    export_data = get_export(filter_key, export_format, filtered_df, filtered_new_products_df)
+
+        label, file_name, mime = EXPORT_FORMATS[export_format]
+        st.markdown('<div class="download-button">', unsafe_allow_html=True)
+        st.download_button(
+            label=label,
+            data=export_data,
+            file_name=file_name,
+            mime=mime
+        )
+        st.markdown('</div>', unsafe_allow_html=True)
+    else:
+        st.caption("导出文件在点击后按当前筛选条件生成。")
 except Exception as e:
     st.error(f"创建下载按钮时出错: {str(e)}")
 
@@ -1553,3 +2327,33 @@ st.markdown("""
     <p>销售数据分析仪表盘 © 2025</p>
 </div>
 """, unsafe_allow_html=True)
+
+# 侧边栏 - 性能诊断（放在脚本最后，以包含本次运行的全部阶段）
+# 设置该环境变量后，每次运行的记录追加写入对应的JSON Lines文件
+PROFILE_LOG_PATH = os.environ.get("SALES_DASHBOARD_PROFILE_LOG")
+
+with st.sidebar.expander("性能诊断"):
+    st.checkbox("记录各阶段耗时", key='profiling_enabled',
+                help="记录每次运行中各阶段的耗时、输入/输出行数和内存峰值增量。开启时内存跟踪会带来额外开销，多个开启记录的会话的各阶段依次执行。")
+    profiler.close()
+    profile_records = profiler.records()
+    if profile_records:
+        st.dataframe(pd.DataFrame([{
+            '阶段': '　' * record['depth'] + record['name'],
+            '耗时(秒)': round(record['seconds'], 3),
+            '输入行数': record['rows_in'],
+            '输出行数': record['rows_out'],
+            '进程内存峰值增量(MB)': round(record['peak_memory_delta'] / 1024 ** 2, 2),
+        } for record in profile_records]).astype({'输入行数': 'Int64', '输出行数': 'Int64'}), hide_index=True)
+        st.caption(f"本次运行合计: {sum(r['seconds'] for r in profile_records if r['depth'] == 0):.2f}秒。"
+                   "内存峰值按整个进程统计，其他会话或后台预计算同时运行时会计入它们的分配。")
+
+        profile_jsonl = profiler.to_jsonl(timestamp=time.strftime('%Y-%m-%d %H:%M:%S'), dataset_key=dataset_key)
+        st.download_button("下载JSON Lines", data=profile_jsonl, file_name="profile.jsonl",
+                           mime="application/x-ndjson")
+        if PROFILE_LOG_PATH:
+            try:
+                with open(PROFILE_LOG_PATH, 'a', encoding='utf-8') as f:
+                    f.write(profile_jsonl)
+            except OSError as e:
+                st.warning(f"写入性能记录失败: {str(e)}")
@@ -0,0 +1,492 @@
+import contextlib
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_prep import PRODUCT_ATTRIBUTE_COLUMNS, compact_dtypes, product_dimension
+from distinct_sketch import PenetrationSketches
+from olap_cube import build_fact
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# SQL数据集存储目录（可通过环境变量覆盖）
+SQL_STORE_DIR = os.environ.get(
+    "SALES_DASHBOARD_SQL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".sql_store")
+)
+
+# SQL后端每次最多载入内存的明细行数（散点图、客户细分、产品组合和原始数据使用），超过时均匀抽样；
+# 汇总查询和导出不受限制
+SQL_DETAIL_MAX_ROWS = int(os.environ.get("SALES_DASHBOARD_SQL_DETAIL_ROWS", "1000000"))
+# 导出时每次从数据库读取的行数
+SQL_EXPORT_CHUNK_ROWS = 50_000
+# 抽样时按 rowid 的乘法散列取余数，余数小于阈值的行入选（与行的顺序和分区无关）
+SAMPLE_MODULUS = 1_000_003
+SAMPLE_MULTIPLIER = 7_919
+
+# 可用的嵌入式数据库引擎（DuckDB为可选依赖）
+SQL_ENGINES = ['sqlite'] + (['duckdb'] if duckdb is not None else [])
+DATABASE_FILES = {'sqlite': 'sales.sqlite', 'duckdb': 'sales.duckdb'}
+
+# 发运月份缺失的行单独存为一个分区（与按月数据集一致）
+UNKNOWN_MONTH = '未知月份'
+
+ROWS_TABLE = 'sales_rows'
+FACT_TABLE = 'sales_fact'
+PARTITIONS_TABLE = 'partitions'
+SOURCES_TABLE = 'sources'
+PARTITION_COLUMN = '分区'
+DATE_COLUMNS = ['发运月份']
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'BIGINT'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'DOUBLE'
+    return 'TEXT'
+
+
+def _to_sql_frame(frame):
+    """转换为可写入数据库的列：日期转为ISO文本，分类和其他对象列转为文本，缺失值为None"""
+    columns = {}
+    for col in frame.columns:
+        values = frame[col]
+        missing = values.isna().to_numpy()
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # 分类列只对取值集合转换一次文本
+            converted = np.asarray(values.cat.categories.astype(str), dtype=object)[values.cat.codes.to_numpy()]
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            converted = values.dt.strftime('%Y-%m-%d %H:%M:%S').to_numpy(dtype=object, copy=True)
+        elif _sql_type(values.dtype) == 'TEXT':
+            converted = values.astype(str).to_numpy(dtype=object, copy=True)
+        else:
+            # 写时复制开启时to_numpy可能返回只读视图，缺失值需要写入副本
+            converted = values.to_numpy(dtype=object, copy=True)
+        converted[missing] = None
+        columns[col] = converted
+    return pd.DataFrame(columns, index=frame.index)
+
+
+class SqlStore:
+    """把按月数据集保存在嵌入式数据库（SQLite或DuckDB文件）中，与DatasetStore的导入接口相同
+
+    明细和预聚合事实表各一张表，按月分区；筛选和分组汇总都以SQL在数据库内完成，只把结果取回pandas。
+    """
+
+    def __init__(self, root=SQL_STORE_DIR, engine='sqlite'):
+        if engine not in SQL_ENGINES:
+            raise ValueError(f"不支持的数据库引擎: {engine}")
+        self.root = root
+        self.engine = engine
+        self.path = os.path.join(root, DATABASE_FILES[engine])
+        os.makedirs(root, exist_ok=True)
+        with self._connect() as con:
+            con.execute(f"CREATE TABLE IF NOT EXISTS {PARTITIONS_TABLE} ("
+                        "month TEXT PRIMARY KEY, source_hash TEXT, source_name TEXT, row_count BIGINT, ingested_at TEXT)")
+            # 每个导入过的文件涉及的月份
+            con.execute(f"CREATE TABLE IF NOT EXISTS {SOURCES_TABLE} ("
+                        "source_hash TEXT, month TEXT, PRIMARY KEY (source_hash, month))")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # 每次操作使用独立连接，缓存的对象可以在不同会话的线程中使用
+        if self.engine == 'duckdb':
+            con = duckdb.connect(self.path)
+        else:
+            con = sqlite3.connect(self.path)
+        try:
+            yield con
+            con.commit()
+        finally:
+            con.close()
+
+    def query(self, sql, params=()):
+        with self._connect() as con:
+            if self.engine == 'duckdb':
+                return con.execute(sql, list(params)).df()
+            return pd.read_sql_query(sql, con, params=list(params))
+
+    def scalar(self, sql, params=()):
+        with self._connect() as con:
+            row = con.execute(sql, list(params)).fetchone()
+        return row[0] if row else None
+
+    def _table_columns(self, con, table):
+        if self.engine == 'duckdb':
+            rows = con.execute("SELECT column_name FROM information_schema.columns WHERE table_name = ? "
+                               "ORDER BY ordinal_position", [table]).fetchall()
+            return [row[0] for row in rows]
+        return [row[1] for row in con.execute(f"PRAGMA table_info({table})").fetchall()]
+
+    def _column_types(self, con, table):
+        """列名 -> 表定义中的类型（大写）"""
+        if self.engine == 'duckdb':
+            rows = con.execute("SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ?",
+                               [table]).fetchall()
+        else:
+            rows = [(row[1], row[2]) for row in con.execute(f"PRAGMA table_info({table})").fetchall()]
+        return {name: str(sql_type).upper() for name, sql_type in rows}
+
+    def _insert(self, con, table, frame):
+        """写入一个分区的数据，表不存在时按第一次写入的列创建；之后缺少的列写入NULL，多出的列忽略"""
+        columns = self._table_columns(con, table)
+        if not columns:
+            definitions = ', '.join(f"{_quote(col)} {_sql_type(frame[col].dtype)}" for col in frame.columns)
+            con.execute(f"CREATE TABLE {table} ({definitions})")
+            con.execute(f"CREATE INDEX idx_{table}_partition ON {table} ({_quote(PARTITION_COLUMN)})")
+            columns = list(frame.columns)
+        frame = _to_sql_frame(frame.reindex(columns=columns))
+        if self.engine == 'duckdb':
+            con.register('incoming', frame)
+            con.execute(f"INSERT INTO {table} SELECT * FROM incoming")
+            con.unregister('incoming')
+        else:
+            placeholders = ', '.join('?' * len(columns))
+            con.executemany(f"INSERT INTO {table} VALUES ({placeholders})", frame.itertuples(index=False, name=None))
+
+    @property
+    def partitions(self):
+        frame = self.query(f"SELECT * FROM {PARTITIONS_TABLE} ORDER BY month")
+        return {
+            row.month: {
+                'source_hash': row.source_hash,
+                'source_name': row.source_name,
+                'rows': int(row.row_count),
+                'ingested_at': row.ingested_at,
+            }
+            for row in frame.itertuples(index=False)
+        }
+
+    @property
+    def version(self):
+        """数据集版本：由各分区及其来源文件决定，计算方式与DatasetStore一致"""
+        digest = hashlib.sha256()
+        partitions = self.partitions
+        for month in sorted(partitions):
+            digest.update(f"{month}:{partitions[month]['source_hash']};".encode())
+        return digest.hexdigest()
+
+    def months(self):
+        return sorted(self.partitions)
+
+    @property
+    def row_count(self):
+        return int(self.scalar(f"SELECT COALESCE(SUM(row_count), 0) FROM {PARTITIONS_TABLE}"))
+
+    def has_source(self, source_hash):
+        """文件是否已导入且其涉及的各月份分区仍来自该文件（规则与DatasetStore一致）"""
+        with self._connect() as con:
+            months, owned = con.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(CASE WHEN p.source_hash = s.source_hash THEN 1 ELSE 0 END), 0) "
+                f"FROM {SOURCES_TABLE} AS s LEFT JOIN {PARTITIONS_TABLE} AS p ON p.month = s.month "
+                f"WHERE s.source_hash = ?", [source_hash]).fetchone()
+            if months == 0:
+                # 旧版本导入的文件没有记录涉及的月份
+                owned = con.execute(f"SELECT COUNT(*) FROM {PARTITIONS_TABLE} WHERE source_hash = ?",
+                                    [source_hash]).fetchone()[0]
+                return bool(owned)
+        return owned == months
+
+    def ingest(self, df, source_hash, source_name):
+        """将一个预处理后的文件按月写入分区（替换已有的同月分区），返回涉及的月份"""
+        if not pd.api.types.is_datetime64_any_dtype(df['发运月份']):
+            raise ValueError("发运月份无法识别为日期，不能按月分区")
+
+        labels = df['发运月份'].dt.strftime('%Y-%m').fillna(UNKNOWN_MONTH)
+        months = []
+        with self._connect() as con:
+            for month in sorted(labels.unique()):
+                part = df[(labels == month).to_numpy()]
+                rows = part.assign(**{PARTITION_COLUMN: month})
+                fact = build_fact(part).assign(**{PARTITION_COLUMN: month})
+                for table in (ROWS_TABLE, FACT_TABLE):
+                    if self._table_columns(con, table):
+                        con.execute(f"DELETE FROM {table} WHERE {_quote(PARTITION_COLUMN)} = ?", [month])
+                self._insert(con, ROWS_TABLE, rows)
+                self._insert(con, FACT_TABLE, fact)
+                con.execute(f"DELETE FROM {PARTITIONS_TABLE} WHERE month = ?", [month])
+                con.execute(f"INSERT INTO {PARTITIONS_TABLE} VALUES (?, ?, ?, ?, ?)",
+                            [month, source_hash, source_name, len(part), time.strftime('%Y-%m-%d %H:%M:%S')])
+                months.append(month)
+            con.execute(f"DELETE FROM {SOURCES_TABLE} WHERE source_hash = ?", [source_hash])
+            con.executemany(f"INSERT INTO {SOURCES_TABLE} VALUES (?, ?)", [(source_hash, month) for month in months])
+            # 不再拥有任何分区的文件不再保留记录
+            con.execute(f"DELETE FROM {SOURCES_TABLE} WHERE source_hash NOT IN (SELECT source_hash FROM {PARTITIONS_TABLE})")
+        return months
+
+    def resolve(self, selections, on_empty=None):
+        """按与FilterEngine相同的顺序和回退规则确定生效的筛选条件（某个条件使结果为空时跳过该条件）"""
+        clauses = []
+        for col, selected in selections:
+            if not selected:
+                continue
+            candidate = clauses + [(col, tuple(map(str, selected)))]
+            where, params = where_clause(candidate)
+            if self.scalar(f"SELECT EXISTS (SELECT 1 FROM {FACT_TABLE} {where})", params):
+                clauses = candidate
+            elif on_empty is not None:
+                on_empty()
+        return clauses
+
+    def load_frame(self, clauses=(), limit=None):
+        """读取明细数据（按月份和导入顺序），筛选条件在数据库中执行
+
+        匹配的行数超过limit时在所有分区中均匀抽样（确定性的，同样的数据和条件得到同样的样本），
+        结果的attrs中记录匹配的总行数（population_rows）和是否抽样（sampled）。
+        """
+        where, params = where_clause(clauses)
+        population = self.count_rows(clauses)
+        sampled = limit is not None and population > limit
+        if sampled:
+            threshold = -(-SAMPLE_MODULUS * int(limit) // population)
+            sample = f"(rowid * {SAMPLE_MULTIPLIER}) % {SAMPLE_MODULUS} < {threshold}"
+            where = (where + ' AND ' if where else 'WHERE ') + sample
+        order = f"ORDER BY {_quote(PARTITION_COLUMN)}, rowid"
+        limit_sql = f" LIMIT {int(limit)}" if sampled else ''
+        frame = self.query(f"SELECT * FROM {ROWS_TABLE} {where} {order}{limit_sql}", params)
+        frame = restore_dtypes(frame.drop(columns=PARTITION_COLUMN))
+        frame.attrs['population_rows'] = population
+        frame.attrs['sampled'] = sampled
+        return frame
+
+    def iter_frames(self, clauses=(), chunk_rows=SQL_EXPORT_CHUNK_ROWS):
+        """逐块读取全部匹配的明细（导出使用，不受 SQL_DETAIL_MAX_ROWS 限制），没有匹配的行时返回一个空块
+
+        列类型按表定义转换（整数列为可空整数，日期列为日期），各块的列类型一致。
+        """
+        where, params = where_clause(clauses)
+        with self._connect() as con:
+            types = self._column_types(con, ROWS_TABLE)
+        sql = f"SELECT * FROM {ROWS_TABLE} {where} ORDER BY {_quote(PARTITION_COLUMN)}, rowid"
+        for rows, columns in self._iter_rows(sql, params, chunk_rows):
+            yield _typed_frame(rows, columns, types)
+
+    def iter_query(self, sql, params=(), chunk_rows=SQL_EXPORT_CHUNK_ROWS):
+        """逐块取回查询结果（不转换列类型），没有结果时返回一个空块"""
+        for rows, columns in self._iter_rows(sql, params, chunk_rows):
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+    def _iter_rows(self, sql, params, chunk_rows):
+        with self._connect() as con:
+            cursor = con.execute(sql, list(params))
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchmany(chunk_rows)
+            yield rows, columns
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    return
+                yield rows, columns
+
+    def detail_columns(self):
+        """明细表的列（不含分区列）"""
+        with self._connect() as con:
+            return [col for col in self._table_columns(con, ROWS_TABLE) if col != PARTITION_COLUMN]
+
+    def count_rows(self, clauses=()):
+        where, params = where_clause(clauses)
+        return int(self.scalar(f"SELECT COUNT(*) FROM {ROWS_TABLE} {where}", params))
+
+    def dimension_values(self, col):
+        """维度列的全部取值（转为文本后排序，缺失值记为'nan'，与在明细上 astype(str) 的结果一致）"""
+        values = self.query(f"SELECT DISTINCT {_quote(col)} AS value FROM {FACT_TABLE}")['value']
+        return sorted('nan' if pd.isna(value) else str(value) for value in values)
+
+    def product_dimension(self):
+        """产品维度表：每个产品代码取首次出现的行，结果与在完整明细上调用product_dimension一致"""
+        with self._connect() as con:
+            stored = self._table_columns(con, ROWS_TABLE)
+        # 产品属性列随明细一起保存（较早导入的数据没有时由产品名称重新提取）
+        columns = ', '.join(['产品代码', '产品名称', '简化产品名称'] +
+                            [_quote(col) for col in PRODUCT_ATTRIBUTE_COLUMNS if col in stored])
+        first_rows = self.query(
+            f"SELECT {columns} FROM ("
+            f"SELECT {columns}, ROW_NUMBER() OVER ("
+            f"PARTITION BY 产品代码 ORDER BY {_quote(PARTITION_COLUMN)}, rowid) AS position FROM {ROWS_TABLE}"
+            f") AS ranked WHERE position = 1"
+        )
+        return product_dimension(first_rows)
+
+    def cube(self):
+        return SqlCube(self)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def where_clause(clauses):
+    """(列, 取值) 条件列表 -> WHERE子句和参数"""
+    if not clauses:
+        return '', []
+    parts, params = [], []
+    for col, selected in clauses:
+        selected = list(selected)
+        if not selected:
+            parts.append('1 = 0')
+            continue
+        parts.append(f"{_quote(col)} IN ({', '.join('?' * len(selected))})")
+        params.extend(selected)
+    return 'WHERE ' + ' AND '.join(parts), params
+
+
+def _typed_frame(rows, columns, types):
+    """数据库游标取回的行 -> 按表定义的类型转换后的数据块（去掉分区列）"""
+    frame = pd.DataFrame.from_records(rows, columns=columns).drop(columns=PARTITION_COLUMN)
+    for col in frame.columns:
+        sql_type = types.get(col, 'TEXT')
+        if col in DATE_COLUMNS:
+            frame[col] = pd.to_datetime(frame[col])
+        elif sql_type == 'BIGINT':
+            frame[col] = frame[col].astype('Int64')
+        elif sql_type == 'DOUBLE':
+            frame[col] = frame[col].astype(np.float64)
+        else:
+            frame[col] = frame[col].astype(object)
+    return frame
+
+
+def restore_dtypes(frame):
+    """恢复从数据库读出的列类型：日期列转为日期，维度列和产品属性列转为分类类型"""
+    for col in DATE_COLUMNS:
+        if col in frame.columns:
+            frame[col] = pd.to_datetime(frame[col])
+    for col in PRODUCT_ATTRIBUTE_COLUMNS:
+        if col in frame.columns:
+            frame[col] = frame[col].astype('category')
+    return compact_dtypes(frame)
+
+
+class SqlCube:
+    """与SalesCube接口相同的查询入口，汇总在数据库的事实表上执行"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def penetration_sketches(self, new_products, col='客户简称', chunk_rows=SQL_EXPORT_CHUNK_ROWS):
+        """区域×月份×是否新品的去重计数草图：先在数据库中按 (单元, 客户) 去重，再逐块构建，不把事实表载入内存"""
+        placeholders = ', '.join('?' for _ in new_products)
+        is_new = f"CASE WHEN 产品代码 IN ({placeholders}) THEN 1 ELSE 0 END" if new_products else '0'
+        sql = (f"SELECT DISTINCT 所属区域, 发运月份, {is_new} AS 新品, {_quote(col)} "
+               f"FROM {FACT_TABLE}")
+        chunks = self.store.iter_query(sql, list(new_products), chunk_rows)
+        return PenetrationSketches.from_chunks(chunks, new_products, col)
+
+    def filter(self, selections):
+        """按与原始数据相同的顺序和回退规则筛选（某个条件使结果为空时跳过该条件）"""
+        return SqlCubeView(self.store, self.store.resolve(selections))
+
+    def view(self):
+        return SqlCubeView(self.store, [])
+
+
+class SqlCubeView:
+    """筛选后的事实表视图：与CubeView的查询相同，但每个查询都下推为一条SQL，只取回汇总结果"""
+
+    def __init__(self, store, clauses):
+        self.store = store
+        self.clauses = list(clauses)
+
+    def _where(self, *conditions):
+        """筛选条件加上额外的SQL条件（如某些列非空）"""
+        where, params = where_clause(self.clauses)
+        conditions = [condition for condition in conditions if condition]
+        if conditions:
+            where = (where + ' AND ' if where else 'WHERE ') + ' AND '.join(conditions)
+        return where, params
+
+    def _select(self, expressions, *conditions, group_by=()):
+        where, params = self._where(*conditions)
+        sql = f"SELECT {expressions} FROM {FACT_TABLE} {where}"
+        if group_by:
+            keys = ', '.join(_quote(key) for key in group_by)
+            sql += f" GROUP BY {keys} ORDER BY {keys}"
+        return sql, params
+
+    def __len__(self):
+        return int(self.store.scalar(*self._select('COUNT(*)')))
+
+    @property
+    def fact(self):
+        where, params = self._where()
+        frame = self.store.query(f"SELECT * FROM {FACT_TABLE} {where}", params)
+        return restore_dtypes(frame.drop(columns=PARTITION_COLUMN))
+
+    @property
+    def empty(self):
+        where, params = self._where()
+        return not self.store.scalar(f"SELECT EXISTS (SELECT 1 FROM {FACT_TABLE} {where})", params)
+
+    def restrict(self, col, selected):
+        """再按某一维度筛选（不做空结果回退）"""
+        return SqlCubeView(self.store, self.clauses + [(col, tuple(map(str, selected)))])
+
+    def total(self, measure='销售额'):
+        return self.store.scalar(*self._select(f"SUM({_quote(measure)})")) or 0
+
+    def nunique(self, col):
+        return int(self.store.scalar(*self._select(f"COUNT(DISTINCT {_quote(col)})")))
+
+    def mean_price(self):
+        """与原始行上的单价均值一致"""
+        price_sum = self.store.scalar(*self._select('SUM("单价合计")'))
+        count = self.store.scalar(*self._select('SUM("单价行数")')) or 0
+        return price_sum / count if count > 0 else float('nan')
+
+    def _aggregate_by(self, keys, expression, name):
+        """按keys分组（与groupby一致：跳过键为空的行，结果按键排序）"""
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        not_null = [f"{_quote(key)} IS NOT NULL" for key in keys]
+        columns = ', '.join(_quote(key) for key in keys)
+        return self.store.query(*self._select(f"{columns}, {expression} AS {_quote(name)}", *not_null, group_by=keys))
+
+    def sum_by(self, keys, measure='销售额'):
+        return self._aggregate_by(keys, f"SUM({_quote(measure)})", measure)
+
+    def nunique_by(self, keys, col='客户简称'):
+        return self._aggregate_by(keys, f"COUNT(DISTINCT {_quote(col)})", col)
+
+    def _monthly_counts(self, col):
+        """各月（YYYY-MM）的去重数量，补齐首末月份之间没有数据的月份"""
+        sql, params = self._select(f'substr("发运月份", 1, 7) AS "月份", COUNT(DISTINCT {_quote(col)}) AS "数量"',
+                                   '"发运月份" IS NOT NULL', group_by=['月份'])
+        counts = self.store.query(sql, params)
+        if counts.empty:
+            return pd.Series([], index=pd.PeriodIndex([], freq='M'), dtype=np.int64)
+        periods = pd.PeriodIndex(counts['月份'], freq='M')
+        months = pd.period_range(periods.min(), periods.max(), freq='M')
+        return pd.Series(counts['数量'].to_numpy(), index=periods).reindex(months, fill_value=0).astype(np.int64)
+
+    @staticmethod
+    def _month_frame(counts, col):
+        # 月份标签为月末日期，与 pd.Grouper(freq='M') 一致
+        months = counts.index.to_timestamp(how='end').normalize()
+        return pd.DataFrame({'发运月份': months, col: counts.to_numpy()})
+
+    def monthly_nunique(self, col='客户简称'):
+        """按月统计去重数量，与 CubeView.monthly_nunique 一致"""
+        return self._month_frame(self._monthly_counts(col), col)
+
+    def cumulative_monthly_nunique(self, col='客户简称'):
+        """截至每月的累计去重数量：每个取值只在首次出现的月份计数再累加，月份与 monthly_nunique 一致"""
+        months = self._monthly_counts(col).index
+        where, params = self._where('"发运月份" IS NOT NULL', f"{_quote(col)} IS NOT NULL")
+        first_seen = self.store.query(
+            f'SELECT "月份", COUNT(*) AS "数量" FROM ('
+            f'SELECT MIN(substr("发运月份", 1, 7)) AS "月份" FROM {FACT_TABLE} {where} GROUP BY {_quote(col)}'
+            f') AS first_seen GROUP BY "月份"', params)
+        new_counts = pd.Series(first_seen['数量'].to_numpy(), index=pd.PeriodIndex(first_seen['月份'], freq='M'))
+        counts = new_counts.reindex(months, fill_value=0).cumsum().astype(np.int64)
+        return self._month_frame(counts, col)
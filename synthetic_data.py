@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from data_prep import NEW_PRODUCTS
+
+# 与上传的Excel文件相同的列顺序
+RAW_COLUMNS = ['客户简称', '所属区域', '发运月份', '申请人', '产品代码', '产品名称', '订单类型', '单价（箱）', '数量（箱）']
+
+REGIONS = ['南', '东', '中', '西', '北']
+REGION_WEIGHTS = [0.32, 0.26, 0.18, 0.14, 0.10]
+CITIES = ['广州', '河南', '深圳', '成都', '武汉', '杭州', '北京', '上海', '西安', '长沙', '福州', '昆明']
+SHOP_SUFFIXES = ['佳成行', '甜丰號', '商贸', '食品', '百货', '副食']
+SURNAMES = ['梁', '胡', '王', '李', '张', '陈', '刘', '杨', '黄', '赵']
+GIVEN_NAMES = ['洪泽', '斌', '伟', '芳', '强', '磊', '静', '敏']
+FLAVORS = ['酸小虫', '可乐瓶', '比萨', '汉堡', '午餐袋', '扭扭虫', '字节软糖', '西瓜', '七彩熊', '水果条', '棉花糖', '橡皮糖']
+SPECS = ['250G分享装袋装', '45G盒装', '68G袋装', '108G袋装', '2KG迷你包', '1.5KG随手包']
+ORDER_TYPES = ['订单-正常产品', '订单-TT产品']
+
+
+def _zipf_weights(n, exponent):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _person_name(i):
+    name = f"{SURNAMES[i % len(SURNAMES)]}{GIVEN_NAMES[(i // len(SURNAMES)) % len(GIVEN_NAMES)]}"
+    # 姓名组合用完后追加序号保证唯一
+    rounds = i // (len(SURNAMES) * len(GIVEN_NAMES))
+    return f"{name}{rounds}" if rounds else name
+
+
+def _products(n_products):
+    """产品目录：普通产品的名称遵循 口力{口味}{规格}-中国 的格式，末尾附加新品"""
+    n_regular = max(n_products - len(NEW_PRODUCTS), 1)
+    codes = [f"F{1000 + i:04d}{'ABCDEFGHJKLMNP'[i % 14]}" for i in range(n_regular)]
+    names = [f"口力{FLAVORS[i % len(FLAVORS)]}{SPECS[(i // len(FLAVORS)) % len(SPECS)]}-中国" for i in range(n_regular)]
+    codes += NEW_PRODUCTS
+    names += [f"口力软糖新品{chr(ord('A') + i)}-中国" for i in range(len(NEW_PRODUCTS))]
+    return np.array(codes, dtype=object), np.array(names, dtype=object)
+
+
+def generate_sales_data(n_rows, n_customers=2000, n_products=300, n_months=12, start_month='2024-01',
+                        new_product_months=3, seed=0, categorical=False):
+    """生成与上传文件结构相同的合成销售数据
+
+    客户规模和产品销量服从长尾分布，区域规模不均，月份带季节波动；
+    新品只在最后 new_product_months 个月有销售。categorical=True 时字符串列直接生成为分类类型、
+    发运月份生成为日期类型（与流式读取的结果一致），用于千万行级别的测试以节省内存。
+    """
+    rng = np.random.default_rng(seed)
+    n_customers = max(int(n_customers), 1)
+    n_months = max(int(n_months), 1)
+
+    # 申请人按区域划分，每个客户归属一个区域和该区域的一个申请人
+    n_applicants = max(len(REGIONS), n_customers // 50)
+    applicant_names = np.array([_person_name(i) for i in range(n_applicants)], dtype=object)
+    applicant_region = np.arange(n_applicants) % len(REGIONS)
+    customer_region = rng.choice(len(REGIONS), n_customers, p=REGION_WEIGHTS)
+    customer_applicant = np.empty(n_customers, dtype=np.int64)
+    for region in range(len(REGIONS)):
+        members = np.flatnonzero(customer_region == region)
+        candidates = np.flatnonzero(applicant_region == region)
+        customer_applicant[members] = rng.choice(candidates, len(members))
+    customer_names = np.array([f"{CITIES[i % len(CITIES)]}{SHOP_SUFFIXES[(i // len(CITIES)) % len(SHOP_SUFFIXES)]}{i}"
+                               for i in range(n_customers)], dtype=object)
+
+    product_codes, product_names = _products(n_products)
+    n_regular = len(product_codes) - len(NEW_PRODUCTS)
+    base_prices = np.round(rng.uniform(80, 250, len(product_codes)), 2)
+
+    # 客户、产品按长尾分布抽样；月份带季节波动
+    customers = rng.choice(n_customers, n_rows, p=_zipf_weights(n_customers, 0.8))
+    month_weights = 1 + 0.3 * np.sin(np.arange(n_months) / 12 * 2 * np.pi)
+    month_idx = rng.choice(n_months, n_rows, p=month_weights / month_weights.sum())
+
+    popularity = _zipf_weights(len(product_codes), 0.9)
+    rng.shuffle(popularity)
+    regular_popularity = popularity[:n_regular] / popularity[:n_regular].sum()
+    products = rng.choice(n_regular, n_rows, p=regular_popularity)
+    # 新品上市后的月份中，部分订单改为购买新品
+    launched = month_idx >= n_months - new_product_months
+    switch = launched & (rng.random(n_rows) < 0.15)
+    products[switch] = n_regular + rng.integers(0, len(NEW_PRODUCTS), int(switch.sum()))
+
+    months = pd.period_range(start=start_month, periods=n_months, freq='M')
+    prices = base_prices[products] * np.where(rng.random(n_rows) < 0.1, 0.9, 1.0)
+    quantities = np.clip(np.round(rng.lognormal(2.5, 1.0, n_rows)), 1, 2000).astype(np.int64)
+    order_types = np.where(rng.random(n_rows) < 0.9, 0, 1)
+
+    def column(codes, values):
+        values = np.asarray(values, dtype=object)
+        if not categorical:
+            return values[codes]
+        value_codes, uniques = pd.factorize(values)
+        return pd.Categorical.from_codes(value_codes[codes], categories=uniques)
+
+    return pd.DataFrame({
+        '客户简称': column(customers, customer_names),
+        '所属区域': column(customer_region[customers], REGIONS),
+        '发运月份': months.to_timestamp().to_numpy()[month_idx] if categorical else column(month_idx, months.strftime('%Y-%m')),
+        '申请人': column(customer_applicant[customers], applicant_names),
+        '产品代码': column(products, product_codes),
+        '产品名称': column(products, product_names),
+        '订单类型': column(order_types, ORDER_TYPES),
+        '单价（箱）': np.round(prices, 2),
+        '数量（箱）': quantities,
+    }, columns=RAW_COLUMNS)